@@ -18,12 +18,26 @@ from sci_vizio_retrieval.config import (
     DB_PATH,
     CHROMA_PATH,
     VISION_MODEL,
+    VISION_MAX_CONCURRENCY,
+    VISION_BATCH_SIZE,
+    VISION_STREAM,
+    CASCADE_MODELS,
+    EXTRACT_WORKERS,
+    EMBEDDING_ENABLED,
+    FIGURES_ENABLED,
+    WATCH_POLL_INTERVAL,
     get_images_dir,
     get_analysis_dir,
+    get_vision_image,
 )
+from sci_vizio_retrieval.backfill import EmbeddingBackfill
+from sci_vizio_retrieval.cache import ResponseCache
+from sci_vizio_retrieval.cascade import ModelCascade, parse_models
 from sci_vizio_retrieval.extractor import PDFProcessor
 from sci_vizio_retrieval.processor import ImageProcessor, ImageProcessorRetry
 from sci_vizio_retrieval.indexer import ImageAnalysisIndexer
+from sci_vizio_retrieval.store import get_store
+from sci_vizio_retrieval.watcher import FolderWatcher
 from sci_vizio_retrieval.ui import launch_ui
 
 def setup_logging(verbose=False):
@@ -56,7 +70,9 @@ def cmd_run(args):
     extractor = PDFProcessor(
         input_dir=args.input_dir,
         output_dir=args.output_dir,
-        db_path=args.db_path
+        db_path=args.db_path,
+        workers=args.workers,
+        figures=args.figures
     )
     extract_stats = extractor.process_directory()
     logging.info(f"Extraction stats: {extract_stats}")
@@ -71,7 +87,12 @@ def cmd_run(args):
         model=args.model,
         images_dir=images_dir,
         output_dir=analysis_dir,
-        db_path=args.db_path
+        db_path=args.db_path,
+        concurrency=args.concurrency,
+        embeddings=args.embeddings,
+        batch_size=args.batch_size,
+        stream=args.stream,
+        cascade=parse_models(args.cascade)
     )
     proc_stats = processor.process_directory(pdf_names=pdf_names)
     logging.info(f"Processing stats: {proc_stats}")
@@ -93,7 +114,9 @@ def cmd_extract(args):
     extractor = PDFProcessor(
         input_dir=args.input_dir,
         output_dir=args.output_dir,
-        db_path=args.db_path
+        db_path=args.db_path,
+        workers=args.workers,
+        figures=args.figures
     )
     stats = extractor.process_directory()
     logging.info(f"Extraction summary: {stats}")
@@ -104,6 +127,12 @@ def cmd_process(args):
     images_dir = args.images_dir or get_images_dir(args.output_dir)
     analysis_dir = args.analysis_dir or get_analysis_dir(args.output_dir)
     
+    if args.prune_cache:
+        logging.info("Pruning vision response cache...")
+        cache_model = ModelCascade(parse_models(args.cascade), default_model=args.model).cache_model
+        ResponseCache(db_path=args.db_path).prune(cache_model, ImageProcessor.USER_PROMPT)
+        return
+
     if args.retry:
         logging.info("Running image processing retry stage...")
         processor = ImageProcessorRetry(
@@ -120,11 +149,38 @@ def cmd_process(args):
             model=args.model,
             images_dir=images_dir,
             output_dir=analysis_dir,
-            db_path=args.db_path
+            db_path=args.db_path,
+            concurrency=args.concurrency,
+            embeddings=args.embeddings,
+            batch_size=args.batch_size,
+            stream=args.stream,
+            cascade=parse_models(args.cascade)
         )
-        stats = processor.process_directory()
+        stats = processor.run_worker() if args.worker else processor.process_directory()
         logging.info(f"Processing summary: {stats}")
 
+def cmd_embed(args):
+    """Backfill missing or outdated image embeddings without calling the vision API."""
+    if args.benchmark:
+        from sci_vizio_retrieval.embedder import benchmark_backends
+        logging.info(f"Benchmarking embedding backends on up to {args.benchmark} images...")
+        rows = get_store(args.db_path).fetchall(
+            "SELECT DISTINCT image_path FROM image_processing ORDER BY id LIMIT ?", (args.benchmark,)
+        )
+        paths = [get_vision_image(path) for (path,) in rows if Path(path).exists()]
+        for backend, result in benchmark_backends(paths, db_path=args.db_path).items():
+            logging.info(f"{backend}: {result}")
+        return
+
+    backfill = EmbeddingBackfill(db_path=args.db_path, page_size=args.page_size)
+    if args.migrate_only:
+        logging.info("Migrating embedding BLOBs into the embedding matrix...")
+        stats = backfill.migrate()
+    else:
+        logging.info("Running embedding backfill stage...")
+        stats = backfill.run()
+    logging.info(f"Embedding summary: {stats}")
+
 def cmd_index(args):
     """Execute indexing stage only."""
     logging.info("Running ChromaDB indexing stage...")
@@ -135,6 +191,21 @@ def cmd_index(args):
     stats = indexer.process_all_analyses()
     logging.info(f"Indexing summary: {stats}")
 
+def cmd_watch(args):
+    """Watch the input directory and ingest new or changed PDFs as they appear."""
+    logging.info("Starting watch mode...")
+    watcher = FolderWatcher(
+        input_dir=args.input_dir,
+        output_dir=args.output_dir,
+        db_path=args.db_path,
+        chroma_path=args.chroma_path,
+        model=args.model,
+        workers=args.workers,
+        figures=args.figures,
+        poll_interval=args.poll_interval
+    )
+    watcher.run()
+
 def cmd_serve(args):
     """Start Gradio UI service."""
     logging.info("Starting Gradio search UI...")
@@ -162,12 +233,21 @@ def main():
     parser_run.add_argument("--input-dir", default=PDF_INPUT_DIR, help="Directory containing input PDFs")
     parser_run.add_argument("--model", default=VISION_MODEL, help="OpenRouter model slug")
     parser_run.add_argument("--chroma-path", default=CHROMA_PATH, help="Path to ChromaDB persistent storage")
+    parser_run.add_argument("--concurrency", type=int, default=VISION_MAX_CONCURRENCY, help="Maximum number of vision requests kept in flight")
+    parser_run.add_argument("--batch-size", type=int, default=VISION_BATCH_SIZE, help="Images of the same PDF sent in one vision request")
+    parser_run.add_argument("--stream", action=argparse.BooleanOptionalAction, default=VISION_STREAM, help="Stream vision responses and stop once the JSON is complete")
+    parser_run.add_argument("--cascade", default=CASCADE_MODELS, help="Comma-separated vision models to escalate through, cheapest first (empty: --model alone)")
+    parser_run.add_argument("--embeddings", action=argparse.BooleanOptionalAction, default=EMBEDDING_ENABLED, help="Compute ResNet50 image embeddings alongside the vision analysis")
+    parser_run.add_argument("--workers", type=int, default=EXTRACT_WORKERS, help="Number of PDF extraction worker processes")
+    parser_run.add_argument("--figures", action=argparse.BooleanOptionalAction, default=FIGURES_ENABLED, help="Render one image per captioned figure (vector and tiled figures)")
     add_common_pipeline_args(parser_run)
     parser_run.set_defaults(func=cmd_run)
     
     # Command: extract
     parser_extract = subparsers.add_parser("extract", help="Extract text and images from PDFs")
     parser_extract.add_argument("--input-dir", default=PDF_INPUT_DIR, help="Directory containing input PDFs")
+    parser_extract.add_argument("--workers", type=int, default=EXTRACT_WORKERS, help="Number of PDF extraction worker processes")
+    parser_extract.add_argument("--figures", action=argparse.BooleanOptionalAction, default=FIGURES_ENABLED, help="Render one image per captioned figure (vector and tiled figures)")
     add_common_pipeline_args(parser_extract)
     parser_extract.set_defaults(func=cmd_extract)
     
@@ -176,16 +256,42 @@ def main():
     parser_process.add_argument("--images-dir", help="Directory containing extracted images (defaults to config path)")
     parser_process.add_argument("--analysis-dir", help="Directory to save JSON analyses (defaults to config path)")
     parser_process.add_argument("--model", default=VISION_MODEL, help="OpenRouter model slug")
+    parser_process.add_argument("--concurrency", type=int, default=VISION_MAX_CONCURRENCY, help="Maximum number of vision requests kept in flight")
+    parser_process.add_argument("--batch-size", type=int, default=VISION_BATCH_SIZE, help="Images of the same PDF sent in one vision request")
+    parser_process.add_argument("--stream", action=argparse.BooleanOptionalAction, default=VISION_STREAM, help="Stream vision responses and stop once the JSON is complete")
+    parser_process.add_argument("--cascade", default=CASCADE_MODELS, help="Comma-separated vision models to escalate through, cheapest first (empty: --model alone)")
+    parser_process.add_argument("--embeddings", action=argparse.BooleanOptionalAction, default=EMBEDDING_ENABLED, help="Compute ResNet50 image embeddings alongside the vision analysis")
     parser_process.add_argument("--retry", action="store_true", help="Retry previously failed runs instead of new ones")
+    parser_process.add_argument("--worker", action="store_true", help="Take images from the shared job queue, so several workers can run side by side")
+    parser_process.add_argument("--prune-cache", action="store_true", help="Drop cached vision responses of other models or prompt templates and exit")
     add_common_pipeline_args(parser_process)
     parser_process.set_defaults(func=cmd_process)
     
+    # Command: embed
+    parser_embed = subparsers.add_parser("embed", help="Backfill missing or outdated image embeddings (no vision API calls)")
+    parser_embed.add_argument("--page-size", type=int, help="Rows embedded and written per transaction")
+    parser_embed.add_argument("--migrate-only", action="store_true", help="Only move legacy embedding BLOBs into the embedding matrix")
+    parser_embed.add_argument("--benchmark", type=int, metavar="N", help="Compare embedding backends on N stored images instead of backfilling")
+    add_common_pipeline_args(parser_embed)
+    parser_embed.set_defaults(func=cmd_embed)
+    
     # Command: index
     parser_index = subparsers.add_parser("index", help="Index metadata and CLIP embeddings into ChromaDB")
     parser_index.add_argument("--chroma-path", default=CHROMA_PATH, help="Path to ChromaDB persistent storage")
     add_common_pipeline_args(parser_index)
     parser_index.set_defaults(func=cmd_index)
     
+    # Command: watch
+    parser_watch = subparsers.add_parser("watch", help="Watch the input directory and ingest new or changed PDFs incrementally")
+    parser_watch.add_argument("--input-dir", default=PDF_INPUT_DIR, help="Directory containing input PDFs")
+    parser_watch.add_argument("--model", default=VISION_MODEL, help="OpenRouter model slug")
+    parser_watch.add_argument("--chroma-path", default=CHROMA_PATH, help="Path to ChromaDB persistent storage")
+    parser_watch.add_argument("--workers", type=int, default=EXTRACT_WORKERS, help="Number of PDF extraction worker processes")
+    parser_watch.add_argument("--figures", action=argparse.BooleanOptionalAction, default=FIGURES_ENABLED, help="Render one image per captioned figure (vector and tiled figures)")
+    parser_watch.add_argument("--poll-interval", type=float, default=WATCH_POLL_INTERVAL, help="Seconds between directory scans")
+    add_common_pipeline_args(parser_watch)
+    parser_watch.set_defaults(func=cmd_watch)
+    
     # Command: serve
     parser_serve = subparsers.add_parser("serve", help="Start the Gradio web search interface")
     parser_serve.add_argument("--chroma-path", default=CHROMA_PATH, help="Path to ChromaDB persistent storage")
@@ -30,6 +30,7 @@ def main():
         print(f"Failed to process: {stats['failed_pdfs']}")
         print(f"Total images extracted: {stats['total_images']}")
         print(f"Total text files created: {stats['total_text_files']}")
+        print(f"Trivial images filtered: {sum(stats['filtered_images'].values())} {stats['filtered_images']}")
         
     except Exception as e:
         print(f"\nAn error occurred: {str(e)}")
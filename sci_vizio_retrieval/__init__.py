@@ -1,15 +1,30 @@
-from sci_vizio_retrieval.client import OpenRouterVision
+from sci_vizio_retrieval.backfill import EmbeddingBackfill
+from sci_vizio_retrieval.cache import ResponseCache
+from sci_vizio_retrieval.client import AsyncOpenRouterVision, OpenRouterVision
 from sci_vizio_retrieval.extractor import PDFProcessor
 from sci_vizio_retrieval.processor import ImageProcessor, ImageProcessorRetry
 from sci_vizio_retrieval.indexer import ImageAnalysisIndexer
+from sci_vizio_retrieval.ratelimit import RateLimiter, get_rate_limiter
+from sci_vizio_retrieval.store import StateStore, get_store
+from sci_vizio_retrieval.vectors import EmbeddingMatrix
+from sci_vizio_retrieval.watcher import FolderWatcher
 from sci_vizio_retrieval.ui import ChromaDBQuerier, launch_ui
 
 __all__ = [
     "OpenRouterVision",
+    "AsyncOpenRouterVision",
+    "ResponseCache",
+    "EmbeddingBackfill",
     "PDFProcessor",
     "ImageProcessor",
     "ImageProcessorRetry",
     "ImageAnalysisIndexer",
+    "RateLimiter",
+    "get_rate_limiter",
+    "StateStore",
+    "get_store",
+    "EmbeddingMatrix",
+    "FolderWatcher",
     "ChromaDBQuerier",
     "launch_ui",
 ]
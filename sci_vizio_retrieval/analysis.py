@@ -0,0 +1,185 @@
+import json
+import re
+from typing import Any, Dict, Optional, Tuple
+
+# Attributes every image analysis must have
+REQUIRED_FIELDS = ('image_type', 'title', 'description')
+
+# JSON schema of one image analysis, sent as `response_format` to models that support it
+ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "image_type": {"type": "string"},
+        "title": {"type": "string"},
+        "description": {"type": "string"},
+        "time_period": {"type": "string"},
+        "x-axis": {},
+        "y-axis": {},
+        "sources": {},
+        "sections": {},
+        "labels": {},
+        "ticks": {},
+        "key patterns": {},
+    },
+    "required": list(REQUIRED_FIELDS),
+}
+
+# JSON schema of a batched response: one analysis per image, keyed by its 1-based index
+BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "analyses": {
+            "type": "array",
+            "items": {
+                **ANALYSIS_SCHEMA,
+                "properties": {"image_index": {"type": "integer"}, **ANALYSIS_SCHEMA["properties"]},
+                "required": ["image_index", *REQUIRED_FIELDS],
+            },
+        },
+    },
+    "required": ["analyses"],
+}
+
+_FENCE = re.compile(r"```[A-Za-z]*")
+_STRING = r'"(?:[^"\\]|\\.)*"'
+# An object key (or key and colon) left dangling by a truncated response
+_DANGLING_KEY = re.compile(r'([{,])\s*' + _STRING + r'\s*:?\s*$')
+
+
+def repair_json(text: str) -> str:
+    """
+    Repair the usual defects of model-written JSON without another request:
+    code fences, prose before or after the value, trailing commas and a
+    response truncated mid-value (open strings and brackets are closed).
+
+    The result is not guaranteed to parse; callers still run json.loads.
+    """
+    text = _FENCE.sub("", text)
+    starts = [i for i in (text.find('{'), text.find('[')) if i >= 0]
+    if not starts:
+        return text.strip()
+
+    out, stack = [], []
+    in_string = escape = False
+    for ch in text[min(starts):]:
+        if in_string:
+            out.append(ch)
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in '{[':
+            stack.append('}' if ch == '{' else ']')
+        elif ch in '}]':
+            if not stack:
+                break
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ',':
+                out.pop()
+            out.append(stack.pop())
+            if not stack:
+                break
+            continue
+        out.append(ch)
+
+    if not stack:
+        return "".join(out)
+
+    # Truncated: close the open string, drop a dangling key or comma, close the brackets
+    if in_string:
+        if escape:
+            out.pop()
+        out.append('"')
+    repaired = "".join(out).rstrip()
+    if stack[-1] == '}':
+        repaired = _DANGLING_KEY.sub(r"\1", repaired).rstrip()
+    repaired = repaired.rstrip(',:').rstrip()
+    return repaired + "".join(reversed(stack))
+
+
+def load_json(text: str) -> Tuple[Any, bool]:
+    """
+    Parse the JSON value in a model response, repairing it if needed.
+
+    Returns:
+        (value, repaired)
+
+    Raises:
+        ValueError: If the response cannot be parsed even after repair.
+    """
+    starts = [i for i in (text.find('{'), text.find('[')) if i >= 0]
+    if starts:
+        start = min(starts)
+        end = text.rfind('}' if text[start] == '{' else ']')
+        if end > start:
+            try:
+                return json.loads(text[start:end + 1]), False
+            except json.JSONDecodeError:
+                pass
+    try:
+        return json.loads(repair_json(text)), True
+    except json.JSONDecodeError as e:
+        raise ValueError(f"JSON parsing error: {str(e)}") from e
+
+
+def validate_analysis(analysis: Any) -> Optional[str]:
+    """Return why an analysis is unusable, or None if it is valid."""
+    if not isinstance(analysis, dict):
+        return "Response is not a JSON object"
+    missing = [field for field in REQUIRED_FIELDS if field not in analysis]
+    if missing:
+        return f"Missing required fields: {', '.join(missing)}"
+    return None
+
+
+def parse_analysis(text: Optional[str]) -> Tuple[Optional[Dict], Optional[str], bool]:
+    """
+    Parse and validate a single-image analysis.
+
+    Returns:
+        (analysis or None, error message or None, whether it was repaired)
+    """
+    if not text:
+        return None, "Empty response", False
+    try:
+        analysis, repaired = load_json(text)
+    except ValueError as e:
+        return None, str(e), False
+    error = validate_analysis(analysis)
+    return (None if error else analysis), error, repaired
+
+
+def parse_batch_response(text: str, count: int) -> Dict[int, Dict]:
+    """
+    Split a batched response into per-image analyses keyed by 0-based image index.
+
+    Both a bare array and an {"analyses": [...]} object are accepted.
+    Elements without a valid `image_index`, or that fail validation, are
+    dropped so their images can be sent again on their own.
+
+    Raises:
+        ValueError: If the response does not contain an array of analyses.
+    """
+    items, _ = load_json(text)
+    if isinstance(items, dict):
+        items = items.get('analyses')
+    if not isinstance(items, list):
+        raise ValueError("the response is not a JSON array of analyses")
+
+    analyses = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        try:
+            index = int(item.pop('image_index')) - 1
+        except (KeyError, TypeError, ValueError):
+            continue
+        if 0 <= index < count and index not in analyses and validate_analysis(item) is None:
+            analyses[index] = item
+    return analyses
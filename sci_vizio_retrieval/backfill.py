@@ -0,0 +1,125 @@
+import logging
+import time
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
+from tqdm import tqdm
+
+from sci_vizio_retrieval.config import DB_PATH, EMBEDDING_BATCH_SIZE, get_vision_image
+from sci_vizio_retrieval.store import get_store
+from sci_vizio_retrieval.vectors import EmbeddingMatrix
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingBackfill:
+    """
+    Fill in image embeddings that are missing or come from another model,
+    without touching the vision API.
+
+    Legacy embeddings stored as BLOBs in `image_processing` are first moved
+    into the embedding matrix. Rows with no vector in the matrix, or one
+    from another model, are then streamed in pages, embedded in large
+    batches and appended to the matrix one page at a time.
+
+    Args:
+        db_path: Path to SQLite database. If None, resolves from config.ini/DB_PATH.
+        page_size: Rows read, embedded and written per page. If None, eight embedding batches.
+        embedder: Embedder to use. If None, an ImageEmbedder is built on first use.
+    """
+
+    def __init__(self, db_path: str = None, page_size: int = None, embedder=None):
+        self.db_path = db_path or DB_PATH
+        self.store = get_store(self.db_path)
+        self.page_size = max(1, page_size or EMBEDDING_BATCH_SIZE * 8)
+        self.matrix = EmbeddingMatrix(db_path=self.db_path)
+        self._embedder = embedder
+        self.store.add_column('image_processing', 'embedding_model', 'TEXT')
+
+    @property
+    def embedder(self):
+        if self._embedder is None:
+            from sci_vizio_retrieval.embedder import ImageEmbedder
+            self._embedder = ImageEmbedder(db_path=self.db_path)
+        return self._embedder
+
+    @property
+    def model_version(self) -> str:
+        if self._embedder is not None:
+            return self._embedder.model_version
+        from sci_vizio_retrieval.embedder import ImageEmbedder
+        return ImageEmbedder.version_for()
+
+    _PENDING = '''
+        FROM image_processing p
+        LEFT JOIN embedding_matrix m ON m.id = p.id
+        WHERE (m.id IS NULL OR m.model != ?)
+    '''
+
+    def count_pending(self) -> int:
+        return self.store.fetchone(f"SELECT COUNT(*) {self._PENDING}", (self.model_version,))[0]
+
+    def _pages(self):
+        """Yield pages of (id, image_path) rows, resuming after the last id seen."""
+        last_id = 0
+        while True:
+            rows = self.store.fetchall(f'''
+                SELECT p.id, p.image_path {self._PENDING} AND p.id > ?
+                ORDER BY p.id
+                LIMIT ?
+            ''', (self.model_version, last_id, self.page_size))
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield rows
+
+    def migrate(self) -> Dict:
+        """Move legacy BLOB embeddings into the embedding matrix."""
+        return self.matrix.migrate_blobs(default_model=self.model_version, page_size=self.page_size)
+
+    def run(self) -> Dict:
+        """Migrate legacy BLOBs, embed every pending row and report throughput."""
+        stats = {
+            'migrated_blobs': self.migrate()['migrated'],
+            'total_rows': self.count_pending(),
+            'embedded': 0,
+            'missing_files': 0,
+            'failed': 0,
+            'elapsed_seconds': 0.0,
+            'images_per_second': 0.0
+        }
+        if stats['total_rows'] == 0:
+            logger.info("All embeddings are up to date.")
+            return stats
+
+        logger.info(f"Backfilling {stats['total_rows']} embeddings with {self.model_version}")
+        start = time.perf_counter()
+        with tqdm(total=stats['total_rows'], unit="img") as progress:
+            for rows in self._pages():
+                present = [(row_id, path) for row_id, path in rows if Path(path).exists()]
+                stats['missing_files'] += len(rows) - len(present)
+
+                vectors = self.embedder.embed_many([get_vision_image(path) for _, path in present])
+                ok = ~np.isnan(vectors).any(axis=1)
+                stats['failed'] += int((~ok).sum())
+                with self.store.transaction():
+                    self.matrix.append(
+                        [row_id for (row_id, _), good in zip(present, ok) if good],
+                        vectors[ok],
+                        self.model_version
+                    )
+                stats['embedded'] += int(ok.sum())
+
+                progress.update(len(rows))
+                elapsed = time.perf_counter() - start
+                progress.set_postfix(img_per_s=f"{stats['embedded'] / elapsed:.1f}")
+
+        stats['elapsed_seconds'] = round(time.perf_counter() - start, 2)
+        if stats['elapsed_seconds'] > 0:
+            stats['images_per_second'] = round(stats['embedded'] / stats['elapsed_seconds'], 2)
+        logger.info(
+            f"Embedded {stats['embedded']} images in {stats['elapsed_seconds']}s "
+            f"({stats['images_per_second']} img/s)"
+        )
+        return stats
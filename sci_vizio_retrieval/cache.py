@@ -0,0 +1,125 @@
+import hashlib
+import logging
+import time
+from pathlib import Path
+from typing import Optional, Tuple
+
+from sci_vizio_retrieval.config import DB_PATH, VISION_CACHE_ENABLED, VISION_CACHE_TTL_DAYS
+from sci_vizio_retrieval.store import get_store
+
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[str, str, str]
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def file_hash(path: str | Path) -> str:
+    """SHA-256 of a file's bytes."""
+    sha256_hash = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha256_hash.update(chunk)
+    return sha256_hash.hexdigest()
+
+
+class ResponseCache:
+    """
+    Vision response cache keyed on (image content hash, model, prompt hash).
+
+    Because the key only depends on what is sent to the model, a hit is
+    served whatever the image path, PDF name or output directory: the same
+    figure in two versions of a paper, a duplicate download or a re-extraction
+    is analysed once.
+
+    Entries that have not been used for `ttl_days` are evicted (0 keeps them
+    forever); prune() also drops entries of retired models or prompt templates.
+
+    Args:
+        db_path: Path to SQLite database. If None, resolves from config.ini/DB_PATH.
+        enabled: Serve and record cached responses. If None, resolves from config.ini/VISION_CACHE_ENABLED.
+        ttl_days: Days an unused entry is kept. If None, resolves from config.ini/VISION_CACHE_TTL_DAYS.
+    """
+
+    def __init__(self, db_path: str = None, enabled: bool = None, ttl_days: float = None):
+        self.db_path = db_path or DB_PATH
+        self.enabled = enabled if enabled is not None else VISION_CACHE_ENABLED
+        self.ttl_days = ttl_days if ttl_days is not None else VISION_CACHE_TTL_DAYS
+        self.store = get_store(self.db_path)
+        self.store.init_schema('''
+            CREATE TABLE IF NOT EXISTS vision_cache (
+                content_hash TEXT,
+                model TEXT,
+                prompt_hash TEXT,
+                template_hash TEXT,
+                response TEXT,
+                created REAL,
+                last_used REAL,
+                PRIMARY KEY (content_hash, model, prompt_hash)
+            )
+        ''')
+
+    @staticmethod
+    def make_key(image_path: str | Path, model: str, prompt: str) -> CacheKey:
+        return (file_hash(image_path), model, text_hash(prompt))
+
+    def get(self, key: CacheKey) -> Optional[str]:
+        """Return the cached response for a key, refreshing its last use."""
+        if not self.enabled:
+            return None
+        row = self.store.fetchone('''
+            SELECT response FROM vision_cache
+            WHERE content_hash = ? AND model = ? AND prompt_hash = ?
+        ''', key)
+        if row is None:
+            return None
+        self.store.write('''
+            UPDATE vision_cache SET last_used = ?
+            WHERE content_hash = ? AND model = ? AND prompt_hash = ?
+        ''', (time.time(), *key))
+        return row[0]
+
+    def put(self, key: CacheKey, response: str, template: str):
+        """
+        Record a successful response.
+
+        Args:
+            key: Key from make_key().
+            response: Model output.
+            template: Prompt template the prompt was built from, used by prune().
+        """
+        if not self.enabled:
+            return
+        now = time.time()
+        self.store.write('''
+            INSERT OR REPLACE INTO vision_cache
+            (content_hash, model, prompt_hash, template_hash, response, created, last_used)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (*key, text_hash(template), response, now, now))
+
+    def evict_expired(self) -> int:
+        """Delete entries unused for longer than the TTL. Returns the number removed."""
+        if self.ttl_days <= 0:
+            return 0
+        cutoff = time.time() - self.ttl_days * 86400
+        with self.store.transaction() as conn:
+            removed = conn.execute("DELETE FROM vision_cache WHERE last_used < ?", (cutoff,)).rowcount
+        if removed:
+            logger.info(f"Evicted {removed} expired vision cache entries")
+        return removed
+
+    def prune(self, model: str, template: str) -> int:
+        """
+        Delete entries from any model or prompt template other than the given
+        ones, and those past the TTL. Returns the number removed.
+        """
+        with self.store.transaction() as conn:
+            removed = conn.execute(
+                "DELETE FROM vision_cache WHERE model != ? OR template_hash != ?",
+                (model, text_hash(template))
+            ).rowcount
+        logger.info(f"Pruned {removed} vision cache entries of retired models or prompts")
+        return removed + self.evict_expired()
+
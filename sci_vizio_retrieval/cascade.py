@@ -0,0 +1,181 @@
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from PIL import Image, ImageFilter
+
+from sci_vizio_retrieval.analysis import REQUIRED_FIELDS, parse_analysis
+from sci_vizio_retrieval.client import VisionResponse, model_pricing
+from sci_vizio_retrieval.config import (
+    CASCADE_MAX_EDGE_DENSITY,
+    CASCADE_MAX_PIXELS,
+    CASCADE_MODELS,
+    VISION_MODEL,
+)
+
+logger = logging.getLogger(__name__)
+
+# Side of the grayscale thumbnail the edge density is measured on
+EDGE_THUMBNAIL_SIZE = 512
+# FIND_EDGES response (0-255) from which a pixel counts as lying on an edge
+EDGE_THRESHOLD = 64
+
+
+def parse_models(value: str | Sequence[str] | None) -> List[str]:
+    """Split a comma-separated model list, dropping blanks."""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.split(",")
+    return [model.strip() for model in value if model and model.strip()]
+
+
+def image_complexity(image_path: str | Path) -> Tuple[int, float]:
+    """
+    Pixel count and edge density of an image.
+
+    Edge density is the share of pixels of a grayscale thumbnail that lie
+    on a strong edge. Text, dense labels and fine linework score high; flat
+    bar charts and photos with smooth regions score low.
+
+    It stands in for OCR text density: running OCR on every image would
+    need an OCR engine and cost more than the first model's call it is
+    meant to save, while edges are one filter pass over a thumbnail.
+    """
+    with Image.open(image_path) as image:
+        pixels = image.width * image.height
+        image.draft('L', (EDGE_THUMBNAIL_SIZE, EDGE_THUMBNAIL_SIZE))
+        gray = image.convert('L')
+    gray.thumbnail((EDGE_THUMBNAIL_SIZE, EDGE_THUMBNAIL_SIZE))
+    histogram = gray.filter(ImageFilter.FIND_EDGES).histogram()
+    total = sum(histogram)
+    return pixels, (sum(histogram[EDGE_THRESHOLD:]) / total if total else 0.0)
+
+
+def empty_fields(analysis: Dict) -> List[str]:
+    """Required fields that are present but blank."""
+    return [
+        field for field in REQUIRED_FIELDS
+        if analysis.get(field) is None or (isinstance(analysis.get(field), str) and not analysis[field].strip())
+    ]
+
+
+class ModelCascade:
+    """
+    Vision models ordered from cheapest to strongest, and the rules for
+    moving an image up from one to the next.
+
+    Every image is sent to the first model, unless it trips the complexity
+    heuristic (more than `max_pixels` pixels, or an edge density above
+    `max_edge_density`), in which case it starts at the second. An answer
+    that cannot be parsed and validated, or that leaves a required field
+    empty, is escalated to the next model; the last model's answer is final.
+
+    Requests, outcomes, latency and token usage are tallied per model for
+    report(), which prices the usage from OpenRouter's model list.
+
+    Args:
+        models: Model slugs, cheapest first. If None, resolves from config.ini/CASCADE_MODELS.
+        default_model: Single model used when the list is empty. If None, resolves from config.ini/VISION_MODEL.
+        max_pixels: Pixel count above which an image skips the first model. If None, resolves from config.ini/CASCADE_MAX_PIXELS.
+        max_edge_density: Edge density above which an image skips the first model.
+            If None, resolves from config.ini/CASCADE_MAX_EDGE_DENSITY.
+    """
+
+    def __init__(self, models: Sequence[str] = None, default_model: str = None, max_pixels: int = None,
+                 max_edge_density: float = None):
+        models = parse_models(models if models is not None else CASCADE_MODELS)
+        self.models = models or [default_model or VISION_MODEL]
+        self.max_pixels = max_pixels if max_pixels is not None else CASCADE_MAX_PIXELS
+        self.max_edge_density = max_edge_density if max_edge_density is not None else CASCADE_MAX_EDGE_DENSITY
+        self._tallies: Dict[str, Dict] = {}
+
+    def __len__(self) -> int:
+        return len(self.models)
+
+    @property
+    def cache_model(self) -> str:
+        """Model name in response cache keys; a cascade's answers are cached under the whole cascade."""
+        return self.models[0] if len(self.models) == 1 else " > ".join(self.models)
+
+    def start_tier(self, image_path: str | Path) -> int:
+        """Index of the first model to ask about an image."""
+        if len(self.models) < 2:
+            return 0
+        reason = self.complexity_reason(image_path)
+        if reason is None:
+            return 0
+        logger.info(f"Sending {image_path} straight to {self.models[1]} ({reason})")
+        return 1
+
+    def complexity_reason(self, image_path: str | Path) -> Optional[str]:
+        """Why an image is too complex for the first model, or None."""
+        try:
+            pixels, density = image_complexity(image_path)
+        except Exception as e:
+            logger.warning(f"Could not measure the complexity of {image_path}: {str(e)}")
+            return None
+        if self.max_pixels > 0 and pixels > self.max_pixels:
+            return f"{pixels} pixels"
+        if self.max_edge_density > 0 and density > self.max_edge_density:
+            return f"edge density {density:.2f}"
+        return None
+
+    @staticmethod
+    def escalation_reason(text: Optional[str]) -> Optional[str]:
+        """Why an answer should go to the next model, or None if it is good enough."""
+        analysis, invalid, _ = parse_analysis(text)
+        if analysis is None:
+            return invalid
+        empty = empty_fields(analysis)
+        return f"Empty required fields: {', '.join(empty)}" if empty else None
+
+    def _tally(self, model: str) -> Dict:
+        return self._tallies.setdefault(model, {
+            'requests': 0, 'answered': 0, 'escalated': 0, 'failed': 0,
+            'latency': 0.0, 'timed': 0, 'prompt_tokens': 0, 'completion_tokens': 0
+        })
+
+    def record_request(self, model: str, response: VisionResponse):
+        """Count one completed request to `model`."""
+        tally = self._tally(model)
+        tally['requests'] += 1
+        if response.latency is not None:
+            tally['latency'] += response.latency
+            tally['timed'] += 1
+        tally['prompt_tokens'] += response.prompt_tokens or 0
+        tally['completion_tokens'] += response.completion_tokens or 0
+
+    def record_outcome(self, model: str, outcome: str):
+        """Count one image `answered` by, `escalated` from or `failed` at `model`."""
+        self._tally(model)[outcome] += 1
+
+    def reset(self):
+        self._tallies = {}
+
+    def report(self) -> Dict[str, Dict]:
+        """Per-model counts, mean latency, token usage and estimated cost (None if the price is unknown)."""
+        report = {}
+        for model in self.models:
+            tally = self._tallies.get(model)
+            if tally is None:
+                continue
+            pricing = model_pricing(model) if tally['requests'] else None
+            cost = None if tally['requests'] else 0.0
+            if pricing is not None:
+                cost = round(
+                    tally['prompt_tokens'] * pricing['prompt']
+                    + tally['completion_tokens'] * pricing['completion']
+                    + tally['requests'] * pricing['request'], 6
+                )
+            report[model] = {
+                'requests': tally['requests'],
+                'answered': tally['answered'],
+                'escalated': tally['escalated'],
+                'failed': tally['failed'],
+                'mean_latency_ms': round(tally['latency'] / tally['timed'] * 1000, 1) if tally['timed'] else None,
+                'prompt_tokens': tally['prompt_tokens'],
+                'completion_tokens': tally['completion_tokens'],
+                'cost_usd': cost
+            }
+        return report
@@ -1,71 +1,421 @@
+import asyncio
 import base64
+import hashlib
+import io
+import math
 import os
+import sqlite3
+import threading
 import time
 import logging
 from pathlib import Path
 from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+import httpx
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import APIStatusError, AsyncOpenAI, OpenAI
+from PIL import Image
 
 from sci_vizio_retrieval.config import (
     VISION_MODEL,
-    VISION_API_DELAY,
     VISION_MAX_RETRIES,
     VISION_MAX_TOKENS,
+    VISION_MAX_CONCURRENCY,
+    VISION_STREAM,
+    VISION_STRUCTURED_OUTPUT,
+    VISION_UPLOAD_MAX_PIXELS,
+    get_upload_cache_dir,
 )
+from sci_vizio_retrieval.ratelimit import RateLimiter, get_rate_limiter
 
 logger = logging.getLogger(__name__)
 
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+
+# Rough token cost of one image input, used to reserve budget before the call
+IMAGE_TOKEN_ESTIMATE = 1000
+
+# Words in a 400 error that blame the response schema rather than the request
+SCHEMA_ERROR_HINTS = ("response_format", "json_schema", "structured output", "structured_output")
+
+# Formats vision endpoints accept as-is, with their upload file extension
+UPLOAD_FORMATS = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp", "GIF": ".gif"}
+UPLOAD_MIME_TYPES = {".jpg": "image/jpeg", ".png": "image/png", ".webp": "image/webp", ".gif": "image/gif"}
+
 @dataclass
 class VisionResponse:
     """Minimal wrapper so callers can access .text consistently."""
     text: str
+    # Seconds from sending the request to the first streamed token (streaming only)
+    ttfb: Optional[float] = None
+    # Seconds from sending the request to the complete response
+    latency: Optional[float] = None
+    # Token usage reported by the provider (estimated when streamed)
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+
+class JsonStreamScanner:
+    """
+    Incremental brace-balanced scanner that finds where the first top-level
+    JSON object (or array) of a streamed text ends.
+
+    Brackets inside strings, including escaped quotes, are ignored. Text
+    before the opening bracket (a code fence, a stray sentence) is skipped.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escape = False
+        self.length = 0
+
+    def feed(self, text: str) -> Optional[int]:
+        """
+        Consume the next chunk of text.
+
+        Returns:
+            Length of the whole text fed so far up to and including the
+            closing bracket once the top-level value is complete, else None.
+        """
+        for i, ch in enumerate(text):
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif not self.started:
+                if ch in "{[":
+                    self.started = True
+                    self.depth = 1
+            elif ch == '"':
+                self.in_string = True
+            elif ch in "{[":
+                self.depth += 1
+            elif ch in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    end = self.length + i + 1
+                    self.length += len(text)
+                    return end
+        self.length += len(text)
+        return None
+
+def _get_api_key() -> str:
+    load_dotenv()
+    api_key = os.getenv("OPENROUTER_API_KEY")
+    if not api_key:
+        raise ValueError(
+            "OPENROUTER_API_KEY not found. "
+            "Set it in your .env file or as an environment variable."
+        )
+    return api_key
+
+def _encode_upload(image: Image.Image) -> Tuple[bytes, str]:
+    """Encode an image compactly: PNG for flat-colour or transparent art, JPEG for continuous tone."""
+    buffer = io.BytesIO()
+    has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+    if has_alpha or image.getcolors(256) is not None:
+        image.save(buffer, format="PNG", optimize=True)
+        return buffer.getvalue(), ".png"
+    image.convert("RGB").save(buffer, format="JPEG", quality=85, optimize=True)
+    return buffer.getvalue(), ".jpg"
+
+def prepare_upload(image_path: str | Path, max_pixels: int = None, cache_dir: str | Path = None) -> Tuple[str, bytes]:
+    """
+    Prepare an image for upload: detect its real format and, when it is
+    larger than `max_pixels` or in a format the API does not accept,
+    downscale and re-encode it.
+
+    Re-encoded payloads are cached on disk by content hash and target size,
+    so retries and re-runs with another model reuse them. Images sent as-is
+    are not copied into the cache.
+
+    Returns:
+        (mime_type, payload_bytes)
+    """
+    max_pixels = max_pixels if max_pixels is not None else VISION_UPLOAD_MAX_PIXELS
+    cache_dir = Path(cache_dir if cache_dir is not None else get_upload_cache_dir())
+
+    with open(image_path, "rb") as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+    cache_subdir = cache_dir / digest[:2]
+    cache_stem = f"{digest}_{max_pixels}"
+    for suffix, mime in UPLOAD_MIME_TYPES.items():
+        cached = cache_subdir / f"{cache_stem}{suffix}"
+        if cached.exists():
+            return mime, cached.read_bytes()
+
+    with Image.open(io.BytesIO(data)) as image:
+        source_suffix = UPLOAD_FORMATS.get(image.format)
+        pixels = image.width * image.height
+        if max_pixels > 0 and pixels > max_pixels:
+            scale = math.sqrt(max_pixels / pixels)
+            size = (max(1, int(image.width * scale)), max(1, int(image.height * scale)))
+            payload, suffix = _encode_upload(image.resize(size, Image.Resampling.LANCZOS))
+        elif source_suffix is not None:
+            return UPLOAD_MIME_TYPES[source_suffix], data
+        else:
+            # Formats such as TIFF, BMP or JPEG 2000 are not accepted upstream
+            image.load()
+            payload, suffix = _encode_upload(image)
+
+    cache_subdir.mkdir(parents=True, exist_ok=True)
+    target = cache_subdir / f"{cache_stem}{suffix}"
+    tmp = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(payload)
+    os.replace(tmp, target)
+    return UPLOAD_MIME_TYPES[suffix], payload
+
+def _image_part(image_path: str | Path, max_pixels: int = None, cache_dir: str | Path = None) -> dict:
+    mime, payload = prepare_upload(image_path, max_pixels, cache_dir)
+    image_b64 = base64.b64encode(payload).decode("utf-8")
+    return {
+        "type": "image_url",
+        "image_url": {
+            "url": f"data:{mime};base64,{image_b64}"
+        },
+    }
+
+def _build_messages(image_paths: Sequence[str | Path], prompt: str, max_pixels: int = None,
+                    cache_dir: str | Path = None) -> list:
+    """
+    Build the chat messages carrying the prompt and the prepared images.
+
+    With several images, each one is preceded by an "Image N:" label so the
+    model can refer to it by its 1-based index.
+    """
+    content = [{"type": "text", "text": prompt}]
+    if len(image_paths) == 1:
+        content.append(_image_part(image_paths[0], max_pixels, cache_dir))
+    else:
+        for index, image_path in enumerate(image_paths, 1):
+            content.append({"type": "text", "text": f"Image {index}:"})
+            content.append(_image_part(image_path, max_pixels, cache_dir))
+    return [{"role": "user", "content": content}]
+
+def _estimate_tokens(prompt: str, images: int = 1, max_tokens: int = None) -> int:
+    """Upper-bound token estimate for one request (prompt, images and full completion)."""
+    return len(prompt) // 4 + images * IMAGE_TOKEN_ESTIMATE + (max_tokens or VISION_MAX_TOKENS)
+
+# OpenRouter's model list (supported parameters, pricing), fetched once per process
+_model_catalog: Optional[Dict[str, dict]] = None
+_model_catalog_lock = threading.Lock()
+
+def model_info(model: str) -> Optional[dict]:
+    """OpenRouter's catalog entry for a model, or None if it is unknown or the catalog cannot be fetched."""
+    global _model_catalog
+    with _model_catalog_lock:
+        if _model_catalog is None:
+            try:
+                response = httpx.get(f"{OPENROUTER_BASE_URL}/models", timeout=10)
+                response.raise_for_status()
+                _model_catalog = {entry["id"]: entry for entry in response.json().get("data", [])}
+            except Exception as e:
+                logger.warning(f"Could not fetch the OpenRouter model list: {str(e)}")
+                _model_catalog = {}
+        return _model_catalog.get(model)
+
+def supports_structured_output(model: str) -> bool:
+    """Whether OpenRouter reports JSON-schema `response_format` support for a model."""
+    supported = (model_info(model) or {}).get("supported_parameters") or []
+    return "structured_outputs" in supported
+
+def model_pricing(model: str) -> Optional[Dict[str, float]]:
+    """USD per prompt token, per completion token and per request, as listed by OpenRouter."""
+    pricing = (model_info(model) or {}).get("pricing")
+    if not pricing:
+        return None
+    try:
+        return {key: float(pricing.get(key) or 0) for key in ("prompt", "completion", "request")}
+    except (TypeError, ValueError):
+        return None
+
+def _use_schema(mode: str, model: str) -> bool:
+    mode = str(mode).strip().lower()
+    if mode == "auto":
+        return supports_structured_output(model)
+    return mode in ("1", "true", "yes", "on")
+
+def _response_format(schema: dict) -> dict:
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": "image_analysis", "strict": False, "schema": schema},
+    }
+
+def _schema_options(client, schema: Optional[dict]) -> dict:
+    """Request options constraining the response to `schema`, if the client's model takes it."""
+    if schema is None:
+        return {}
+    if client._schema_supported is None:
+        client._schema_supported = _use_schema(client.structured_output, client.model)
+    return {"response_format": _response_format(schema)} if client._schema_supported else {}
+
+def _schema_rejected(error: Exception) -> bool:
+    """
+    Whether a request failed because the provider does not take the response
+    schema: a 400 whose error names it. Other 400s are ordinary failures.
+    """
+    if not isinstance(error, APIStatusError) or error.status_code != 400:
+        return False
+    details = f"{error.message} {error.body}".lower()
+    return any(hint in details for hint in SCHEMA_ERROR_HINTS)
+
+def _delta_text(chunk) -> Optional[str]:
+    return chunk.choices[0].delta.content if chunk.choices else None
+
+def _read_stream(stream, start: float) -> Tuple[str, Optional[float]]:
+    """
+    Read a streamed completion until its top-level JSON value is complete,
+    then close the stream so the model stops generating.
+
+    Returns:
+        (text, seconds to the first token)
+    """
+    scanner = JsonStreamScanner()
+    parts, ttfb = [], None
+    try:
+        for chunk in stream:
+            delta = _delta_text(chunk)
+            if not delta:
+                continue
+            if ttfb is None:
+                ttfb = time.perf_counter() - start
+            parts.append(delta)
+            end = scanner.feed(delta)
+            if end is not None:
+                return "".join(parts)[:end], ttfb
+    finally:
+        stream.close()
+    return "".join(parts), ttfb
+
+async def _read_stream_async(stream, start: float) -> Tuple[str, Optional[float]]:
+    """Async variant of _read_stream."""
+    scanner = JsonStreamScanner()
+    parts, ttfb = [], None
+    try:
+        async for chunk in stream:
+            delta = _delta_text(chunk)
+            if not delta:
+                continue
+            if ttfb is None:
+                ttfb = time.perf_counter() - start
+            parts.append(delta)
+            end = scanner.feed(delta)
+            if end is not None:
+                return "".join(parts)[:end], ttfb
+    finally:
+        await stream.close()
+    return "".join(parts), ttfb
+
+def _streamed_tokens(estimate: int, max_tokens: int, text: str) -> Tuple[int, int]:
+    """
+    Rough (prompt, completion) token usage of a streamed request, whose
+    usage report is cut off by closing the stream early.
+    """
+    return estimate - max_tokens, len(text) // 4
+
+def _usage_tokens(response) -> Tuple[Optional[int], Optional[int]]:
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None)
+
+def _total_tokens(prompt_tokens: Optional[int], completion_tokens: Optional[int]) -> Optional[int]:
+    if prompt_tokens is None or completion_tokens is None:
+        return None
+    return prompt_tokens + completion_tokens
+
+def _record_request(limiter: RateLimiter, headers, estimate: int, tokens: Tuple[Optional[int], Optional[int]]):
+    """
+    Report a completed request to the limiter. The request is already paid
+    for, so a limiter failure is logged rather than treated as an API error.
+    """
+    try:
+        limiter.record_success(headers)
+        limiter.record_usage(estimate, _total_tokens(*tokens))
+    except sqlite3.Error as e:
+        logger.warning(f"Could not update the rate limiter: {str(e)}")
+
+def _retry_delay(limiter: RateLimiter, error: Exception, attempt: int) -> float:
+    """Seconds to wait before retrying after `error`; 429s are paced by the shared limiter."""
+    if isinstance(error, APIStatusError) and error.status_code == 429:
+        return limiter.record_rate_limited(error.response.headers)
+    return 2 ** (attempt + 1)
 
 class OpenRouterVision:
     """
     Vision LLM client that uses OpenRouter as a unified gateway.
 
+    Requests are paced by a RateLimiter shared with every other client on
+    the same database, including those in other threads and processes.
+
+    In streaming mode the completion is read incrementally and the stream
+    is closed as soon as the top-level JSON value is complete, so trailing
+    prose is neither waited for nor generated. Every response carries its
+    latency (and, when streamed, time to first token).
+
+    Callers may pass a JSON schema; it is sent as a `response_format`
+    constraint when the model supports it (or unconditionally when
+    `structured_output` is "true"), and dropped for the rest of the
+    client's life if the provider rejects it.
+
     Args:
         model: OpenRouter model identifier. If None, resolves from config.ini/VISION_MODEL.
-        api_delay: Seconds to wait between API calls. If None, resolves from config.ini/VISION_API_DELAY.
         max_retries: Number of retry attempts. If None, resolves from config.ini/VISION_MAX_RETRIES.
+        rate_limiter: Limiter pacing the requests. If None, uses the shared limiter for config.ini/DB_PATH.
+        upload_max_pixels: Pixel budget of uploaded images. If None, resolves from config.ini/VISION_UPLOAD_MAX_PIXELS.
+        upload_cache_dir: Directory caching prepared uploads. If None, resolves from config.ini.
+        stream: Stream responses and stop as soon as the JSON is complete. If None, resolves from config.ini/VISION_STREAM.
+        structured_output: "auto", "true" or "false": send the caller's JSON schema as `response_format`.
+            If None, resolves from config.ini/VISION_STRUCTURED_OUTPUT.
+        api_delay: Deprecated; seconds between requests, mapped to a limiter of
+            1 / api_delay requests per second when no rate_limiter is given.
     """
 
     def __init__(
         self,
         model: str = None,
-        api_delay: float = None,
         max_retries: int = None,
+        rate_limiter: RateLimiter = None,
+        upload_max_pixels: int = None,
+        upload_cache_dir: str = None,
+        stream: bool = None,
+        structured_output: str = None,
+        api_delay: float = None,
     ):
-        load_dotenv()
-        api_key = os.getenv("OPENROUTER_API_KEY")
-        if not api_key:
-            raise ValueError(
-                "OPENROUTER_API_KEY not found. "
-                "Set it in your .env file or as an environment variable."
-            )
-
         self.client = OpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=api_key,
+            base_url=OPENROUTER_BASE_URL,
+            api_key=_get_api_key(),
         )
         self.model = model if model is not None else VISION_MODEL
-        self.api_delay = api_delay if api_delay is not None else VISION_API_DELAY
         self.max_retries = max_retries if max_retries is not None else VISION_MAX_RETRIES
+        if api_delay is not None:
+            logger.warning(
+                "OpenRouterVision(api_delay=...) is deprecated; pass a RateLimiter "
+                "or set VISION_REQUESTS_PER_SECOND instead"
+            )
+            if rate_limiter is None:
+                rate_limiter = RateLimiter(
+                    requests_per_second=1.0 / api_delay if api_delay > 0 else 0.0, name="openrouter-api-delay"
+                )
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.upload_max_pixels = upload_max_pixels if upload_max_pixels is not None else VISION_UPLOAD_MAX_PIXELS
+        self.upload_cache_dir = Path(upload_cache_dir or get_upload_cache_dir())
+        self.stream = stream if stream is not None else VISION_STREAM
+        self.structured_output = structured_output if structured_output is not None else VISION_STRUCTURED_OUTPUT
+        # Resolved on the first request that carries a schema
+        self._schema_supported = None
 
-    @staticmethod
-    def _encode_image(image_path: str | Path) -> str:
-        """Read and base64-encode a local image file."""
-        with open(image_path, "rb") as f:
-            return base64.b64encode(f.read()).decode("utf-8")
-
-    def analyze_image(self, image_path: str | Path, prompt: str) -> VisionResponse:
+    def analyze_image(self, image_path: str | Path, prompt: str, schema: dict = None) -> VisionResponse:
         """
         Send an image to the vision model and return its text response.
 
         Args:
             image_path: Path to a local image file (jpg, png, etc.)
             prompt: Text prompt describing what analysis to perform.
+            schema: Optional JSON schema the response should follow.
 
         Returns:
             VisionResponse with a .text attribute containing the model output.
@@ -73,46 +423,190 @@ class OpenRouterVision:
         Raises:
             Exception: After all retries are exhausted.
         """
-        image_b64 = self._encode_image(image_path)
-
-        messages = [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": prompt},
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{image_b64}"
-                        },
-                    },
-                ],
-            }
-        ]
+        return self.analyze_images([image_path], prompt, schema)
+
+    def analyze_images(self, image_paths: List[str | Path], prompt: str, schema: dict = None) -> VisionResponse:
+        """
+        Send several images in one request and return the text response.
+
+        The completion budget is VISION_MAX_TOKENS per image.
+
+        Raises:
+            Exception: After all retries are exhausted.
+        """
+        messages = _build_messages(image_paths, prompt, self.upload_max_pixels, self.upload_cache_dir)
+        max_tokens = VISION_MAX_TOKENS * len(image_paths)
+        estimate = _estimate_tokens(prompt, len(image_paths), max_tokens)
+        options = _schema_options(self, schema)
 
         last_exception = None
         for attempt in range(self.max_retries):
-            if self.api_delay > 0:
-                time.sleep(self.api_delay)
+            self.rate_limiter.acquire(estimate)
 
             try:
-                response = self.client.chat.completions.create(
+                start = time.perf_counter()
+                raw = self.client.chat.completions.with_raw_response.create(
                     model=self.model,
                     messages=messages,
-                    max_tokens=VISION_MAX_TOKENS,
+                    max_tokens=max_tokens,
                     temperature=0.7,
+                    stream=self.stream,
+                    **options,
                 )
-                content = response.choices[0].message.content
-                return VisionResponse(text=content)
+                if self.stream:
+                    content, ttfb = _read_stream(raw.parse(), start)
+                    tokens = _streamed_tokens(estimate, max_tokens, content)
+                else:
+                    response = raw.parse()
+                    content, ttfb = response.choices[0].message.content, None
+                    tokens = _usage_tokens(response)
+                latency = time.perf_counter() - start
 
             except Exception as e:
                 last_exception = e
+                if options and _schema_rejected(e):
+                    logger.warning(f"{self.model} rejected the response schema; continuing without it")
+                    self._schema_supported = False
+                    options = {}
                 if attempt < self.max_retries - 1:
-                    delay = 2 ** (attempt + 1)
+                    delay = _retry_delay(self.rate_limiter, e, attempt)
                     logger.warning(
                         f"Attempt {attempt + 1} failed: {e}. "
-                        f"Retrying in {delay}s..."
+                        f"Retrying in {delay:.1f}s..."
                     )
                     time.sleep(delay)
 
+            else:
+                _record_request(self.rate_limiter, raw.headers, estimate, tokens)
+                return VisionResponse(text=content, ttfb=ttfb, latency=latency,
+                                      prompt_tokens=tokens[0], completion_tokens=tokens[1])
+
+        raise last_exception
+
+
+class AsyncOpenRouterVision:
+    """
+    Asynchronous variant of OpenRouterVision that keeps up to
+    `max_concurrency` requests in flight at once.
+
+    Args:
+        model: OpenRouter model identifier. If None, resolves from config.ini/VISION_MODEL.
+        max_retries: Number of retry attempts. If None, resolves from config.ini/VISION_MAX_RETRIES.
+        max_concurrency: Maximum number of in-flight requests. If None, resolves from config.ini/VISION_MAX_CONCURRENCY.
+        rate_limiter: Limiter pacing the requests. If None, uses the shared limiter for config.ini/DB_PATH.
+        upload_max_pixels: Pixel budget of uploaded images. If None, resolves from config.ini/VISION_UPLOAD_MAX_PIXELS.
+        upload_cache_dir: Directory caching prepared uploads. If None, resolves from config.ini.
+        stream: Stream responses and stop as soon as the JSON is complete. If None, resolves from config.ini/VISION_STREAM.
+        structured_output: "auto", "true" or "false": send the caller's JSON schema as `response_format`.
+            If None, resolves from config.ini/VISION_STRUCTURED_OUTPUT.
+    """
+
+    def __init__(
+        self,
+        model: str = None,
+        max_retries: int = None,
+        max_concurrency: int = None,
+        rate_limiter: RateLimiter = None,
+        upload_max_pixels: int = None,
+        upload_cache_dir: str = None,
+        stream: bool = None,
+        structured_output: str = None,
+    ):
+        self.client = AsyncOpenAI(
+            base_url=OPENROUTER_BASE_URL,
+            api_key=_get_api_key(),
+        )
+        self.model = model if model is not None else VISION_MODEL
+        self.max_retries = max_retries if max_retries is not None else VISION_MAX_RETRIES
+        self.max_concurrency = max(1, max_concurrency if max_concurrency is not None else VISION_MAX_CONCURRENCY)
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.upload_max_pixels = upload_max_pixels if upload_max_pixels is not None else VISION_UPLOAD_MAX_PIXELS
+        self.upload_cache_dir = Path(upload_cache_dir or get_upload_cache_dir())
+        self.stream = stream if stream is not None else VISION_STREAM
+        self.structured_output = structured_output if structured_output is not None else VISION_STRUCTURED_OUTPUT
+        # Resolved on the first request that carries a schema
+        self._schema_supported = None
+        # Created lazily so the semaphore binds to the running event loop
+        self._semaphore = None
+
+    async def analyze_image(self, image_path: str | Path, prompt: str, schema: dict = None) -> VisionResponse:
+        """
+        Send an image to the vision model and return its text response.
+
+        Waits for a free slot when `max_concurrency` requests are already in flight.
+
+        Raises:
+            Exception: After all retries are exhausted.
+        """
+        return await self.analyze_images([image_path], prompt, schema)
+
+    async def analyze_images(self, image_paths: List[str | Path], prompt: str, schema: dict = None) -> VisionResponse:
+        """
+        Send several images in one request and return the text response.
+
+        Raises:
+            Exception: After all retries are exhausted.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        messages = await asyncio.to_thread(
+            _build_messages, image_paths, prompt, self.upload_max_pixels, self.upload_cache_dir
+        )
+        max_tokens = VISION_MAX_TOKENS * len(image_paths)
+        estimate = _estimate_tokens(prompt, len(image_paths), max_tokens)
+        # The support lookup may hit the network on first use
+        options = await asyncio.to_thread(_schema_options, self, schema)
+
+        last_exception = None
+        for attempt in range(self.max_retries):
+            # A slot is only held for the request itself, not for the backoff after a failure
+            async with self._semaphore:
+                # The limiter's database lock may block briefly, so reserve off the loop
+                wait = await asyncio.to_thread(self.rate_limiter.reserve, estimate)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+
+                try:
+                    start = time.perf_counter()
+                    raw = await self.client.chat.completions.with_raw_response.create(
+                        model=self.model,
+                        messages=messages,
+                        max_tokens=max_tokens,
+                        temperature=0.7,
+                        stream=self.stream,
+                        **options,
+                    )
+                    if self.stream:
+                        content, ttfb = await _read_stream_async(raw.parse(), start)
+                        tokens = _streamed_tokens(estimate, max_tokens, content)
+                    else:
+                        response = raw.parse()
+                        content, ttfb = response.choices[0].message.content, None
+                        tokens = _usage_tokens(response)
+                    latency = time.perf_counter() - start
+
+                except Exception as e:
+                    last_exception = e
+                    if options and _schema_rejected(e):
+                        logger.warning(f"{self.model} rejected the response schema; continuing without it")
+                        self._schema_supported = False
+                        options = {}
+
+                else:
+                    await asyncio.to_thread(_record_request, self.rate_limiter, raw.headers, estimate, tokens)
+                    return VisionResponse(text=content, ttfb=ttfb, latency=latency,
+                                          prompt_tokens=tokens[0], completion_tokens=tokens[1])
+
+            if attempt < self.max_retries - 1:
+                delay = await asyncio.to_thread(_retry_delay, self.rate_limiter, last_exception, attempt)
+                logger.warning(
+                    f"Attempt {attempt + 1} failed: {last_exception}. "
+                    f"Retrying in {delay:.1f}s..."
+                )
+                await asyncio.sleep(delay)
+
         raise last_exception
+
+    async def close(self):
+        await self.client.close()
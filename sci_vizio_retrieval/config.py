@@ -24,8 +24,13 @@ DEFAULT_CONFIG_CONTENT = """# Sci-Vizio-Retrieval Configuration
 #   anthropic/claude-sonnet-4        (high quality)
 model = qwen/qwen3.5-flash-02-23
 
-# Seconds to wait between API calls to avoid rate limits.
-api_delay = 2.0
+# Requests per second allowed towards the provider, shared by all threads
+# and worker processes using the same database (0 = unlimited). The rate is
+# lowered automatically on 429 responses and honours Retry-After headers.
+requests_per_second = 1.0
+
+# Token budget per minute shared the same way (0 = unlimited).
+tokens_per_minute = 0
 
 # Number of retry attempts on transient failures.
 max_retries = 3
@@ -33,6 +38,43 @@ max_retries = 3
 # Maximum tokens for the model response.
 max_tokens = 2048
 
+# Stream responses and close the stream as soon as the top-level JSON value
+# is complete, instead of waiting for trailing prose.
+stream = false
+
+# Constrain responses with a JSON schema (`response_format`): auto (when
+# OpenRouter lists structured output support for the model), true or false.
+structured_output = auto
+
+# Extra paid requests for a response that is still invalid JSON after local
+# repair (code fences, trailing commas, truncated closes).
+validation_retries = 1
+
+# Add each image's caption and surrounding paper text to the prompt.
+include_context = true
+
+# Maximum number of vision requests kept in flight at once (1 = serial).
+max_concurrency = 4
+
+# Images from the same PDF packed into one vision request (1 = one image per
+# request). Batched responses that cannot be parsed fall back to single-image
+# requests.
+batch_size = 1
+
+# Reuse vision responses for identical image bytes, model and prompt, across
+# PDFs, paper versions and output directories.
+cache_enabled = true
+
+# Days an unused cached response is kept (0 = forever).
+cache_ttl_days = 90
+
+# Images are downscaled to at most this many pixels before upload (the
+# resolution vision models actually use) and re-encoded compactly.
+upload_max_pixels = 1500000
+
+# Directory (relative to output_dir) caching prepared upload payloads.
+upload_cache_subdir = upload_cache
+
 [pipeline]
 # Default input directory for PDFs.
 pdf_input_dir = pdfs
@@ -51,6 +93,130 @@ db_path = pdf_processing.db
 
 # ChromaDB persistent vector database directory.
 chroma_path = chroma_db
+
+# Number of worker processes used for PDF extraction (1 = serial).
+extract_workers = 1
+
+# Longest side (pixels) of the optional downscaled copy written next to each
+# extracted image for the vision model and embedder. 0 disables it.
+vision_image_max_dim = 0
+
+# Number of database writes grouped into one SQLite transaction.
+db_commit_batch = 32
+
+# Maximum characters of surrounding text stored with each extracted image.
+context_max_chars = 1500
+
+[image_filter]
+# Drop trivial images (icons, rules, soft masks, solid blocks) during
+# extraction, before they are written or sent to the vision model.
+enabled = true
+
+# Minimum width and height in pixels.
+min_side = 32
+
+# Maximum ratio between the long and short side (catches 1px rules).
+max_aspect_ratio = 20.0
+
+# Minimum size of the encoded image stream in bytes.
+min_bytes = 512
+
+# Minimum grayscale standard deviation on a 64px thumbnail.
+min_stddev = 2.0
+
+# Minimum grayscale entropy (bits) on a 64px thumbnail.
+min_entropy = 1.0
+
+[figures]
+# Render each "Figure N" as one image by clustering vector drawings and image
+# tiles near its caption, so vector figures are captured and tiled figures
+# cost a single vision call.
+enabled = false
+
+# Resolution used to render figure regions.
+dpi = 150
+
+# Distance in points within which drawings are merged into one figure.
+cluster_gap = 12.0
+
+[embedding]
+# Compute ResNet50 image embeddings in the vision stage. When false the
+# model is never loaded; missing vectors can be filled in later.
+enabled = true
+
+# Images per ResNet50 forward pass.
+batch_size = 32
+
+# Threads decoding and transforming images for the embedder.
+workers = 4
+
+# Embedding backend: torch (eager PyTorch), onnx (ONNX Runtime, CPU) or
+# onnx-int8 (dynamically int8-quantized ONNX). ONNX models are exported once
+# into an embedding_models directory next to the database.
+backend = torch
+
+# Minimum cosine similarity an ONNX model must reach against PyTorch.
+parity_threshold = 0.99
+
+[near_duplicates]
+# Reuse the analysis of an already processed image from another PDF whose
+# perceptual hash (64-bit dHash, computed at extraction time) is within
+# max_distance bits, instead of sending re-rendered or rescaled copies to
+# the vision model. A hash match is only trusted if the two images also have
+# the same aspect ratio and a finer 256-bit dHash within detail_max_distance.
+# Off by default: clearly different figures of the same layout can match.
+enabled = false
+
+# Maximum Hamming distance between the 64-bit hashes of two near-duplicates.
+max_distance = 4
+
+# Maximum Hamming distance between the 256-bit detail hashes of the two images.
+detail_max_distance = 12
+
+# Maximum relative difference between the aspect ratios of the two images.
+max_aspect_difference = 0.02
+
+[cascade]
+# Escalating model cascade: comma-separated OpenRouter model slugs, cheapest
+# first. Each image goes to the first model; an answer that fails validation
+# or leaves a required field empty is sent to the next one. Empty means
+# `[vision] model` alone.
+models =
+
+# Images larger than this many pixels skip the first model (0 disables).
+max_pixels = 4000000
+
+# Images whose edge density (share of strong-edge pixels in a grayscale
+# thumbnail, high for text-heavy figures and dense diagrams) exceeds this
+# skip the first model (0 disables).
+max_edge_density = 0.15
+
+[queue]
+# Leased job queue used by `main.py process --worker`, so several workers
+# (processes or hosts sharing the database) never analyse the same image.
+# Seconds a claimed job stays leased without a heartbeat; jobs of crashed
+# workers are handed out again after this.
+lease_seconds = 300
+
+# Claims per job before it is given up.
+max_attempts = 3
+
+# Jobs claimed by a worker at a time.
+claim_size = 16
+
+# Seconds an idle worker waits for jobs leased by others before checking again.
+poll_interval = 10.0
+
+[watch]
+# Seconds between scans of the input directory in `main.py watch`
+# (on Linux, inotify wakes the watcher earlier when files change).
+poll_interval = 5.0
+
+# Seconds a PDF must stay unchanged before it is processed.
+debounce = 2.0
+
+# Maximum number of PDFs pushed through the pipeline per batch.
+batch_size = 16
 """
 
 config = configparser.ConfigParser()
@@ -98,6 +264,14 @@ def get_config_int(section: str, key: str, default: int) -> int:
     except ValueError:
         return default
 
+def get_config_bool(section: str, key: str, default: bool) -> bool:
+    val = get_config_value(section, key, str(default)).strip().lower()
+    if val in ("1", "true", "yes", "on"):
+        return True
+    if val in ("0", "false", "no", "off"):
+        return False
+    return default
+
 def resolve_path(path_str: str) -> Path:
     """Resolve path relative to project root if it is relative."""
     p = Path(path_str)
@@ -107,9 +281,20 @@ def resolve_path(path_str: str) -> Path:
 
 # --- Vision Settings ---
 VISION_MODEL = get_config_value("vision", "model", "qwen/qwen3.5-flash-02-23")
-VISION_API_DELAY = get_config_float("vision", "api_delay", 2.0)
+VISION_REQUESTS_PER_SECOND = get_config_float("vision", "requests_per_second", 1.0)
+VISION_TOKENS_PER_MINUTE = get_config_int("vision", "tokens_per_minute", 0)
 VISION_MAX_RETRIES = get_config_int("vision", "max_retries", 3)
 VISION_MAX_TOKENS = get_config_int("vision", "max_tokens", 2048)
+VISION_STREAM = get_config_bool("vision", "stream", False)
+VISION_STRUCTURED_OUTPUT = get_config_value("vision", "structured_output", "auto")
+VISION_VALIDATION_RETRIES = get_config_int("vision", "validation_retries", 1)
+VISION_INCLUDE_CONTEXT = get_config_bool("vision", "include_context", True)
+VISION_MAX_CONCURRENCY = get_config_int("vision", "max_concurrency", 4)
+VISION_BATCH_SIZE = get_config_int("vision", "batch_size", 1)
+VISION_CACHE_ENABLED = get_config_bool("vision", "cache_enabled", True)
+VISION_CACHE_TTL_DAYS = get_config_float("vision", "cache_ttl_days", 90.0)
+VISION_UPLOAD_MAX_PIXELS = get_config_int("vision", "upload_max_pixels", 1500000)
+VISION_UPLOAD_CACHE_SUBDIR = get_config_value("vision", "upload_cache_subdir", "upload_cache")
 
 # --- Pipeline Settings ---
 PDF_INPUT_DIR = str(resolve_path(get_config_value("pipeline", "pdf_input_dir", "pdfs")))
@@ -118,6 +303,55 @@ IMAGES_SUBDIR = get_config_value("pipeline", "images_subdir", "extracted_images"
 ANALYSIS_SUBDIR = get_config_value("pipeline", "analysis_subdir", "image_process")
 DB_PATH = str(resolve_path(get_config_value("pipeline", "db_path", "pdf_processing.db")))
 CHROMA_PATH = str(resolve_path(get_config_value("pipeline", "chroma_path", "chroma_db")))
+DB_COMMIT_BATCH = get_config_int("pipeline", "db_commit_batch", 32)
+CONTEXT_MAX_CHARS = get_config_int("pipeline", "context_max_chars", 1500)
+EXTRACT_WORKERS = get_config_int("pipeline", "extract_workers", 1)
+VISION_IMAGE_MAX_DIM = get_config_int("pipeline", "vision_image_max_dim", 0)
+
+# Subdirectory (inside each PDF's image directory) holding vision-sized copies
+VISION_SUBDIR = "_vision"
+
+# --- Image Filter Settings ---
+IMAGE_FILTER_ENABLED = get_config_bool("image_filter", "enabled", True)
+IMAGE_FILTER_MIN_SIDE = get_config_int("image_filter", "min_side", 32)
+IMAGE_FILTER_MAX_ASPECT_RATIO = get_config_float("image_filter", "max_aspect_ratio", 20.0)
+IMAGE_FILTER_MIN_BYTES = get_config_int("image_filter", "min_bytes", 512)
+IMAGE_FILTER_MIN_STDDEV = get_config_float("image_filter", "min_stddev", 2.0)
+IMAGE_FILTER_MIN_ENTROPY = get_config_float("image_filter", "min_entropy", 1.0)
+
+# --- Figure Rendering Settings ---
+FIGURES_ENABLED = get_config_bool("figures", "enabled", False)
+FIGURES_DPI = get_config_int("figures", "dpi", 150)
+FIGURES_CLUSTER_GAP = get_config_float("figures", "cluster_gap", 12.0)
+
+# --- Embedding Settings ---
+EMBEDDING_ENABLED = get_config_bool("embedding", "enabled", True)
+EMBEDDING_BATCH_SIZE = get_config_int("embedding", "batch_size", 32)
+EMBEDDING_WORKERS = get_config_int("embedding", "workers", 4)
+EMBEDDING_BACKEND = get_config_value("embedding", "backend", "torch")
+EMBEDDING_PARITY_THRESHOLD = get_config_float("embedding", "parity_threshold", 0.99)
+
+# --- Near-Duplicate Settings ---
+NEAR_DUPLICATES_ENABLED = get_config_bool("near_duplicates", "enabled", False)
+NEAR_DUPLICATES_MAX_DISTANCE = get_config_int("near_duplicates", "max_distance", 4)
+NEAR_DUPLICATES_DETAIL_MAX_DISTANCE = get_config_int("near_duplicates", "detail_max_distance", 12)
+NEAR_DUPLICATES_MAX_ASPECT_DIFFERENCE = get_config_float("near_duplicates", "max_aspect_difference", 0.02)
+
+# --- Model Cascade Settings ---
+CASCADE_MODELS = get_config_value("cascade", "models", "")
+CASCADE_MAX_PIXELS = get_config_int("cascade", "max_pixels", 4000000)
+CASCADE_MAX_EDGE_DENSITY = get_config_float("cascade", "max_edge_density", 0.15)
+
+# --- Job Queue Settings ---
+QUEUE_LEASE_SECONDS = get_config_float("queue", "lease_seconds", 300.0)
+QUEUE_MAX_ATTEMPTS = get_config_int("queue", "max_attempts", 3)
+QUEUE_CLAIM_SIZE = get_config_int("queue", "claim_size", 16)
+QUEUE_POLL_INTERVAL = get_config_float("queue", "poll_interval", 10.0)
+
+# --- Watch Settings ---
+WATCH_POLL_INTERVAL = get_config_float("watch", "poll_interval", 5.0)
+WATCH_DEBOUNCE = get_config_float("watch", "debounce", 2.0)
+WATCH_BATCH_SIZE = get_config_int("watch", "batch_size", 16)
 
 def get_images_dir(base_output: str = None) -> Path:
     """Get the path to the directory where PDF images are extracted."""
@@ -128,3 +362,21 @@ def get_analysis_dir(base_output: str = None) -> Path:
     """Get the path to the directory where LLM image analyses are stored."""
     base = resolve_path(base_output or OUTPUT_DIR)
     return base / ANALYSIS_SUBDIR
+
+def get_upload_cache_dir(base_output: str = None) -> Path:
+    """Get the path to the directory caching prepared vision upload payloads."""
+    base = resolve_path(base_output or OUTPUT_DIR)
+    return base / VISION_UPLOAD_CACHE_SUBDIR
+
+def get_vision_image(image_path: str | Path) -> Path:
+    """
+    Get the image to send to the vision model and embedder: the vision-sized
+    derivative written at extraction time if there is one, else the image itself.
+    """
+    image_path = Path(image_path)
+    vision_dir = image_path.parent / VISION_SUBDIR
+    if vision_dir.is_dir():
+        derivative = next(vision_dir.glob(f"{image_path.stem}.*"), None)
+        if derivative is not None:
+            return derivative
+    return image_path
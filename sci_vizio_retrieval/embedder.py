@@ -0,0 +1,299 @@
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import torch
+from PIL import Image
+from torchvision import transforms
+from torchvision.models import resnet50, ResNet50_Weights
+
+from sci_vizio_retrieval.config import (
+    DB_PATH,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_WORKERS,
+    EMBEDDING_BACKEND,
+    EMBEDDING_PARITY_THRESHOLD,
+)
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+def _build_trunk() -> torch.nn.Module:
+    """ResNet50 without its classification head (2048-d pooled features)."""
+    model = resnet50(weights=ResNet50_Weights.DEFAULT)
+    trunk = torch.nn.Sequential(*(list(model.children())[:-1]))
+    trunk.eval()
+    return trunk
+
+
+def get_model_dir(db_path: str = None) -> Path:
+    """Directory next to the database where exported embedding models are cached."""
+    return Path(db_path or DB_PATH).resolve().parent / "embedding_models"
+
+
+class _TorchBackend:
+    name = "torch"
+
+    def __init__(self, device: str = None):
+        self.device = torch.device(device or ("cuda" if torch.cuda.is_available() else "cpu"))
+        self.model = _build_trunk().to(self.device)
+
+    def __call__(self, batch: torch.Tensor) -> np.ndarray:
+        with torch.inference_mode():
+            return self.model(batch.to(self.device)).flatten(1).cpu().numpy()
+
+
+class _OnnxBackend:
+    def __init__(self, model_path: Path, name: str):
+        import onnxruntime as ort
+        self.name = name
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, batch: torch.Tensor) -> np.ndarray:
+        features = self.session.run(None, {self.input_name: batch.numpy()})[0]
+        return features.reshape(features.shape[0], -1)
+
+
+def _require_onnx():
+    try:
+        import onnx  # noqa: F401
+        import onnxruntime  # noqa: F401
+    except ImportError as e:
+        raise ImportError(
+            "The ONNX embedding backends need the 'onnx' and 'onnxruntime' packages "
+            "(pip install onnx onnxruntime)."
+        ) from e
+
+
+def _parity(reference: np.ndarray, candidate: np.ndarray) -> Dict:
+    """Cosine similarity between matching rows of two embedding matrices."""
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosine = np.sum(reference * candidate, axis=1)
+    return {'min_cosine': float(cosine.min()), 'mean_cosine': float(cosine.mean())}
+
+
+def export_onnx(model_dir: Path, quantize: bool = False, threshold: float = None) -> Path:
+    """
+    Export the ResNet50 trunk to ONNX (and optionally a dynamic int8-quantized
+    copy) unless it is already cached in `model_dir`.
+
+    A freshly exported model is checked against PyTorch on a fixed set of
+    random inputs; it is discarded if any cosine similarity falls below
+    `threshold`.
+
+    Returns:
+        Path of the model to load.
+    """
+    _require_onnx()
+    threshold = threshold if threshold is not None else EMBEDDING_PARITY_THRESHOLD
+    model_dir.mkdir(parents=True, exist_ok=True)
+    fp32_path = model_dir / f"{ImageEmbedder.MODEL_VERSION}.onnx"
+    target = model_dir / f"{ImageEmbedder.MODEL_VERSION}-int8.onnx" if quantize else fp32_path
+    if target.exists():
+        return target
+
+    trunk = _build_trunk()
+    if not fp32_path.exists():
+        logger.info(f"Exporting embedding model to {fp32_path}")
+        tmp = fp32_path.with_name(f"{fp32_path.name}.{os.getpid()}.tmp")
+        torch.onnx.export(
+            trunk,
+            torch.zeros(1, 3, 224, 224),
+            str(tmp),
+            input_names=["input"],
+            output_names=["features"],
+            dynamic_axes={"input": {0: "batch"}, "features": {0: "batch"}},
+            opset_version=17,
+        )
+        os.replace(tmp, fp32_path)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        logger.info(f"Quantizing embedding model to {target}")
+        tmp = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+        quantize_dynamic(str(fp32_path), str(tmp), weight_type=QuantType.QInt8)
+        os.replace(tmp, target)
+
+    sample = torch.from_numpy(np.random.default_rng(0).standard_normal((8, 3, 224, 224), dtype=np.float32))
+    with torch.inference_mode():
+        reference = trunk(sample).flatten(1).numpy()
+    parity = _parity(reference, _OnnxBackend(target, "check")(sample))
+    logger.info(f"ONNX parity for {target.name}: {parity}")
+    if parity['min_cosine'] < threshold:
+        target.unlink()
+        raise RuntimeError(
+            f"Exported model {target.name} does not match PyTorch embeddings "
+            f"(min cosine {parity['min_cosine']:.4f} < {threshold})"
+        )
+    return target
+
+
+class ImageEmbedder:
+    """
+    Batched ResNet50 image embedder.
+
+    Images are decoded and transformed in a thread pool while the previous
+    batch runs through the network, and each batch is a single forward pass
+    over a stacked (batch_size, 3, 224, 224) tensor.
+
+    The network runs on one of several backends: eager PyTorch ("torch"),
+    ONNX Runtime on CPU ("onnx") or ONNX Runtime with dynamic int8
+    quantization ("onnx-int8"). ONNX models are exported once and cached in
+    an `embedding_models` directory next to the database.
+
+    Args:
+        batch_size: Images per forward pass. If None, resolves from config.ini/EMBEDDING_BATCH_SIZE.
+        workers: Decode/transform threads. If None, resolves from config.ini/EMBEDDING_WORKERS.
+        device: Torch device for the torch backend. If None, uses CUDA when available.
+        backend: One of "torch", "onnx", "onnx-int8". If None, resolves from config.ini/EMBEDDING_BACKEND.
+        db_path: Database next to which ONNX models are cached. If None, resolves from config.ini/DB_PATH.
+    """
+
+    DIM = 2048
+    # Network the vectors come from; also names the exported ONNX models
+    MODEL_VERSION = "resnet50-imagenet1k-v2"
+    # Quantized weights give slightly different vectors, so they are versioned apart.
+    # float ONNX shares the PyTorch version: it is only used when it matches PyTorch.
+    BACKEND_VERSIONS = {"onnx-int8": f"{MODEL_VERSION}-int8"}
+
+    @classmethod
+    def version_for(cls, backend: str = None) -> str:
+        """
+        Version stored with every vector a backend produces, so embeddings
+        from another model or backend can be found and recomputed.
+        """
+        return cls.BACKEND_VERSIONS.get(backend or EMBEDDING_BACKEND, cls.MODEL_VERSION)
+
+    def __init__(self, batch_size: int = None, workers: int = None, device: str = None,
+                 backend: str = None, db_path: str = None):
+        self.batch_size = max(1, batch_size or EMBEDDING_BATCH_SIZE)
+        self.workers = max(1, workers or EMBEDDING_WORKERS)
+
+        backend = backend or EMBEDDING_BACKEND
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend '{backend}' (expected one of {', '.join(BACKENDS)})")
+        if backend == "torch":
+            self.backend = _TorchBackend(device)
+        else:
+            model_path = export_onnx(get_model_dir(db_path), quantize=backend == "onnx-int8")
+            self.backend = _OnnxBackend(model_path, backend)
+        self.model_version = self.version_for(backend)
+
+        self.transform = transforms.Compose([
+            transforms.Resize(256),
+            transforms.CenterCrop(224),
+            transforms.ToTensor(),
+            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+        ])
+
+    def _load(self, image_path: str | Path) -> Optional[torch.Tensor]:
+        try:
+            with Image.open(image_path) as image:
+                return self.transform(image.convert('RGB'))
+        except Exception as e:
+            logger.error(f"Error generating embedding for {image_path}: {str(e)}")
+            return None
+
+    def _forward(self, tensors: List[Optional[torch.Tensor]]) -> np.ndarray:
+        out = np.full((len(tensors), self.DIM), np.nan, dtype=np.float32)
+        valid = [i for i, t in enumerate(tensors) if t is not None]
+        if not valid:
+            return out
+
+        features = self.backend(torch.stack([tensors[i] for i in valid]))
+        out[valid] = features / np.linalg.norm(features, axis=1, keepdims=True)
+        return out
+
+    def embed_many(self, image_paths: Sequence[str | Path]) -> np.ndarray:
+        """
+        Embed images in batches.
+
+        Returns:
+            float32 array of shape (len(image_paths), 2048) with L2-normalized
+            rows; rows of images that could not be read are NaN.
+        """
+        if not image_paths:
+            return np.empty((0, self.DIM), dtype=np.float32)
+
+        chunks = [image_paths[i:i + self.batch_size] for i in range(0, len(image_paths), self.batch_size)]
+        results = []
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            # Decode the next batch while the current one is in the network
+            next_batch = [pool.submit(self._load, p) for p in chunks[0]]
+            for i in range(len(chunks)):
+                current = next_batch
+                if i + 1 < len(chunks):
+                    next_batch = [pool.submit(self._load, p) for p in chunks[i + 1]]
+                results.append(self._forward([f.result() for f in current]))
+        return np.concatenate(results)
+
+    def embed(self, image_path: str | Path) -> Optional[np.ndarray]:
+        """Embed a single image; None if it could not be read."""
+        row = self.embed_many([image_path])[0]
+        return None if np.isnan(row).any() else row
+
+
+def _rss_mb() -> float:
+    """Current resident set size of this process in MiB (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def benchmark_backends(image_paths: Sequence[str | Path], backends: Sequence[str] = BACKENDS,
+                       db_path: str = None, threshold: float = None) -> Dict[str, Dict]:
+    """
+    Compare embedding backends on the same images: load time, latency,
+    throughput, memory growth and cosine parity with the torch backend.
+
+    Backends that cannot be loaded (e.g. onnxruntime not installed) are
+    reported with an `error` entry.
+    """
+    threshold = threshold if threshold is not None else EMBEDDING_PARITY_THRESHOLD
+    image_paths = list(image_paths)
+    report = {}
+    reference = None
+    for backend in backends:
+        rss_before = _rss_mb()
+        start = time.perf_counter()
+        try:
+            embedder = ImageEmbedder(backend=backend, db_path=db_path)
+        except (ImportError, RuntimeError) as e:
+            report[backend] = {'error': str(e)}
+            continue
+        load_seconds = time.perf_counter() - start
+
+        embedder.embed_many(image_paths[:embedder.batch_size])  # warm-up
+        start = time.perf_counter()
+        vectors = embedder.embed_many(image_paths)
+        seconds = time.perf_counter() - start
+
+        entry = {
+            'load_seconds': round(load_seconds, 3),
+            'ms_per_image': round(1000 * seconds / max(1, len(image_paths)), 2),
+            'images_per_second': round(len(image_paths) / seconds, 2) if seconds > 0 else 0.0,
+            'rss_growth_mb': round(_rss_mb() - rss_before, 1),
+        }
+        valid = ~np.isnan(vectors).any(axis=1)
+        if backend == "torch":
+            reference = vectors
+        elif reference is not None and valid.any():
+            both = valid & ~np.isnan(reference).any(axis=1)
+            entry.update(_parity(reference[both], vectors[both]))
+            entry['parity_ok'] = entry['min_cosine'] >= threshold
+        report[backend] = entry
+        del embedder
+    return report
@@ -1,22 +1,230 @@
 import fitz  # PyMuPDF
-import sqlite3
+import io
+import os
 import hashlib
 import json
 import logging
+import re
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from PIL import Image
+from PIL import Image, ImageStat
 
 from sci_vizio_retrieval.config import (
     PDF_INPUT_DIR,
     OUTPUT_DIR,
     DB_PATH,
+    EXTRACT_WORKERS,
+    IMAGE_FILTER_ENABLED,
+    IMAGE_FILTER_MIN_SIDE,
+    IMAGE_FILTER_MAX_ASPECT_RATIO,
+    IMAGE_FILTER_MIN_BYTES,
+    IMAGE_FILTER_MIN_STDDEV,
+    IMAGE_FILTER_MIN_ENTROPY,
+    VISION_IMAGE_MAX_DIM,
+    VISION_SUBDIR,
+    FIGURES_ENABLED,
+    FIGURES_DPI,
+    FIGURES_CLUSTER_GAP,
+    CONTEXT_MAX_CHARS,
 )
+from sci_vizio_retrieval.phash import dhash_bytes, to_db
+from sci_vizio_retrieval.store import get_store
 
 logger = logging.getLogger(__name__)
 
+class ImageFilter:
+    """
+    Cheap pre-vision filter for trivial images such as icons, rules, soft
+    masks and solid-color blocks.
+
+    Checks run from cheapest to most expensive: the image table entry from
+    page.get_images is inspected before the image is extracted, and pixel
+    statistics are only computed on a small thumbnail of images that pass.
+    Each check returns a reason code, or None when the image is kept.
+    """
+
+    SOFT_MASK = 'soft_mask'
+    TOO_SMALL = 'too_small'
+    EXTREME_ASPECT = 'extreme_aspect'
+    TOO_FEW_BYTES = 'too_few_bytes'
+    LOW_VARIANCE = 'low_variance'
+    LOW_ENTROPY = 'low_entropy'
+
+    THUMBNAIL_SIZE = (64, 64)
+
+    def __init__(self, enabled=None, min_side=None, max_aspect_ratio=None,
+                 min_bytes=None, min_stddev=None, min_entropy=None):
+        self.enabled = IMAGE_FILTER_ENABLED if enabled is None else enabled
+        self.min_side = IMAGE_FILTER_MIN_SIDE if min_side is None else min_side
+        self.max_aspect_ratio = IMAGE_FILTER_MAX_ASPECT_RATIO if max_aspect_ratio is None else max_aspect_ratio
+        self.min_bytes = IMAGE_FILTER_MIN_BYTES if min_bytes is None else min_bytes
+        self.min_stddev = IMAGE_FILTER_MIN_STDDEV if min_stddev is None else min_stddev
+        self.min_entropy = IMAGE_FILTER_MIN_ENTROPY if min_entropy is None else min_entropy
+
+    def check_dimensions(self, width, height):
+        """Reject images that are too small or too elongated."""
+        if not self.enabled:
+            return None
+        if min(width, height) < self.min_side:
+            return self.TOO_SMALL
+        if min(width, height) > 0 and max(width, height) / min(width, height) > self.max_aspect_ratio:
+            return self.EXTREME_ASPECT
+        return None
+
+    def check_listing(self, img_info, smask_xrefs):
+        """
+        Check an entry of page.get_images(full=True) without extracting it.
+        
+        Args:
+            img_info (tuple): (xref, smask, width, height, ...) image table entry
+            smask_xrefs (set): xrefs used as soft masks by other images on the page
+        """
+        if not self.enabled:
+            return None
+        if img_info[0] in smask_xrefs:
+            return self.SOFT_MASK
+        return self.check_dimensions(img_info[2], img_info[3])
+
+    def check_image(self, base_image):
+        """Check an extracted image dict (as returned by extract_image)."""
+        if not self.enabled:
+            return None
+        if len(base_image["image"]) < self.min_bytes:
+            return self.TOO_FEW_BYTES
+        
+        reason = self.check_dimensions(base_image.get("width", 0), base_image.get("height", 0))
+        if reason:
+            return reason
+        
+        try:
+            with Image.open(io.BytesIO(base_image["image"])) as img:
+                # JPEG draft mode decodes at reduced scale directly; other
+                # formats are shrunk before conversion, never converted at full size
+                img.draft('L', self.THUMBNAIL_SIZE)
+                img.thumbnail(self.THUMBNAIL_SIZE)
+                thumb = img.convert('L')
+        except Exception:
+            # Undecodable by PIL: keep it and let later stages decide
+            return None
+        
+        if ImageStat.Stat(thumb).stddev[0] < self.min_stddev:
+            return self.LOW_VARIANCE
+        if thumb.entropy() < self.min_entropy:
+            return self.LOW_ENTROPY
+        return None
+
+
+class FigureDetector:
+    """
+    Locates logical figures on a page from their "Figure N" captions.
+
+    Vector drawings (page.get_drawings) and placed images are clustered by
+    proximity, and each caption is matched with the nearest cluster above it
+    (or, failing that, below it) that overlaps it horizontally. The result is
+    one clip rectangle per figure, covering vector art and raster tiles alike.
+    """
+
+    CAPTION_PATTERN = re.compile(r'^\s*(?:Figure|Fig\.?)\s*(\d+)\s*[:.|]', re.IGNORECASE)
+
+    # Elements covering most of the page are frames or backgrounds, not figures
+    MAX_PAGE_FRACTION = 0.9
+
+    def __init__(self, cluster_gap=None, min_side=None):
+        self.cluster_gap = FIGURES_CLUSTER_GAP if cluster_gap is None else cluster_gap
+        self.min_side = IMAGE_FILTER_MIN_SIDE if min_side is None else min_side
+
+    def find_captions(self, page):
+        """Return (figure_number, caption_rect, caption_text) for each caption block."""
+        captions = []
+        for block in page.get_text("blocks"):
+            x0, y0, x1, y1, text = block[:5]
+            match = self.CAPTION_PATTERN.match(text)
+            if match:
+                captions.append((match.group(1), fitz.Rect(x0, y0, x1, y1), text.strip()))
+        return captions
+
+    def _graphic_rects(self, page):
+        page_rect = page.rect
+        rects = [fitz.Rect(d["rect"]) for d in page.get_drawings()]
+        rects += [fitz.Rect(info["bbox"]) for info in page.get_image_info()]
+        return [
+            r for r in rects
+            if (r.width >= 1 or r.height >= 1)
+            and not (r.width > page_rect.width * self.MAX_PAGE_FRACTION
+                     and r.height > page_rect.height * self.MAX_PAGE_FRACTION)
+        ]
+
+    def _near(self, a, b):
+        gap = self.cluster_gap
+        return fitz.Rect(a.x0 - gap, a.y0 - gap, a.x1 + gap, a.y1 + gap).intersects(b)
+
+    def cluster(self, rects):
+        """Merge rectangles that lie within cluster_gap of each other."""
+        clusters = []
+        for rect in rects:
+            rect = fitz.Rect(rect)
+            i = 0
+            while i < len(clusters):
+                if self._near(clusters[i], rect):
+                    rect.include_rect(clusters.pop(i))
+                    i = 0
+                else:
+                    i += 1
+            clusters.append(rect)
+        return clusters
+
+    def detect(self, page):
+        """
+        Find figure regions on a page.
+        
+        Returns:
+            list: (figure_number, clip_rect, caption_text) per detected figure
+        """
+        captions = self.find_captions(page)
+        if not captions:
+            return []
+        
+        clusters = [
+            c for c in self.cluster(self._graphic_rects(page))
+            if c.width >= self.min_side and c.height >= self.min_side
+        ]
+        max_distance = page.rect.height / 4
+        figures = []
+        
+        for number, caption_rect, caption_text in sorted(captions, key=lambda c: c[1].y0):
+            best, best_score = None, None
+            for cluster in clusters:
+                if min(cluster.x1, caption_rect.x1) - max(cluster.x0, caption_rect.x0) <= 0:
+                    continue
+                if cluster.y1 <= caption_rect.y0 + self.cluster_gap:
+                    score = caption_rect.y0 - cluster.y1
+                elif cluster.y0 >= caption_rect.y1 - self.cluster_gap:
+                    # Captions above their figure are less common
+                    score = 2 * (cluster.y0 - caption_rect.y1)
+                else:
+                    continue
+                if score <= max_distance and (best_score is None or score < best_score):
+                    best, best_score = cluster, score
+            
+            if best is not None:
+                clusters.remove(best)
+                pad = self.cluster_gap / 2
+                clip = fitz.Rect(best.x0 - pad, best.y0 - pad, best.x1 + pad, best.y1 + pad) & page.rect
+                figures.append((number, clip, caption_text))
+        
+        return figures
+
+
 class PDFProcessor:
-    def __init__(self, input_dir=None, output_dir=None, db_path=None):
+    # Image stream formats written to disk as-is; anything else is converted to PNG
+    NATIVE_IMAGE_FORMATS = ('jpeg', 'jpg', 'png')
+
+    # Text blocks that caption an image
+    CAPTION_PATTERN = re.compile(r'^\s*(?:Figure|Fig\.?|Table|Scheme|Chart|Plate)\s*[A-Z]?\d+', re.IGNORECASE)
+
+    def __init__(self, input_dir=None, output_dir=None, db_path=None, workers=None, image_filter=None,
+                 vision_max_dim=None, figures=None, figure_dpi=None, context_max_chars=None):
         """
         Initialize the PDF processor with directories and database connection.
         
@@ -24,12 +232,26 @@ class PDFProcessor:
             input_dir (str/Path): Directory containing PDF files
             output_dir (str/Path): Base directory for extracted content
             db_path (str): Path to SQLite database
+            workers (int): Number of extraction processes (1 = serial)
+            image_filter (ImageFilter): Triviality filter. If None, configured from config.ini.
+            vision_max_dim (int): Longest side of the vision-sized derivative (0 = none)
+            figures (bool): Render one image per captioned figure. If None, loaded from config.ini.
+            figure_dpi (int): Resolution used to render figures. If None, loaded from config.ini.
+            context_max_chars (int): Maximum characters of surrounding text stored per image
         """
         self.input_dir = Path(input_dir or PDF_INPUT_DIR)
         self.output_dir = Path(output_dir or OUTPUT_DIR)
         self.images_dir = self.output_dir / "extracted_images"
         self.text_dir = self.output_dir / "extracted_text"
         self.db_path = db_path or DB_PATH
+        self.store = get_store(self.db_path)
+        self.workers = max(1, workers or EXTRACT_WORKERS)
+        self.image_filter = image_filter or ImageFilter()
+        self.vision_max_dim = VISION_IMAGE_MAX_DIM if vision_max_dim is None else vision_max_dim
+        self.figures = FIGURES_ENABLED if figures is None else figures
+        self.figure_dpi = figure_dpi or FIGURES_DPI
+        self.figure_detector = FigureDetector() if self.figures else None
+        self.context_max_chars = CONTEXT_MAX_CHARS if context_max_chars is None else context_max_chars
         
         # Create necessary directories
         self.images_dir.mkdir(parents=True, exist_ok=True)
@@ -40,7 +262,7 @@ class PDFProcessor:
 
     def _init_database(self):
         """Initialize SQLite database and create necessary tables if they don't exist."""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.store.transaction() as conn:
             cur = conn.cursor()
             
             # Create main processing table with hash column
@@ -65,7 +287,82 @@ class PDFProcessor:
                 ON pdf_processing(pdf_hash)
             ''')
             
-            conn.commit()
+            # Content-addressed store: one file per distinct image across the corpus
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS image_store (
+                    content_hash TEXT PRIMARY KEY,
+                    image_path TEXT,
+                    pdf_path TEXT,
+                    first_seen TEXT
+                )
+            ''')
+            
+            # Perceptual hash of each stored image, for near-duplicate lookups
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS image_phash (
+                    content_hash TEXT PRIMARY KEY,
+                    phash INTEGER
+                )
+            ''')
+            
+            # Every image occurrence in a PDF, pointing at its stored file
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS pdf_image_refs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    pdf_path TEXT,
+                    page_num INTEGER,
+                    img_index INTEGER,
+                    xref INTEGER,
+                    content_hash TEXT,
+                    image_path TEXT,
+                    is_duplicate BOOLEAN,
+                    UNIQUE(pdf_path, page_num, img_index)
+                )
+            ''')
+            
+            cur.execute('''
+                CREATE INDEX IF NOT EXISTS idx_pdf_image_refs_hash 
+                ON pdf_image_refs(content_hash)
+            ''')
+            
+            # Where each extracted image sits in the paper and the text around it
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS image_context (
+                    image_path TEXT PRIMARY KEY,
+                    pdf_path TEXT,
+                    pdf_file TEXT,
+                    image TEXT,
+                    page_num INTEGER,
+                    bbox TEXT,
+                    caption TEXT,
+                    context TEXT
+                )
+            ''')
+            
+            cur.execute('''
+                CREATE INDEX IF NOT EXISTS idx_image_context_image 
+                ON image_context(pdf_file, image)
+            ''')
+            
+            # File metadata seen when a PDF was recorded, for change detection
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS pdf_fingerprints (
+                    pdf_path TEXT PRIMARY KEY,
+                    size INTEGER,
+                    mtime_ns INTEGER,
+                    inode INTEGER
+                )
+            ''')
+            
+            # PDFs forgotten since they were indexed; the indexer drops their search entries
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS index_removals (
+                    pdf_file TEXT PRIMARY KEY,
+                    queued TEXT
+                )
+            ''')
+
+    HASH_BUFFER_SIZE = 1024 * 1024
 
     def calculate_hash(self, file_path):
         """
@@ -78,11 +375,114 @@ class PDFProcessor:
             str: Hexadecimal hash string
         """
         sha256_hash = hashlib.sha256()
-        with open(file_path, "rb") as f:
-            for byte_block in iter(lambda: f.read(4096), b""):
-                sha256_hash.update(byte_block)
+        buffer = bytearray(self.HASH_BUFFER_SIZE)
+        view = memoryview(buffer)
+        with open(file_path, "rb", buffering=0) as f:
+            while True:
+                n = f.readinto(buffer)
+                if not n:
+                    break
+                sha256_hash.update(view[:n])
         return sha256_hash.hexdigest()
 
+    @staticmethod
+    def file_fingerprint(file_path):
+        """
+        Get the (size, mtime_ns, inode) fingerprint of a file without reading it.
+        
+        Args:
+            file_path (Path): Path to the file
+        
+        Returns:
+            tuple: (size, mtime_ns, inode)
+        """
+        st = os.stat(file_path)
+        return st.st_size, st.st_mtime_ns, st.st_ino
+
+    def load_known_pdfs(self):
+        """
+        Load the recorded state of every PDF with a single query.
+        
+        Returns:
+            dict: pdf_path -> {'pdf_hash', 'is_duplicate', 'original_path',
+                  'fingerprint' (tuple or None)}
+        """
+        rows = self.store.fetchall('''
+            SELECT p.pdf_path, p.pdf_hash, p.is_duplicate, p.original_path,
+                   f.size, f.mtime_ns, f.inode
+            FROM pdf_processing p
+            LEFT JOIN pdf_fingerprints f ON f.pdf_path = p.pdf_path
+        ''')
+        return {
+            row[0]: {
+                'pdf_hash': row[1],
+                'is_duplicate': bool(row[2]),
+                'original_path': row[3],
+                'fingerprint': tuple(row[4:7]) if row[4] is not None else None
+            }
+            for row in rows
+        }
+
+    def record_fingerprint(self, pdf_path, fingerprint):
+        """Store the fingerprint of a recorded PDF."""
+        self.store.write('''
+            INSERT OR REPLACE INTO pdf_fingerprints (pdf_path, size, mtime_ns, inode)
+            VALUES (?, ?, ?, ?)
+        ''', (str(pdf_path), *fingerprint))
+
+    def forget_pdf(self, pdf_path):
+        """
+        Drop the recorded state of a PDF, and everything derived from its
+        images, so it is extracted, analysed and indexed again.
+        
+        Its image store entries and their files go too, unless another PDF
+        still refers to them: re-extraction writes to the same page-based
+        file names, so a kept entry would map the old content hash to a file
+        with new content, and a kept file of a removed image would still be
+        analysed as part of the PDF. The vision results, index records and
+        queue jobs of the PDF's images are deleted, and its search index
+        entries are queued for removal by the indexer.
+        """
+        pdf_file = Path(pdf_path).stem
+        removed = self.store.fetchall('''
+            SELECT image_path FROM image_store
+            WHERE pdf_path = ? AND content_hash NOT IN (
+                SELECT content_hash FROM pdf_image_refs WHERE pdf_path != ?
+            )
+        ''', (str(pdf_path), str(pdf_path)))
+        
+        with self.store.batch() as conn:
+            conn.execute('''
+                DELETE FROM image_store
+                WHERE pdf_path = ? AND content_hash NOT IN (
+                    SELECT content_hash FROM pdf_image_refs WHERE pdf_path != ?
+                )
+            ''', (str(pdf_path), str(pdf_path)))
+            for table in ('pdf_processing', 'pdf_image_refs', 'image_context', 'pdf_fingerprints'):
+                conn.execute(f"DELETE FROM {table} WHERE pdf_path = ?", (str(pdf_path),))
+            
+            # Later stages key their rows by PDF name; their tables exist once they have run
+            if self.store.table_exists('image_processing'):
+                if self.store.table_exists('embedding_matrix'):
+                    conn.execute('''
+                        DELETE FROM embedding_matrix
+                        WHERE id IN (SELECT id FROM image_processing WHERE pdf_file = ?)
+                    ''', (pdf_file,))
+                conn.execute("DELETE FROM image_processing WHERE pdf_file = ?", (pdf_file,))
+            for table in ('json_indexing', 'vision_jobs'):
+                if self.store.table_exists(table):
+                    conn.execute(f"DELETE FROM {table} WHERE pdf_file = ?", (pdf_file,))
+            conn.execute(
+                "INSERT OR REPLACE INTO index_removals (pdf_file, queued) VALUES (?, ?)",
+                (pdf_file, datetime.now().isoformat())
+            )
+        
+        for (image_path,) in removed:
+            image_path = self.output_dir / image_path
+            image_path.unlink(missing_ok=True)
+            for derivative in (image_path.parent / VISION_SUBDIR).glob(f"{image_path.stem}.*"):
+                derivative.unlink(missing_ok=True)
+
     def check_duplicate(self, pdf_path, pdf_hash):
         """
         Check if a PDF with the same hash exists in the database.
@@ -94,19 +494,16 @@ class PDFProcessor:
         Returns:
             tuple: (is_duplicate, original_path)
         """
-        with sqlite3.connect(self.db_path) as conn:
-            cur = conn.cursor()
-            cur.execute(
-                """
-                SELECT pdf_path FROM pdf_processing 
-                WHERE pdf_hash = ? AND pdf_path != ? 
-                AND is_duplicate = FALSE
-                LIMIT 1
-                """,
-                (pdf_hash, str(pdf_path))
-            )
-            result = cur.fetchone()
-            return (True, result[0]) if result else (False, None)
+        result = self.store.fetchone(
+            """
+            SELECT pdf_path FROM pdf_processing 
+            WHERE pdf_hash = ? AND pdf_path != ? 
+            AND is_duplicate = FALSE
+            LIMIT 1
+            """,
+            (pdf_hash, str(pdf_path))
+        )
+        return (True, result[0]) if result else (False, None)
 
     def handle_duplicate(self, pdf_path, original_path):
         """
@@ -116,9 +513,9 @@ class PDFProcessor:
             pdf_path (Path): Path to the duplicate PDF
             original_path (str): Path to the original PDF
         """
-        with sqlite3.connect(self.db_path) as conn:
-            cur = conn.cursor()
-            cur.execute(
+        # Commit before deleting so the record survives a crash
+        with self.store.transaction() as conn:
+            conn.execute(
                 """
                 INSERT INTO pdf_processing 
                 (pdf_path, pdf_hash, process_timestamp, text_extracted, 
@@ -127,7 +524,6 @@ class PDFProcessor:
                 """,
                 (str(pdf_path), datetime.now().isoformat(), original_path)
             )
-            conn.commit()
         
         # Delete the duplicate file
         try:
@@ -146,28 +542,25 @@ class PDFProcessor:
         Returns:
             tuple: (bool, dict) - (is_processed, processing_details)
         """
-        with sqlite3.connect(self.db_path) as conn:
-            cur = conn.cursor()
-            cur.execute(
-                "SELECT * FROM pdf_processing WHERE pdf_path = ?",
-                (str(pdf_path),)
-            )
-            result = cur.fetchone()
-            
-            if result:
-                return True, {
-                    'id': result[0],
-                    'pdf_path': result[1],
-                    'pdf_hash': result[2],
-                    'timestamp': result[3],
-                    'text_extracted': bool(result[4]),
-                    'images_extracted': bool(result[5]),
-                    'image_info': json.loads(result[6]) if result[6] else None,
-                    'error_message': result[7],
-                    'is_duplicate': bool(result[8]),
-                    'original_path': result[9]
-                }
-            return False, None
+        result = self.store.fetchone(
+            "SELECT * FROM pdf_processing WHERE pdf_path = ?",
+            (str(pdf_path),)
+        )
+        
+        if result:
+            return True, {
+                'id': result[0],
+                'pdf_path': result[1],
+                'pdf_hash': result[2],
+                'timestamp': result[3],
+                'text_extracted': bool(result[4]),
+                'images_extracted': bool(result[5]),
+                'image_info': json.loads(result[6]) if result[6] else None,
+                'error_message': result[7],
+                'is_duplicate': bool(result[8]),
+                'original_path': result[9]
+            }
+        return False, None
 
     def extract_text(self, pdf_path):
         """
@@ -179,27 +572,8 @@ class PDFProcessor:
         Returns:
             tuple: (success, output_path or error_message)
         """
-        try:
-            pdf_document = fitz.open(str(pdf_path))
-            text_content = []
-            
-            for page_num in range(pdf_document.page_count):
-                page = pdf_document[page_num]
-                text_content.append(f"--- Page {page_num + 1} ---\n")
-                text_content.append(page.get_text())
-                text_content.append("\n\n")
-            
-            relative_path = pdf_path.stem
-            output_path = self.text_dir / f"{relative_path}.txt"
-            output_path.parent.mkdir(parents=True, exist_ok=True)
-            
-            output_path.write_text('\n'.join(text_content), encoding='utf-8')
-            
-            pdf_document.close()
-            return True, output_path
-            
-        except Exception as e:
-            return False, str(e)
+        text_outcome, _ = self.extract_document(pdf_path, images=False)
+        return text_outcome
 
     def extract_images(self, pdf_path):
         """
@@ -211,91 +585,414 @@ class PDFProcessor:
         Returns:
             tuple: (success, list of image paths or error message)
         """
+        _, images_outcome = self.extract_document(pdf_path, text=False)
+        return images_outcome
+
+    def lookup_stored_image(self, content_hash):
+        """
+        Look up an image in the content-addressed store.
+        
+        Args:
+            content_hash (str): SHA-256 hash of the image bytes
+        
+        Returns:
+            str: Stored image path relative to output_dir, or None
+        """
+        result = self.store.fetchone(
+            "SELECT image_path FROM image_store WHERE content_hash = ?",
+            (content_hash,)
+        )
+        return result[0] if result else None
+
+    def stored_stems(self, pdf_path):
+        """
+        File names (without extension) still held in the image store by a PDF.
+        
+        After a PDF is forgotten, the only entries left are images another PDF
+        refers to; a re-extraction must not overwrite their files.
+        
+        Args:
+            pdf_path (Path): Path to the PDF file
+        
+        Returns:
+            set: Stems of the stored image files
+        """
+        rows = self.store.fetchall(
+            "SELECT image_path FROM image_store WHERE pdf_path = ?",
+            (str(pdf_path),)
+        )
+        return {Path(row[0]).stem for row in rows}
+
+    def extract_document(self, pdf_path, text=True, images=True, image_refs=None, filtered=None,
+                         image_context=None):
+        """
+        Extract text and images from a PDF in a single pass over its pages.
+        
+        The document is opened once and every page is visited once. Page text
+        is streamed to the .txt file as it is read. A failure in one kind of
+        extraction does not stop the other.
+        
+        Images are deduplicated by xref and by content hash, within the PDF and
+        against the image store, so only distinct images are written to disk.
+        Trivial images rejected by the image filter are not written at all.
+        In figure mode, captioned figures are rendered as single images and
+        the raster tiles they contain are not written separately.
+        
+        Args:
+            pdf_path (Path): Path to the PDF file
+            text (bool): Whether to extract text
+            images (bool): Whether to extract images
+            image_refs (list): Optional list that receives one ref dict per
+                image occurrence, including duplicates
+            filtered (dict): Optional dict that receives per-reason counts of
+                images rejected by the image filter
+            image_context (list): Optional list that receives the page, bbox,
+                caption and surrounding text of every image written
+        
+        Returns:
+            tuple: ((text_success, output_path or error_message),
+                    (images_success, list of image paths or error_message))
+        """
+        text_error = None if text else "Text extraction disabled"
+        images_error = None if images else "Image extraction disabled"
+        text_file = None
+        output_path = None
+        extracted_images = []
+        scan = {
+            'seen_xrefs': {},
+            'seen_hashes': {},
+            'rejected_xrefs': set(),
+            'image_refs': image_refs if image_refs is not None else [],
+            'filtered': filtered if filtered is not None else {},
+            'image_context': image_context if image_context is not None else [],
+            'stored_stems': self.stored_stems(pdf_path) if images else set(),
+        }
+        
         try:
-            relative_path = pdf_path.stem
-            pdf_output_dir = self.images_dir / relative_path
-            pdf_output_dir.mkdir(parents=True, exist_ok=True)
-            
             pdf_document = fitz.open(str(pdf_path))
-            extracted_images = []
+        except Exception as e:
+            return (False, str(e)), (False, str(e))
+        
+        try:
+            if text:
+                try:
+                    output_path = self.text_dir / f"{pdf_path.stem}.txt"
+                    output_path.parent.mkdir(parents=True, exist_ok=True)
+                    text_file = open(output_path, 'w', encoding='utf-8')
+                except Exception as e:
+                    text_error = str(e)
+            
+            if images:
+                try:
+                    pdf_output_dir = self.images_dir / pdf_path.stem
+                    pdf_output_dir.mkdir(parents=True, exist_ok=True)
+                except Exception as e:
+                    images_error = str(e)
             
             for page_num in range(pdf_document.page_count):
+                if text_error is not None and images_error is not None:
+                    break
                 page = pdf_document[page_num]
-                image_list = page.get_images(full=True)
                 
-                for img_index, img_info in enumerate(image_list):
-                    xref = img_info[0]
-                    base_image = pdf_document.extract_image(xref)
-                    
-                    if base_image:
-                        image_filename = f"page{page_num + 1}_img{img_index + 1}.{base_image['ext']}"
-                        image_path = pdf_output_dir / image_filename
-                        
-                        image_path.write_bytes(base_image["image"])
-                        
-                        try:
-                            with Image.open(image_path) as img:
-                                if img.mode == 'RGBA':
-                                    img = img.convert('RGB')
-                                img.save(image_path, optimize=True, quality=85)
-                        except Exception as e:
-                            logger.warning(f"Could not optimize {image_filename}: {str(e)}")
-                        
-                        extracted_images.append({
-                            'filename': image_filename,
-                            'path': str(image_path.relative_to(self.output_dir))
-                        })
-            
+                if text_error is None:
+                    try:
+                        # Same layout as joining header, text and spacer with '\n'
+                        separator = '\n' if page_num > 0 else ''
+                        text_file.write(f"{separator}--- Page {page_num + 1} ---\n")
+                        text_file.write('\n' + page.get_text())
+                        text_file.write('\n\n\n')
+                    except Exception as e:
+                        text_error = str(e)
+                
+                if images_error is None:
+                    try:
+                        scan['figure_rects'] = []
+                        scan['text_blocks'] = [
+                            b for b in page.get_text("blocks") if b[6] == 0 and b[4].strip()
+                        ]
+                        if self.figures:
+                            extracted_images.extend(self._extract_page_figures(
+                                page, page_num, pdf_output_dir, scan
+                            ))
+                        extracted_images.extend(self._extract_page_images(
+                            pdf_document, page, page_num, pdf_output_dir, scan
+                        ))
+                    except Exception as e:
+                        images_error = str(e)
+        finally:
+            if text_file is not None:
+                text_file.close()
             pdf_document.close()
-            return True, extracted_images
+        
+        text_outcome = (False, text_error) if text_error is not None else (True, output_path)
+        images_outcome = (False, images_error) if images_error is not None else (True, extracted_images)
+        return text_outcome, images_outcome
+
+    def _extract_page_figures(self, page, page_num, pdf_output_dir, scan):
+        """
+        Render each captioned figure of a page once, at figure_dpi.
+        
+        The rendered regions are recorded in scan['figure_rects'] so raster
+        tiles inside them are not extracted again.
+        
+        Returns:
+            list: Image info dicts for the figures written
+        """
+        extracted_figures = []
+        
+        for number, clip, caption_text in self.figure_detector.detect(page):
+            pix = page.get_pixmap(clip=clip, dpi=self.figure_dpi)
+            rendered = {
+                'image': pix.tobytes("png"),
+                'ext': 'png',
+                'width': pix.width,
+                'height': pix.height,
+            }
+            scan['figure_rects'].append(clip)
             
+            content_hash = hashlib.sha256(rendered['image']).hexdigest()
+            if content_hash in scan['seen_hashes']:
+                continue
+            
+            image_path, vision_path = self._write_image(
+                rendered, pdf_output_dir, self._free_stem(scan, f"page{page_num + 1}_fig{number}", content_hash)
+            )
+            stored_path = str(image_path.relative_to(self.output_dir))
+            scan['seen_hashes'][content_hash] = stored_path
+            self._record_context(scan, stored_path, page_num, clip, caption=caption_text)
+            extracted_figures.append({
+                'filename': image_path.name,
+                'path': stored_path,
+                'content_hash': content_hash,
+                'phash': self._perceptual_hash(rendered['image']),
+                'vision_path': str(vision_path.relative_to(self.output_dir)) if vision_path else None,
+                'figure': number,
+                'bbox': [clip.x0, clip.y0, clip.x1, clip.y1]
+            })
+        
+        return extracted_figures
+
+    def _find_caption(self, blocks, rect):
+        """Return the text of the caption block nearest to an image, if any."""
+        best, best_distance = None, None
+        for block in blocks:
+            if not self.CAPTION_PATTERN.match(block[4]):
+                continue
+            distance = _rect_distance(rect, fitz.Rect(block[:4]))
+            if best_distance is None or distance < best_distance:
+                best, best_distance = block, distance
+        return ' '.join(best[4].split()) if best is not None else None
+
+    def _record_context(self, scan, stored_path, page_num, bbox, caption=None):
+        """
+        Record an image's page, bbox, caption and a bounded window of the
+        text blocks closest to it, in reading order.
+        """
+        blocks = scan['text_blocks']
+        context = None
+        if bbox is not None:
+            rect = fitz.Rect(bbox)
+            outside = [b for b in blocks if not rect.contains(fitz.Rect(b[:4]))]
+            if caption is None:
+                caption = self._find_caption(outside, rect)
+            
+            window, total = [], 0
+            for block in sorted(outside, key=lambda b: _rect_distance(rect, fitz.Rect(b[:4]))):
+                text = ' '.join(block[4].split())
+                if text == caption:
+                    continue
+                if total + len(text) > self.context_max_chars:
+                    break
+                window.append(block)
+                total += len(text)
+            context = '\n'.join(
+                ' '.join(b[4].split()) for b in sorted(window, key=lambda b: (b[1], b[0]))
+            )
+        
+        scan['image_context'].append({
+            'image_path': stored_path,
+            'image': Path(stored_path).name,
+            'page_num': page_num + 1,
+            'bbox': [bbox[0], bbox[1], bbox[2], bbox[3]] if bbox is not None else None,
+            'caption': ' '.join(caption.split()) if caption else None,
+            'context': context or None
+        })
+
+    @staticmethod
+    def _inside_figure(page, xref, figure_rects):
+        """True if every placement of an image lies within a rendered figure."""
+        if not figure_rects:
+            return False
+        placements = page.get_image_rects(xref)
+        return bool(placements) and all(
+            any(fig.contains(rect) for fig in figure_rects) for rect in placements
+        )
+
+    @staticmethod
+    def _perceptual_hash(data):
+        """Difference hash of an encoded image, or None if it cannot be decoded."""
+        try:
+            return dhash_bytes(data)
         except Exception as e:
-            return False, str(e)
+            logger.warning(f"Could not compute perceptual hash: {str(e)}")
+            return None
 
-    def process_pdf(self, pdf_path):
+    @staticmethod
+    def _free_stem(scan, stem, content_hash):
+        """File stem for a new image, suffixed with its hash if a stored image of another PDF still uses it."""
+        if stem in scan['stored_stems']:
+            return f"{stem}_{content_hash[:12]}"
+        return stem
+
+    def _reject_image(self, scan, xref, reason, page_num, img_index):
+        """Record an image rejected by the triviality filter."""
+        scan['rejected_xrefs'].add(xref)
+        scan['filtered'][reason] = scan['filtered'].get(reason, 0) + 1
+        logger.debug(f"Filtered page{page_num + 1}_img{img_index + 1} (xref {xref}): {reason}")
+
+    def _write_image(self, base_image, pdf_output_dir, stem):
         """
-        Process a single PDF file, extracting text and images.
+        Write an extracted image stream and, optionally, its vision-sized derivative.
+        
+        JPEG and PNG streams are written byte for byte with no re-encoding.
+        Other formats (JPX, JBIG2, TIFF, ...) are converted to PNG. When a
+        derivative is needed it is produced from the same decode.
         
         Args:
-            pdf_path (Path): Path to the PDF file
+            base_image (dict): Image dict as returned by extract_image
+            pdf_output_dir (Path): Image directory of the PDF
+            stem (str): File name without extension
         
         Returns:
-            dict: Processing results and statistics
+            tuple: (image_path, vision_path or None)
         """
-        pdf_path = Path(pdf_path)
+        ext = base_image['ext'].lower()
+        native = ext in self.NATIVE_IMAGE_FORMATS
+        longest_side = max(base_image.get('width', 0), base_image.get('height', 0))
+        needs_derivative = self.vision_max_dim > 0 and longest_side > self.vision_max_dim
         
-        if not pdf_path.exists():
-            return {
-                'pdf_path': str(pdf_path),
-                'error_message': 'File no longer exists'
-            }
+        image_path = pdf_output_dir / f"{stem}.{ext if native else 'png'}"
+        vision_path = None
         
-        is_processed, details = self.is_processed(pdf_path)
-        if is_processed:
-            logger.info(f"PDF already processed on {details['timestamp']}")
-            return details
+        if native:
+            image_path.write_bytes(base_image["image"])
+            if not needs_derivative:
+                return image_path, None
         
         try:
-            pdf_hash = self.calculate_hash(pdf_path)
-            is_duplicate, original_path = self.check_duplicate(pdf_path, pdf_hash)
-            
-            if is_duplicate:
-                logger.info(f"Duplicate PDF found: {pdf_path}")
-                logger.info(f"Original file: {original_path}")
-                self.handle_duplicate(pdf_path, original_path)
-                return {
-                    'pdf_path': str(pdf_path),
-                    'pdf_hash': pdf_hash,
-                    'is_duplicate': True,
-                    'original_path': original_path
-                }
+            with Image.open(io.BytesIO(base_image["image"])) as img:
+                if not native:
+                    if img.mode not in ('1', 'L', 'LA', 'P', 'RGB', 'RGBA'):
+                        img = img.convert('RGB')
+                    img.save(image_path, format='PNG')
+                
+                if needs_derivative:
+                    vision_dir = pdf_output_dir / VISION_SUBDIR
+                    vision_dir.mkdir(exist_ok=True)
+                    derivative = img.copy()
+                    derivative.thumbnail((self.vision_max_dim, self.vision_max_dim))
+                    # Photos stay JPEG, everything lossless stays PNG
+                    if ext in ('jpeg', 'jpg'):
+                        vision_path = vision_dir / f"{stem}.jpg"
+                        if derivative.mode not in ('L', 'RGB'):
+                            derivative = derivative.convert('RGB')
+                        derivative.save(vision_path, format='JPEG', quality=85)
+                    else:
+                        vision_path = vision_dir / f"{stem}.png"
+                        derivative.save(vision_path, format='PNG')
         except Exception as e:
-            return {
-                'pdf_path': str(pdf_path),
-                'error_message': f"Error calculating hash: {str(e)}"
+            if not native:
+                # Keep the raw stream so nothing is lost
+                image_path = pdf_output_dir / f"{stem}.{ext}"
+                image_path.write_bytes(base_image["image"])
+            logger.warning(f"Could not convert {stem}.{ext}: {str(e)}")
+        
+        return image_path, vision_path
+
+    def _extract_page_images(self, pdf_document, page, page_num, pdf_output_dir, scan):
+        """
+        Write the distinct raster images of one page to the PDF's image directory.
+        
+        Repeated xrefs are resolved without decoding the image again, and images
+        whose content hash is already known (earlier in this PDF or in the image
+        store) are recorded in the scan's image_refs instead of being written.
+        Trivial images are rejected before they are written.
+        
+        Returns:
+            list: Image info dicts for the images written
+        """
+        extracted_images = []
+        image_list = page.get_images(full=True)
+        smask_xrefs = {img_info[1] for img_info in image_list if img_info[1]}
+        seen_xrefs = scan['seen_xrefs']
+        
+        for img_index, img_info in enumerate(image_list):
+            xref = img_info[0]
+            ref = {
+                'page_num': page_num + 1,
+                'img_index': img_index + 1,
+                'xref': xref,
             }
+            
+            if xref in scan['rejected_xrefs']:
+                continue
+            
+            if self._inside_figure(page, xref, scan['figure_rects']):
+                scan['filtered']['in_figure'] = scan['filtered'].get('in_figure', 0) + 1
+                continue
+            
+            if xref in seen_xrefs:
+                content_hash, stored_path = seen_xrefs[xref]
+                scan['image_refs'].append({**ref, 'content_hash': content_hash,
+                                           'image_path': stored_path, 'is_duplicate': True})
+                continue
+            
+            reason = self.image_filter.check_listing(img_info, smask_xrefs)
+            if reason:
+                self._reject_image(scan, xref, reason, page_num, img_index)
+                continue
+            
+            base_image = pdf_document.extract_image(xref)
+            
+            if base_image:
+                reason = self.image_filter.check_image(base_image)
+                if reason:
+                    self._reject_image(scan, xref, reason, page_num, img_index)
+                    continue
+                
+                content_hash = hashlib.sha256(base_image["image"]).hexdigest()
+                stored_path = scan['seen_hashes'].get(content_hash) or self.lookup_stored_image(content_hash)
+                if stored_path is not None:
+                    seen_xrefs[xref] = (content_hash, stored_path)
+                    scan['image_refs'].append({**ref, 'content_hash': content_hash,
+                                               'image_path': stored_path, 'is_duplicate': True})
+                    continue
+                
+                image_path, vision_path = self._write_image(
+                    base_image, pdf_output_dir,
+                    self._free_stem(scan, f"page{page_num + 1}_img{img_index + 1}", content_hash)
+                )
+                
+                stored_path = str(image_path.relative_to(self.output_dir))
+                placements = page.get_image_rects(xref)
+                self._record_context(scan, stored_path, page_num, placements[0] if placements else None)
+                seen_xrefs[xref] = (content_hash, stored_path)
+                scan['seen_hashes'][content_hash] = stored_path
+                scan['image_refs'].append({**ref, 'content_hash': content_hash,
+                                           'image_path': stored_path, 'is_duplicate': False})
+                extracted_images.append({
+                    'filename': image_path.name,
+                    'path': stored_path,
+                    'content_hash': content_hash,
+                    'phash': self._perceptual_hash(base_image["image"]),
+                    'vision_path': str(vision_path.relative_to(self.output_dir)) if vision_path else None
+                })
         
-        results = {
+        return extracted_images
+
+    def _new_results(self, pdf_path, pdf_hash):
+        """Build the empty per-PDF result record."""
+        return {
             'pdf_path': str(pdf_path),
             'pdf_hash': pdf_hash,
             'timestamp': datetime.now().isoformat(),
@@ -306,29 +1003,137 @@ class PDFProcessor:
             'is_duplicate': False,
             'original_path': None
         }
+
+    def extract_content(self, pdf_path, pdf_hash):
+        """
+        Extract text and images from a PDF without touching the database.
+        
+        Args:
+            pdf_path (Path): Path to the PDF file
+            pdf_hash (str): SHA-256 hash of the PDF
+        
+        Returns:
+            dict: Processing results ready to be stored
+        """
+        results = self._new_results(pdf_path, pdf_hash)
+        results['image_refs'] = []
+        results['filtered_images'] = {}
+        results['image_context'] = []
         
         try:
-            text_success, text_result = self.extract_text(pdf_path)
+            (text_success, text_result), (images_success, images_result) = self.extract_document(
+                pdf_path, image_refs=results['image_refs'], filtered=results['filtered_images'],
+                image_context=results['image_context']
+            )
             results['text_extracted'] = text_success
             if not text_success:
                 results['error_message'] = f"Text extraction failed: {text_result}"
             
-            images_success, images_result = self.extract_images(pdf_path)
             results['images_extracted'] = images_success
             if images_success:
                 results['image_info'] = images_result
             else:
                 results['error_message'] = f"{results['error_message']}; Image extraction failed: {images_result}"
+        except Exception as e:
+            results['error_message'] = str(e)
+        
+        return results
+
+    def _claim_stored_images(self, cur, results):
+        """
+        Register newly written images in the image store.
+        
+        Another PDF may have stored the same content since this one was
+        extracted (e.g. a parallel worker); such files are removed again and
+        their refs are pointed at the stored copy.
+        """
+        if not results.get('image_info'):
+            return
+        
+        kept = []
+        replaced = {}
+        for info in results['image_info']:
+            cur.execute('''
+                INSERT OR IGNORE INTO image_store 
+                (content_hash, image_path, pdf_path, first_seen)
+                VALUES (?, ?, ?, ?)
+            ''', (info['content_hash'], info['path'], results['pdf_path'], results['timestamp']))
+            
+            if cur.rowcount:
+                kept.append(info)
+                continue
             
-            with sqlite3.connect(self.db_path) as conn:
+            cur.execute(
+                "SELECT image_path FROM image_store WHERE content_hash = ?",
+                (info['content_hash'],)
+            )
+            replaced[info['path']] = cur.fetchone()[0]
+            try:
+                (self.output_dir / info['path']).unlink()
+                if info.get('vision_path'):
+                    (self.output_dir / info['vision_path']).unlink(missing_ok=True)
+            except OSError as e:
+                logger.warning(f"Could not remove duplicate image {info['path']}: {e}")
+        
+        results['image_info'] = kept
+        for ref in results.get('image_refs', []):
+            if ref['image_path'] in replaced:
+                ref['image_path'] = replaced[ref['image_path']]
+                ref['is_duplicate'] = True
+
+    def store_results(self, results):
+        """
+        Record the extraction results of a PDF in the database.
+        
+        Args:
+            results (dict): Processing results as returned by extract_content
+        """
+        try:
+            with self.store.batch() as conn:
                 cur = conn.cursor()
+                self._claim_stored_images(cur, results)
+                cur.executemany('''
+                    INSERT OR REPLACE INTO pdf_image_refs 
+                    (pdf_path, page_num, img_index, xref, content_hash, image_path, is_duplicate)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', [
+                    (results['pdf_path'], ref['page_num'], ref['img_index'], ref['xref'],
+                     ref['content_hash'], ref['image_path'], ref['is_duplicate'])
+                    for ref in results.get('image_refs', [])
+                ])
+                cur.executemany('''
+                    INSERT OR IGNORE INTO image_phash (content_hash, phash)
+                    VALUES (?, ?)
+                ''', [
+                    (info['content_hash'], to_db(info['phash']))
+                    for info in results['image_info'] or []
+                    if info.get('phash') is not None
+                ])
+                stored = {info['path'] for info in results['image_info'] or []}
+                cur.executemany('''
+                    INSERT OR REPLACE INTO image_context 
+                    (image_path, pdf_path, pdf_file, image, page_num, bbox, caption, context)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', [
+                    (ctx['image_path'], results['pdf_path'], Path(results['pdf_path']).stem,
+                     ctx['image'], ctx['page_num'],
+                     json.dumps(ctx['bbox']) if ctx['bbox'] else None,
+                     ctx['caption'], ctx['context'])
+                    for ctx in results.get('image_context', [])
+                    if ctx['image_path'] in stored
+                ])
+                if results.get('fingerprint'):
+                    cur.execute('''
+                        INSERT OR REPLACE INTO pdf_fingerprints (pdf_path, size, mtime_ns, inode)
+                        VALUES (?, ?, ?, ?)
+                    ''', (results['pdf_path'], *results['fingerprint']))
                 cur.execute('''
                     INSERT INTO pdf_processing 
                     (pdf_path, pdf_hash, process_timestamp, text_extracted, 
                     images_extracted, image_info, error_message, is_duplicate, original_path)
                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
                 ''', (
-                    str(pdf_path),
+                    results['pdf_path'],
                     results['pdf_hash'],
                     results['timestamp'],
                     results['text_extracted'],
@@ -338,60 +1143,299 @@ class PDFProcessor:
                     results['is_duplicate'],
                     results['original_path']
                 ))
-                conn.commit()
-            
         except Exception as e:
             results['error_message'] = str(e)
-            
-        return results
 
-    def process_directory(self):
+    def process_pdf(self, pdf_path):
         """
-        Process all PDF files in the input directory and its subdirectories.
+        Process a single PDF file, extracting text and images.
+        
+        Args:
+            pdf_path (Path): Path to the PDF file
         
         Returns:
-            dict: Processing statistics
+            dict: Processing results and statistics
         """
-        stats = {
+        pdf_path = Path(pdf_path)
+        
+        if not pdf_path.exists():
+            return {
+                'pdf_path': str(pdf_path),
+                'error_message': 'File no longer exists'
+            }
+        
+        is_processed, details = self.is_processed(pdf_path)
+        if is_processed:
+            logger.info(f"PDF already processed on {details['timestamp']}")
+            return details
+        
+        return self._process_unrecorded(pdf_path)
+
+    def _process_unrecorded(self, pdf_path, fingerprint=None, pdf_hash=None):
+        """
+        Hash, deduplicate, extract and store a PDF that has no record yet.
+        
+        A hash already computed by _classify is passed in and not recomputed.
+        """
+        try:
+            fingerprint = fingerprint or self.file_fingerprint(pdf_path)
+            pdf_hash = pdf_hash or self.calculate_hash(pdf_path)
+            is_duplicate, original_path = self.check_duplicate(pdf_path, pdf_hash)
+            
+            if is_duplicate:
+                logger.info(f"Duplicate PDF found: {pdf_path}")
+                logger.info(f"Original file: {original_path}")
+                self.handle_duplicate(pdf_path, original_path)
+                return {
+                    'pdf_path': str(pdf_path),
+                    'pdf_hash': pdf_hash,
+                    'is_duplicate': True,
+                    'original_path': original_path
+                }
+        except Exception as e:
+            return {
+                'pdf_path': str(pdf_path),
+                'error_message': f"Error calculating hash: {str(e)}"
+            }
+        
+        results = self.extract_content(pdf_path, pdf_hash)
+        results['fingerprint'] = fingerprint
+        self.store_results(results)
+        return results
+
+    @staticmethod
+    def _new_stats():
+        return {
             'total_pdfs': 0,
             'processed_pdfs': 0,
             'skipped_pdfs': 0,
             'failed_pdfs': 0,
             'duplicate_pdfs': 0,
+            'modified_pdfs': 0,
             'total_images': 0,
-            'total_text_files': 0
+            'total_text_files': 0,
+            'filtered_images': {}
         }
+
+    def _classify(self, pdf_path, known, stats):
+        """
+        Decide whether a listed PDF needs extraction, using the recorded state.
         
-        for pdf_path in self.input_dir.rglob('*.pdf'):
-            stats['total_pdfs'] += 1
-            is_processed, details = self.is_processed(pdf_path)
+        Unchanged files are recognised from their (size, mtime_ns, inode)
+        fingerprint without being read. Only files whose fingerprint is
+        missing or differs are hashed; if the content changed, the old record
+        is dropped so the PDF is extracted again, and the new hash is returned
+        so the file is not read a second time.
+        
+        Returns:
+            tuple: (skip, fingerprint, pdf_hash or None if not computed)
+        """
+        try:
+            fingerprint = self.file_fingerprint(pdf_path)
+        except OSError:
+            return False, None, None
+        
+        details = known.get(str(pdf_path))
+        if details is None:
+            return False, fingerprint, None
+        
+        if details['is_duplicate']:
+            logger.info(f"Skipping [{stats['total_pdfs']}] {pdf_path.name} (duplicate of {details['original_path']})")
+            stats['duplicate_pdfs'] += 1
+            return True, fingerprint, None
+        
+        if details['fingerprint'] != fingerprint:
+            try:
+                pdf_hash = self.calculate_hash(pdf_path)
+            except OSError:
+                pdf_hash = None
             
-            if is_processed:
-                if details.get('is_duplicate', False):
-                    logger.info(f"Skipping [{stats['total_pdfs']}] {pdf_path.name} (duplicate of {details['original_path']})")
-                    stats['duplicate_pdfs'] += 1
-                else:
-                    logger.info(f"Skipping [{stats['total_pdfs']}] {pdf_path.name} (already processed)")
-                    stats['skipped_pdfs'] += 1
+            if pdf_hash != details['pdf_hash']:
+                logger.info(f"Modified [{stats['total_pdfs']}] {pdf_path.name} (content changed since last run)")
+                stats['modified_pdfs'] += 1
+                self.forget_pdf(pdf_path)
+                return False, fingerprint, pdf_hash
+            self.record_fingerprint(pdf_path, fingerprint)
+        
+        logger.info(f"Skipping [{stats['total_pdfs']}] {pdf_path.name} (already processed)")
+        stats['skipped_pdfs'] += 1
+        return True, fingerprint, None
+
+    @staticmethod
+    def _tally_results(results, stats):
+        """Fold the results of one processed PDF into the directory stats."""
+        if results.get('is_duplicate', False):
+            stats['duplicate_pdfs'] += 1
+            return
+        
+        for reason, count in (results.get('filtered_images') or {}).items():
+            stats['filtered_images'][reason] = stats['filtered_images'].get(reason, 0) + count
+        if results.get('filtered_images'):
+            logger.info(f"Filtered trivial images: {results['filtered_images']}")
+        
+        if results.get('text_extracted') and results.get('images_extracted'):
+            stats['processed_pdfs'] += 1
+            stats['total_images'] += len(results['image_info']) if results['image_info'] else 0
+            stats['total_text_files'] += 1
+        else:
+            stats['failed_pdfs'] += 1
+        
+        logger.info(f"Text extracted: {results.get('text_extracted', False)}")
+        logger.info(f"Images extracted: {results.get('images_extracted', False)}")
+        if results.get('error_message'):
+            logger.error(f"Errors: {results['error_message']}")
+
+    def process_directory(self, workers=None):
+        """
+        Process all PDF files in the input directory and its subdirectories.
+        
+        Args:
+            workers (int): Number of extraction processes. If None, uses self.workers.
+        
+        Returns:
+            dict: Processing statistics
+        """
+        return self.process_paths(self.input_dir.rglob('*.pdf'), workers=workers)
+
+    def process_paths(self, pdf_paths, workers=None, changed=None):
+        """
+        Process the given PDF files, skipping ones that are already recorded
+        and unchanged.
+        
+        Args:
+            pdf_paths (iterable): Paths of the PDF files, in processing order
+            workers (int): Number of extraction processes. If None, uses self.workers.
+            changed (list): Optional list that receives the path of every PDF
+                that was new or modified, i.e. not skipped as unchanged
+        
+        Returns:
+            dict: Processing statistics
+        """
+        workers = workers or self.workers
+        if workers > 1:
+            return self._process_paths_parallel(pdf_paths, workers, changed)
+        
+        stats = self._new_stats()
+        known = self.load_known_pdfs()
+        
+        for pdf_path in map(Path, pdf_paths):
+            stats['total_pdfs'] += 1
+            skip, fingerprint, pdf_hash = self._classify(pdf_path, known, stats)
+            if skip:
                 continue
+            if changed is not None:
+                changed.append(pdf_path)
             
             logger.info(f"Processing [{stats['total_pdfs']}] {pdf_path.name}")
-            results = self.process_pdf(pdf_path)
-            
-            if results.get('is_duplicate', False):
-                stats['duplicate_pdfs'] += 1
+            results = self._process_unrecorded(pdf_path, fingerprint, pdf_hash)
+            self._tally_results(results, stats)
+        
+        self.store.flush()
+        return stats
+
+    def _process_paths_parallel(self, pdf_paths, workers, changed=None):
+        """
+        Process PDF files with a pool of extraction processes.
+        
+        Hashing and extraction run in the workers; duplicate detection and all
+        database writes stay in this process, in directory order, so the stats
+        and rows are the same as a serial run.
+        """
+        stats = self._new_stats()
+        known = self.load_known_pdfs()
+        pending = []
+        
+        for pdf_path in map(Path, pdf_paths):
+            stats['total_pdfs'] += 1
+            skip, fingerprint, pdf_hash = self._classify(pdf_path, known, stats)
+            if skip:
                 continue
+            if changed is not None:
+                changed.append(pdf_path)
+            pending.append((stats['total_pdfs'], pdf_path, fingerprint, pdf_hash))
+        
+        # Workers read the image store through their own connections, so the
+        # records of modified PDFs dropped above must be committed first
+        self.store.flush()
+        if not pending:
+            return stats
+        
+        logger.info(f"Extracting {len(pending)} PDFs with {workers} workers")
+        
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(str(self.input_dir), str(self.output_dir), self.db_path,
+                      self.image_filter, self.vision_max_dim, self.figures, self.figure_dpi,
+                      self.context_max_chars),
+        ) as pool:
+            # Modified PDFs were already hashed by _classify
+            computed = iter(pool.map(_hash_worker, [p for _, p, _, h in pending if h is None]))
+            hashes = [(h, None) if h is not None else next(computed) for _, _, _, h in pending]
             
-            if results.get('text_extracted') and results.get('images_extracted'):
-                stats['processed_pdfs'] += 1
-                stats['total_images'] += len(results['image_info']) if results['image_info'] else 0
-                stats['total_text_files'] += 1
-            else:
-                stats['failed_pdfs'] += 1
+            # Resolve duplicates serially, including ones within this batch
+            to_extract = []
+            fingerprints = []
+            seen_hashes = {}
+            for (position, pdf_path, fingerprint, _), (pdf_hash, error) in zip(pending, hashes):
+                logger.info(f"Processing [{position}] {pdf_path.name}")
+                if error is not None:
+                    self._tally_results({
+                        'pdf_path': str(pdf_path),
+                        'error_message': f"Error calculating hash: {error}"
+                    }, stats)
+                    continue
+                
+                original_path = seen_hashes.get(pdf_hash)
+                if original_path is None:
+                    is_duplicate, original_path = self.check_duplicate(pdf_path, pdf_hash)
+                
+                if original_path is not None:
+                    logger.info(f"Duplicate PDF found: {pdf_path}")
+                    logger.info(f"Original file: {original_path}")
+                    self.handle_duplicate(pdf_path, original_path)
+                    stats['duplicate_pdfs'] += 1
+                    continue
+                
+                seen_hashes[pdf_hash] = str(pdf_path)
+                to_extract.append((pdf_path, pdf_hash))
+                fingerprints.append(fingerprint)
             
-            logger.info(f"Text extracted: {results.get('text_extracted', False)}")
-            logger.info(f"Images extracted: {results.get('images_extracted', False)}")
-            if results.get('error_message'):
-                logger.error(f"Errors: {results['error_message']}")
+            # Single writer: results are stored in submission order
+            for results, fingerprint in zip(pool.map(_extract_worker, to_extract), fingerprints):
+                results['fingerprint'] = fingerprint
+                self.store_results(results)
+                self._tally_results(results, stats)
         
+        self.store.flush()
         return stats
+
+
+def _rect_distance(a, b):
+    """Gap between two rectangles (0 if they overlap)."""
+    dx = max(b.x0 - a.x1, a.x0 - b.x1, 0)
+    dy = max(b.y0 - a.y1, a.y0 - b.y1, 0)
+    return (dx * dx + dy * dy) ** 0.5
+
+
+# Per-process PDFProcessor used by the extraction pool workers
+_worker_processor = None
+
+def _init_worker(input_dir, output_dir, db_path, image_filter, vision_max_dim, figures, figure_dpi,
+                 context_max_chars):
+    global _worker_processor
+    _worker_processor = PDFProcessor(
+        input_dir=input_dir, output_dir=output_dir, db_path=db_path,
+        image_filter=image_filter, vision_max_dim=vision_max_dim,
+        figures=figures, figure_dpi=figure_dpi, context_max_chars=context_max_chars
+    )
+
+def _hash_worker(pdf_path):
+    try:
+        return _worker_processor.calculate_hash(pdf_path), None
+    except Exception as e:
+        return None, str(e)
+
+def _extract_worker(item):
+    pdf_path, pdf_hash = item
+    return _worker_processor.extract_content(pdf_path, pdf_hash)
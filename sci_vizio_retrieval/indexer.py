@@ -1,4 +1,3 @@
-import sqlite3
 import json
 import chromadb
 from chromadb.utils import embedding_functions
@@ -10,10 +9,12 @@ import base64
 import numpy as np
 from PIL import Image
 
+from sci_vizio_retrieval.analysis import parse_analysis
 from sci_vizio_retrieval.config import (
     DB_PATH,
     CHROMA_PATH,
 )
+from sci_vizio_retrieval.store import get_store
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +29,7 @@ class ImageAnalysisIndexer:
         """
         self.db_path = db_path or DB_PATH
         self.chroma_path = chroma_path or CHROMA_PATH
+        self.store = get_store(self.db_path)
         
         # chroma settings
         self.chroma_client = chromadb.PersistentClient(path=self.chroma_path)
@@ -41,7 +43,7 @@ class ImageAnalysisIndexer:
 
     def _init_database(self):
         """Initialize SQLite database with indexing tracking table."""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.store.transaction() as conn:
             cur = conn.cursor()
             cur.execute('''
                 CREATE TABLE IF NOT EXISTS json_indexing (
@@ -54,7 +56,15 @@ class ImageAnalysisIndexer:
                     UNIQUE(pdf_file, image_path)
                 )
             ''')
-            conn.commit()
+            # Filled by PDFProcessor.forget_pdf when a PDF changes
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS index_removals (
+                    pdf_file TEXT PRIMARY KEY,
+                    queued TEXT
+                )
+            ''')
+        if self.store.table_exists('image_processing'):
+            self.store.add_column('image_processing', 'analysis', 'TEXT')
 
     def _init_collections(self):
         """Initialize or get ChromaDB collections."""
@@ -85,29 +95,14 @@ class ImageAnalysisIndexer:
             )
 
     def extract_and_validate_json(self, response_text: str) -> Tuple[bool, Optional[Dict], Optional[str]]:
-        """Extract and validate JSON from response text."""
-        try:
-            start_idx = response_text.find('{')
-            end_idx = response_text.rfind('}')
-            
-            if start_idx == -1 or end_idx == -1:
-                return False, None, "No JSON object found in response"
-            
-            json_str = response_text[start_idx:end_idx + 1]
-            json_obj = json.loads(json_str)
-            
-            required_fields = ['image_type', 'title', 'description']
-            missing_fields = [field for field in required_fields if field not in json_obj]
-            
-            if missing_fields:
-                return False, None, f"Missing required fields: {', '.join(missing_fields)}"
-            
-            return True, json_obj, None
-            
-        except json.JSONDecodeError as e:
-            return False, None, f"JSON parsing error: {str(e)}"
-        except Exception as e:
-            return False, None, f"Validation error: {str(e)}"
+        """
+        Extract and validate JSON from response text.
+
+        Only needed for rows stored before analyses were parsed at ingest;
+        the same local repair is applied.
+        """
+        json_obj, error_message, _ = parse_analysis(response_text)
+        return json_obj is not None, json_obj, error_message
 
     def get_image_embedding(self, image_path: str) -> Optional[str]:
         """Get base64 encoded image for embedding/metadata inclusion."""
@@ -121,40 +116,49 @@ class ImageAnalysisIndexer:
     def store_indexing_result(self, pdf_file: str, image_path: str, 
                              success: bool, error_message: Optional[str] = None):
         """Store indexing result in database."""
-        with sqlite3.connect(self.db_path) as conn:
-            cur = conn.cursor()
-            cur.execute('''
-                INSERT OR REPLACE INTO json_indexing 
-                (pdf_file, image_path, index_status, timestamp, error_message)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (
-                pdf_file,
-                image_path,
-                success,
-                datetime.now().isoformat(),
-                error_message
-            ))
-            conn.commit()
+        self.store.write('''
+            INSERT OR REPLACE INTO json_indexing 
+            (pdf_file, image_path, index_status, timestamp, error_message)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (
+            pdf_file,
+            image_path,
+            success,
+            datetime.now().isoformat(),
+            error_message
+        ))
 
     def index_document(self, pdf_file: str, image_path: str, 
-                       json_obj: Dict, document_id: str) -> bool:
-        """Index document and image in ChromaDB."""
+                       json_obj: Dict, document_id: str, context: Optional[Dict] = None) -> bool:
+        """Index document and image in ChromaDB, together with the image's paper context."""
         try:
             image_b64 = self.get_image_embedding(image_path)
             if not image_b64:
                 return False
 
-            json_str = json.dumps(json_obj)
+            document = dict(json_obj)
+            metadata = {
+                "pdf_file": pdf_file,
+                "image_path": image_path,
+                "image_type": json_obj.get("image_type", ""),
+                "title": json_obj.get("title", ""),
+                "image_data": image_b64
+            }
+            if context:
+                # Caption and surrounding text make the document searchable by the paper's wording
+                if context['caption']:
+                    document['source_caption'] = context['caption']
+                    metadata['caption'] = context['caption']
+                if context['context']:
+                    document['source_context'] = context['context']
+                if context['page_num'] is not None:
+                    metadata['page_num'] = context['page_num']
+
+            json_str = json.dumps(document)
             
             self.doc_collection.add(
                 documents=[json_str],
-                metadatas=[{
-                    "pdf_file": pdf_file,
-                    "image_path": image_path,
-                    "image_type": json_obj.get("image_type", ""),
-                    "title": json_obj.get("title", ""),
-                    "image_data": image_b64
-                }],
+                metadatas=[metadata],
                 ids=[document_id]
             )
 
@@ -177,17 +181,36 @@ class ImageAnalysisIndexer:
             logger.error(f"Error indexing document {document_id}: {str(e)}")
             return False
 
+    def remove_forgotten(self) -> int:
+        """
+        Delete the ChromaDB entries of PDFs that were forgotten because they
+        changed, so removed images stop matching and re-analysed ones can be
+        added again under their ids. Returns the number of PDFs cleared.
+        """
+        removals = self.store.fetchall("SELECT pdf_file, queued FROM index_removals")
+        for pdf_file, queued in removals:
+            logger.info(f"Removing index entries of modified PDF {pdf_file}")
+            for collection in (self.doc_collection, self.image_collection):
+                collection.delete(where={"pdf_file": pdf_file})
+            # A PDF forgotten again meanwhile stays queued
+            self.store.write(
+                "DELETE FROM index_removals WHERE pdf_file = ? AND queued = ?", (pdf_file, queued)
+            )
+        self.store.flush()
+        return len(removals)
+
     def process_all_analyses(self, pdf_names: List[str] = None) -> Dict:
         """Process all image analyses from the database."""
         stats = {
             'total_processed': 0,
             'successful_validations': 0,
             'successful_indexing': 0,
-            'failed': 0
+            'failed': 0,
+            'removed_pdfs': self.remove_forgotten()
         }
         
         query = '''
-            SELECT ip.pdf_file, ip.image_path, ip.response
+            SELECT ip.pdf_file, ip.image_path, ip.response, ip.analysis
             FROM image_processing ip
             LEFT JOIN json_indexing ji 
             ON ip.pdf_file = ji.pdf_file AND ip.image_path = ji.image_path
@@ -200,34 +223,35 @@ class ImageAnalysisIndexer:
             query += f" AND ip.pdf_file IN ({placeholders})"
             params.extend(pdf_names)
             
-        with sqlite3.connect(self.db_path) as conn:
-            cur = conn.cursor()
-            cur.execute(query, params)
+        for pdf_file, image_path, response, analysis in self.store.fetchall(query, params):
+            stats['total_processed'] += 1
+            logger.info(f"Processing [{stats['total_processed']}] {image_path}")
             
-            for pdf_file, image_path, response in cur.fetchall():
-                stats['total_processed'] += 1
-                logger.info(f"Processing [{stats['total_processed']}] {image_path}")
-                
+            if analysis is not None:
+                success, json_obj, error_message = True, json.loads(analysis), None
+            else:
                 success, json_obj, error_message = self.extract_and_validate_json(response)
+            
+            if success:
+                stats['successful_validations'] += 1
+                document_id = f"{pdf_file}_{Path(image_path).stem}"
                 
-                if success:
-                    stats['successful_validations'] += 1
-                    document_id = f"{pdf_file}_{Path(image_path).stem}"
-                    
-                    if self.index_document(pdf_file, image_path, json_obj, document_id):
-                        stats['successful_indexing'] += 1
-                        self.store_indexing_result(pdf_file, image_path, True)
-                    else:
-                        stats['failed'] += 1
-                        self.store_indexing_result(
-                            pdf_file, image_path, False, 
-                            "Failed to index in ChromaDB"
-                        )
+                context = self.store.get_image_context(pdf_file, Path(image_path).name)
+                if self.index_document(pdf_file, image_path, json_obj, document_id, context):
+                    stats['successful_indexing'] += 1
+                    self.store_indexing_result(pdf_file, image_path, True)
                 else:
                     stats['failed'] += 1
                     self.store_indexing_result(
                         pdf_file, image_path, False, 
-                        error_message
+                        "Failed to index in ChromaDB"
                     )
+            else:
+                stats['failed'] += 1
+                self.store_indexing_result(
+                    pdf_file, image_path, False, 
+                    error_message
+                )
         
+        self.store.flush()
         return stats
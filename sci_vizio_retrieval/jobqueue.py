@@ -0,0 +1,249 @@
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+
+from sci_vizio_retrieval.config import DB_PATH, QUEUE_LEASE_SECONDS, QUEUE_MAX_ATTEMPTS
+
+logger = logging.getLogger(__name__)
+
+# Seconds a statement waits for another connection's write lock
+_BUSY_TIMEOUT = 30.0
+# Retries of a transaction that still found the database locked, with doubling pauses
+_LOCK_RETRIES = 5
+_LOCK_BACKOFF = 1.0
+
+
+@dataclass
+class Job:
+    id: int
+    image_path: str
+    pdf_file: str
+    attempts: int
+
+
+def make_worker_id() -> str:
+    """Identifier unique to this process, readable enough to tell hosts apart."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _is_locked(error: BaseException) -> bool:
+    """Whether an error is SQLite giving up on a lock held by another connection."""
+    return isinstance(error, sqlite3.OperationalError) and ('locked' in str(error) or 'busy' in str(error))
+
+
+class JobQueue:
+    """
+    Durable queue of images awaiting vision analysis, with leases.
+
+    Workers claim jobs in batches; a claim leases them to the worker for
+    `lease_seconds`, during which no other worker can take them. Workers
+    renew the lease while they work (heartbeat) and acknowledge each job
+    once its result is stored. Jobs whose lease ran out (the worker crashed,
+    hung or lost its host) are handed out again on the next claim, until
+    they have been attempted `max_attempts` times.
+
+    Like the rate limiter, the queue writes through its own connection in
+    immediate transactions, so claims are atomic across processes and
+    visible to other workers at once. A transaction that finds the database
+    locked for longer than the busy timeout is retried with exponential
+    backoff. All workers must run on the same host as the database: it is
+    in WAL mode, whose shared-memory index does not work across machines or
+    over network filesystems.
+
+    Args:
+        db_path: Database holding the queue. If None, resolves from config.ini/DB_PATH.
+        lease_seconds: How long a claim lasts without a heartbeat. If None, resolves from config.ini/QUEUE_LEASE_SECONDS.
+        max_attempts: Claims per job before it is given up. If None, resolves from config.ini/QUEUE_MAX_ATTEMPTS.
+        worker_id: Name of this worker. If None, built from host name and process id.
+    """
+
+    def __init__(self, db_path: str = None, lease_seconds: float = None, max_attempts: int = None,
+                 worker_id: str = None):
+        self.db_path = str(db_path or DB_PATH)
+        self.lease_seconds = lease_seconds if lease_seconds is not None else QUEUE_LEASE_SECONDS
+        self.max_attempts = max(1, max_attempts if max_attempts is not None else QUEUE_MAX_ATTEMPTS)
+        self.worker_id = worker_id or make_worker_id()
+        self._lock = threading.Lock()
+
+        self.conn = sqlite3.connect(self.db_path, timeout=_BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS vision_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                image_path TEXT,
+                pdf_file TEXT,
+                status TEXT DEFAULT 'pending',
+                worker TEXT,
+                lease_expires REAL,
+                attempts INTEGER DEFAULT 0,
+                created REAL,
+                updated REAL,
+                error_message TEXT,
+                UNIQUE(image_path, pdf_file)
+            )
+        ''')
+        self.conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_vision_jobs_status
+            ON vision_jobs(status, lease_expires)
+        ''')
+
+    def _immediate(self, work: Callable[[sqlite3.Connection], Any]) -> Any:
+        """
+        Run work(conn) in one immediate transaction and return its result.
+
+        If the database is still locked once the busy timeout has passed,
+        the transaction is rolled back and run again after a pause that
+        doubles each time, without holding the lock. Gives up after
+        _LOCK_RETRIES retries.
+        """
+        for attempt in range(_LOCK_RETRIES + 1):
+            with self._lock:
+                try:
+                    self.conn.execute("BEGIN IMMEDIATE")
+                    result = work(self.conn)
+                    self.conn.execute("COMMIT")
+                    return result
+                except BaseException as e:
+                    if self.conn.in_transaction:
+                        self.conn.execute("ROLLBACK")
+                    if attempt == _LOCK_RETRIES or not _is_locked(e):
+                        raise
+            delay = _LOCK_BACKOFF * 2 ** attempt
+            logger.warning(f"Job queue database is locked; retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+    def enqueue(self, items: Iterable[Tuple[str, str]]) -> int:
+        """Add (image_path, pdf_file) jobs that are not queued yet. Returns the number added."""
+        items = [(str(path), pdf_file) for path, pdf_file in items]
+
+        def insert(conn):
+            now = time.time()
+            return conn.executemany('''
+                INSERT OR IGNORE INTO vision_jobs (image_path, pdf_file, status, created, updated)
+                VALUES (?, ?, 'pending', ?, ?)
+            ''', [(path, pdf_file, now, now) for path, pdf_file in items]).rowcount
+
+        return self._immediate(insert)
+
+    def claim(self, limit: int) -> List[Job]:
+        """Lease up to `limit` pending or expired jobs to this worker, oldest first."""
+        def lease(conn):
+            now = time.time()
+            rows = conn.execute('''
+                SELECT id, image_path, pdf_file, attempts FROM vision_jobs
+                WHERE (status = 'pending' OR (status = 'leased' AND lease_expires < ?))
+                  AND attempts < ?
+                ORDER BY id
+                LIMIT ?
+            ''', (now, self.max_attempts, limit)).fetchall()
+            conn.executemany('''
+                UPDATE vision_jobs
+                SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1, updated = ?
+                WHERE id = ?
+            ''', [(self.worker_id, now + self.lease_seconds, now, row[0]) for row in rows])
+            # Jobs whose last lease expired on their final attempt are given up
+            conn.execute('''
+                UPDATE vision_jobs
+                SET status = 'failed', error_message = 'Lease expired on the last attempt', updated = ?
+                WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?
+            ''', (now, now, self.max_attempts))
+            return rows
+
+        return [Job(row[0], row[1], row[2], row[3] + 1) for row in self._immediate(lease)]
+
+    def heartbeat(self, job_ids: Sequence[int]) -> int:
+        """Extend this worker's leases on the given jobs. Returns how many are still held."""
+        def renew(conn):
+            now = time.time()
+            return conn.executemany('''
+                UPDATE vision_jobs SET lease_expires = ?, updated = ?
+                WHERE id = ? AND status = 'leased' AND worker = ?
+            ''', [(now + self.lease_seconds, now, job_id, self.worker_id) for job_id in job_ids]).rowcount
+
+        return self._immediate(renew)
+
+    def ack(self, job_ids: Sequence[int]) -> int:
+        """
+        Mark jobs done. Jobs this worker no longer holds (their lease ran out
+        and another worker claimed them, or they are already finished) are
+        left alone. Returns how many were marked.
+        """
+        def done(conn):
+            now = time.time()
+            return conn.executemany('''
+                UPDATE vision_jobs SET status = 'done', lease_expires = NULL, updated = ?
+                WHERE id = ? AND status = 'leased' AND worker = ?
+            ''', [(now, job_id, self.worker_id) for job_id in job_ids]).rowcount
+
+        return self._immediate(done)
+
+    def fail(self, job_ids: Sequence[int], error_message: str = None) -> int:
+        """
+        Return jobs to the queue, or give them up once they are out of
+        attempts. Like ack(), only touches jobs this worker still holds.
+        Returns how many were returned or given up.
+        """
+        def requeue(conn):
+            now = time.time()
+            return conn.executemany('''
+                UPDATE vision_jobs
+                SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                    lease_expires = NULL, error_message = ?, updated = ?
+                WHERE id = ? AND status = 'leased' AND worker = ?
+            ''', [(self.max_attempts, error_message, now, job_id, self.worker_id) for job_id in job_ids]).rowcount
+
+        return self._immediate(requeue)
+
+    def release(self, job_ids: Sequence[int]):
+        """Hand unfinished jobs back without counting the attempt (e.g. on shutdown)."""
+        def hand_back(conn):
+            now = time.time()
+            conn.executemany('''
+                UPDATE vision_jobs
+                SET status = 'pending', attempts = MAX(0, attempts - 1), lease_expires = NULL, updated = ?
+                WHERE id = ? AND status = 'leased' AND worker = ?
+            ''', [(now, job_id, self.worker_id) for job_id in job_ids])
+
+        self._immediate(hand_back)
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs per status; leases that ran out are counted as `expired`."""
+        with self._lock:
+            rows = self.conn.execute('''
+                SELECT CASE WHEN status = 'leased' AND lease_expires < ? THEN 'expired' ELSE status END,
+                       COUNT(*)
+                FROM vision_jobs GROUP BY 1
+            ''', (time.time(),)).fetchall()
+        return dict(rows)
+
+    @contextmanager
+    def keep_alive(self, job_ids: Sequence[int], interval: float = None):
+        """Renew the leases on `job_ids` from a background thread while the block runs."""
+        interval = interval if interval is not None else max(1.0, self.lease_seconds / 3)
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(interval):
+                try:
+                    self.heartbeat(job_ids)
+                except sqlite3.Error as e:
+                    logger.warning(f"Could not renew job leases: {str(e)}")
+
+        thread = threading.Thread(target=beat, name="job-heartbeat", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
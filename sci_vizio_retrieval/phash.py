@@ -0,0 +1,127 @@
+import io
+from typing import Any, Iterator, List, Optional, Tuple
+
+from PIL import Image
+
+HASH_BITS = 64
+# Side of the finer hash used to confirm a match (16 x 16 = 256 bits)
+DETAIL_HASH_SIZE = 16
+_SIGN_BIT = 1 << (HASH_BITS - 1)
+_MASK = (1 << HASH_BITS) - 1
+
+
+def dhash(image: Image.Image, size: int = 8) -> int:
+    """
+    Difference hash of an image, `size * size` bits (64 by default).
+
+    The image is reduced to a (size + 1) x size grayscale thumbnail and each
+    bit records whether a pixel is brighter than its right-hand neighbour, so
+    the hash survives re-encoding, rescaling and small crops or colour shifts.
+    """
+    image.draft('L', (size * 8, size * 8))
+    small = image.convert('L').resize((size + 1, size), Image.Resampling.BOX)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def dhash_bytes(data: bytes) -> int:
+    """Difference hash of an encoded image stream."""
+    with Image.open(io.BytesIO(data)) as image:
+        return dhash(image)
+
+
+def dhash_file(path) -> int:
+    """Difference hash of an image file."""
+    with Image.open(path) as image:
+        return dhash(image)
+
+
+def image_signature(path) -> Tuple[int, int, int]:
+    """(width, height, 256-bit difference hash) of an image file, to confirm a 64-bit hash match."""
+    with Image.open(path) as image:
+        # Read the size first: draft mode shrinks JPEGs while hashing
+        width, height = image.size
+        return width, height, dhash(image, DETAIL_HASH_SIZE)
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def to_db(value: int) -> int:
+    """Fold an unsigned 64-bit hash into SQLite's signed INTEGER range."""
+    return value - (1 << HASH_BITS) if value & _SIGN_BIT else value
+
+
+def from_db(value: int) -> int:
+    return value & _MASK
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over 64-bit hashes under the Hamming distance.
+
+    A radius-r query only descends into children whose edge distance lies
+    within r of the query's distance to the node, so lookups with small
+    thresholds visit a small fraction of the tree. Each node holds every
+    item added with its exact hash.
+    """
+
+    def __init__(self):
+        # Node: [hash, items, {distance: child}]
+        self._root: Optional[list] = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, value: int, item: Any):
+        self._size += 1
+        if self._root is None:
+            self._root = [value, [item], {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, Any]]:
+        """All (distance, item) pairs within `max_distance` of `value`, nearest first."""
+        matches = []
+        for distance, items in self._walk(value, max_distance):
+            matches.extend((distance, item) for item in items)
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+    def _walk(self, value: int, max_distance: int) -> Iterator[Tuple[int, List]]:
+        if self._root is None:
+            return
+        pending = [self._root]
+        while pending:
+            node = pending.pop()
+            distance = hamming(value, node[0])
+            if distance <= max_distance:
+                yield distance, node[1]
+            for edge, child in node[2].items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    pending.append(child)
+
+    @classmethod
+    def from_pairs(cls, pairs) -> "BKTree":
+        tree = cls()
+        for value, item in pairs:
+            tree.add(value, item)
+        return tree
+
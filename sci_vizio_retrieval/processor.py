@@ -1,26 +1,42 @@
-import os
-import time
-import sqlite3
+import asyncio
 import json
 import logging
 import re
+import time
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, Tuple
 from tqdm import tqdm
-from PIL import Image
 import numpy as np
-import torch
-from torchvision import transforms
-from torchvision.models import resnet50, ResNet50_Weights
 
-from sci_vizio_retrieval.client import OpenRouterVision
+from sci_vizio_retrieval.analysis import ANALYSIS_SCHEMA, BATCH_SCHEMA, parse_analysis, parse_batch_response
+from sci_vizio_retrieval.cache import ResponseCache
+from sci_vizio_retrieval.cascade import ModelCascade
+from sci_vizio_retrieval.client import AsyncOpenRouterVision, OpenRouterVision, VisionResponse
 from sci_vizio_retrieval.config import (
     VISION_MODEL,
+    VISION_INCLUDE_CONTEXT,
+    VISION_MAX_CONCURRENCY,
+    VISION_BATCH_SIZE,
+    VISION_VALIDATION_RETRIES,
+    EMBEDDING_ENABLED,
+    NEAR_DUPLICATES_ENABLED,
+    NEAR_DUPLICATES_MAX_DISTANCE,
+    NEAR_DUPLICATES_DETAIL_MAX_DISTANCE,
+    NEAR_DUPLICATES_MAX_ASPECT_DIFFERENCE,
+    QUEUE_CLAIM_SIZE,
+    QUEUE_POLL_INTERVAL,
     DB_PATH,
     get_images_dir,
     get_analysis_dir,
+    get_upload_cache_dir,
+    get_vision_image,
 )
+from sci_vizio_retrieval.jobqueue import JobQueue
+from sci_vizio_retrieval.phash import BKTree, dhash_file, from_db, hamming, image_signature, to_db
+from sci_vizio_retrieval.ratelimit import get_rate_limiter
+from sci_vizio_retrieval.store import get_store
+from sci_vizio_retrieval.vectors import EmbeddingMatrix
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +45,32 @@ def sanitize_filename(filename: str) -> str:
     return re.sub(r'[<>:"/\\|?*]', '_', filename)
 
 
+def build_prompt(prompt: str, context: Optional[Dict]) -> str:
+    """Append the paper context of an image, if any, to the analysis prompt."""
+    if not context or not (context['caption'] or context['context']):
+        return prompt
+    parts = [prompt, "Context from the paper the image comes from (use it to interpret the image, but describe what the image shows):"]
+    if context['caption']:
+        parts.append(f"Caption: {context['caption']}")
+    if context['context']:
+        parts.append(f"Surrounding text:\n{context['context']}")
+    return "\n".join(parts)
+
+
+def build_batch_prompt(prompt: str, contexts: List[Optional[Dict]]) -> str:
+    """Append the paper context of each image of a batched request, labelled by image index."""
+    parts = [prompt]
+    for index, context in enumerate(contexts, 1):
+        if not context or not (context['caption'] or context['context']):
+            continue
+        parts.append(f"Context from the paper for Image {index} (use it to interpret the image, but describe what the image shows):")
+        if context['caption']:
+            parts.append(f"Caption: {context['caption']}")
+        if context['context']:
+            parts.append(f"Surrounding text:\n{context['context']}")
+    return "\n".join(parts)
+
+
 class ImageProcessor:
     USER_PROMPT = """You will be provided with an image. 
     Your response should contain as much information as possible from this diagram. 
@@ -43,7 +85,23 @@ class ImageProcessor:
     Do NOT suffix with any extra text, finish with the json object, i.e. the last character should be }
     """
 
-    def __init__(self, model: str = None, images_dir: str = None, output_dir: str = None, db_path: str = None):
+    BATCH_PROMPT = """You will be provided with {count} images from the same paper, labelled Image 1 to Image {count}.
+    For each image, give as much information as possible from it:
+    a description of what type of image it is (e.g. diagram, graph, flowchart, etc.)
+    and the data that comprises it.
+    The response should be a valid JSON object as a string, with a single attribute "analyses":
+    an array with exactly one JSON object per image.
+    Each object should necessarily have the following attributes:
+    image_index (the number of the image it describes), image_type, title, description
+    But also if applicable the following:
+    time_period, x-axis, y-axis, sources, sections, labels, ticks, key patterns
+    Begin immediately with outputting the JSON object, do NOT prefix with any extra text, i.e. the first character should be {{
+    Do NOT suffix with any extra text, finish with the JSON object, i.e. the last character should be }}
+    """
+
+    def __init__(self, model: str = None, images_dir: str = None, output_dir: str = None, db_path: str = None,
+                 concurrency: int = None, embeddings: bool = None, batch_size: int = None, stream: bool = None,
+                 cascade: List[str] = None):
         """
         Initialize the image processor.
 
@@ -52,26 +110,50 @@ class ImageProcessor:
             images_dir (str): Directory containing extracted images. If None, loaded from config.ini.
             output_dir (str): Directory to store processing results. If None, loaded from config.ini.
             db_path (str): Path to SQLite database. If None, loaded from config.ini.
+            concurrency (int): Vision requests kept in flight by process_directory. If None, loaded from config.ini.
+            embeddings (bool): Compute ResNet50 image embeddings. If None, loaded from config.ini.
+            batch_size (int): Images of the same PDF sent in one vision request. If None, loaded from config.ini.
+            stream (bool): Stream vision responses and stop once the JSON is complete. If None, loaded from config.ini.
+            cascade (List[str]): Models to escalate through, cheapest first; empty means `model` alone.
+                If None, loaded from config.ini.
         """
         self.images_dir = Path(images_dir if images_dir is not None else get_images_dir())
         self.output_dir = Path(output_dir if output_dir is not None else get_analysis_dir())
         self.db_path = db_path or DB_PATH
+        self.store = get_store(self.db_path)
+        self.model_name = model
+        self.concurrency = max(1, concurrency if concurrency is not None else VISION_MAX_CONCURRENCY)
+        self.batch_size = max(1, batch_size if batch_size is not None else VISION_BATCH_SIZE)
+        self.validation_retries = max(0, VISION_VALIDATION_RETRIES)
 
-        self.vision_api = OpenRouterVision(model=model)
+        # Prepared uploads are cached beside the analyses, under the same output directory
+        self.upload_cache_dir = get_upload_cache_dir(self.output_dir.parent)
 
-        # Initialize image embedding model
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.model = resnet50(weights=ResNet50_Weights.DEFAULT)
-        self.model = torch.nn.Sequential(*(list(self.model.children())[:-1]))
-        self.model.to(self.device)
-        self.model.eval()
-        
-        self.transform = transforms.Compose([
-            transforms.Resize(256),
-            transforms.CenterCrop(224),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-        ])
+        self.cascade = ModelCascade(models=cascade, default_model=model)
+        rate_limiter = get_rate_limiter(self.db_path)
+        self.vision_apis = [
+            OpenRouterVision(model=name, rate_limiter=rate_limiter, upload_cache_dir=self.upload_cache_dir,
+                             stream=stream)
+            for name in self.cascade.models
+        ]
+        # The cheapest model, which also answers batched requests
+        self.vision_api = self.vision_apis[0]
+        self.cache = ResponseCache(db_path=self.db_path)
+
+        # The embedding model is only loaded when the first image needs it
+        self.embeddings_enabled = embeddings if embeddings is not None else EMBEDDING_ENABLED
+        self._embedder = None
+        # Embeddings computed in bulk ahead of processing, keyed by image path
+        # (None marks images that could not be embedded)
+        self._embeddings: Dict[str, Optional[np.ndarray]] = {}
+        self.matrix = EmbeddingMatrix(db_path=self.db_path)
+
+        self.near_duplicates_enabled = NEAR_DUPLICATES_ENABLED
+        self.near_duplicate_distance = NEAR_DUPLICATES_MAX_DISTANCE
+        self.near_duplicate_detail_distance = NEAR_DUPLICATES_DETAIL_MAX_DISTANCE
+        self.near_duplicate_aspect_difference = NEAR_DUPLICATES_MAX_ASPECT_DIFFERENCE
+        # Perceptual hashes of analysed images, built on first lookup
+        self._phash_tree = None
         
         # Initialize database
         self._init_database()
@@ -81,7 +163,7 @@ class ImageProcessor:
 
     def _init_database(self):
         """Initialize SQLite database with image processing table."""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.store.transaction() as conn:
             cur = conn.cursor()
             cur.execute('''
                 CREATE TABLE IF NOT EXISTS image_processing (
@@ -97,68 +179,141 @@ class ImageProcessor:
                     embedding BLOB
                 )
             ''')
-            conn.commit()
+            cur.execute('''
+                CREATE INDEX IF NOT EXISTS idx_image_processing_path 
+                ON image_processing(image_path, pdf_file)
+            ''')
+        # Model that produced each embedding, so stale vectors can be backfilled
+        self.store.add_column('image_processing', 'embedding_model', 'TEXT')
+        # Perceptual hash, and the row whose analysis was reused for a near-duplicate
+        self.store.add_column('image_processing', 'phash', 'INTEGER')
+        self.store.add_column('image_processing', 'near_duplicate_of', 'INTEGER')
+        self.store.add_column('image_processing', 'near_duplicate_distance', 'INTEGER')
+        # Vision request timings (time to first streamed token, total latency)
+        self.store.add_column('image_processing', 'ttfb_ms', 'REAL')
+        self.store.add_column('image_processing', 'latency_ms', 'REAL')
+        # Validated (and, if needed, locally repaired) analysis parsed from the response
+        self.store.add_column('image_processing', 'analysis', 'TEXT')
+        # Model whose answer was kept (the cascade tier that answered)
+        self.store.add_column('image_processing', 'model', 'TEXT')
+
+    @property
+    def embedder(self):
+        """ResNet50 embedder, built (and torch imported) on first use."""
+        if self._embedder is None:
+            from sci_vizio_retrieval.embedder import ImageEmbedder
+            self._embedder = ImageEmbedder(db_path=self.db_path)
+        return self._embedder
 
     def get_image_embedding(self, image_path: str | Path) -> Optional[np.ndarray]:
-        """Generate embedding for an image."""
+        """Generate embedding for an image (None when embeddings are disabled)."""
+        if not self.embeddings_enabled:
+            return None
+        return self.embedder.embed(image_path)
+
+    def _embed_images(self, image_paths: List[Path]):
+        """Embed a group of images in bulk ahead of their vision requests."""
+        if not self.embeddings_enabled or not image_paths:
+            return
+        vision_inputs = [get_vision_image(p) for p in image_paths]
+        embeddings = self.embedder.embed_many(vision_inputs)
+        for path, embedding in zip(image_paths, embeddings):
+            self._embeddings[str(path)] = None if np.isnan(embedding).any() else embedding
+
+    def _image_phash(self, image_path: Path, content_hash: str) -> Optional[int]:
+        """Perceptual hash recorded at extraction time, or computed from the file."""
+        if self.store.table_exists('image_phash'):
+            row = self.store.fetchone("SELECT phash FROM image_phash WHERE content_hash = ?", (content_hash,))
+            if row is not None:
+                return from_db(row[0])
         try:
-            image = Image.open(image_path).convert('RGB')
-            image_tensor = self.transform(image).unsqueeze(0).to(self.device)
-            
-            with torch.no_grad():
-                embedding = self.model(image_tensor)
-                embedding = embedding.squeeze().cpu().numpy()
-                
-            return embedding / np.linalg.norm(embedding)
-            
+            return dhash_file(image_path)
         except Exception as e:
-            logger.error(f"Error generating embedding for {image_path}: {str(e)}")
+            logger.warning(f"Could not compute perceptual hash of {image_path}: {str(e)}")
             return None
 
+    @property
+    def phash_tree(self) -> BKTree:
+        """BK-tree of the perceptual hashes of successfully analysed images, keyed to their row ids."""
+        if self._phash_tree is None:
+            rows = self.store.fetchall('''
+                SELECT id, phash FROM image_processing
+                WHERE success_status AND phash IS NOT NULL AND near_duplicate_of IS NULL
+            ''')
+            self._phash_tree = BKTree.from_pairs((from_db(phash), row_id) for row_id, phash in rows)
+        return self._phash_tree
+
+    def unfinished_pdf_names(self) -> List[str]:
+        """
+        Names of PDFs with an extracted image that has no recorded result,
+        found from the image store without walking the image directories.
+        """
+        if not self.store.table_exists('image_store'):
+            return []
+        recorded = set(self.store.fetchall("SELECT pdf_file, image FROM image_processing"))
+        names = set()
+        for (image_path,) in self.store.fetchall("SELECT image_path FROM image_store"):
+            image_path = Path(image_path)
+            if (image_path.parent.name, image_path.name) not in recorded:
+                names.add(image_path.parent.name)
+        return sorted(names)
+
+    def get_near_duplicate_links(self, pdf_file: str = None) -> List[Dict]:
+        """List images whose analysis was reused from a near-duplicate, with the source of each."""
+        query = '''
+            SELECT p.id, p.pdf_file, p.image_path, p.near_duplicate_distance AS distance,
+                   s.id AS source_id, s.pdf_file AS source_pdf_file, s.image_path AS source_image_path
+            FROM image_processing p
+            JOIN image_processing s ON s.id = p.near_duplicate_of
+        '''
+        if pdf_file is None:
+            return self.store.fetchall_dicts(query + " ORDER BY p.id")
+        return self.store.fetchall_dicts(query + " WHERE p.pdf_file = ? ORDER BY p.id", (pdf_file,))
+
     def _check_image_processed(self, image_path: str, pdf_file: str) -> Optional[Dict]:
         """Check if image has already been processed by looking up in the database."""
-        with sqlite3.connect(self.db_path) as conn:
-            cur = conn.cursor()
-            cur.execute('''
-                SELECT pdf_file, timestamp, image, image_path, success_status, 
-                       response_status_code, response, error_message, embedding
-                FROM image_processing
-                WHERE image_path = ? AND pdf_file = ?
-            ''', (str(image_path), pdf_file))
-            
-            row = cur.fetchone()
-            if row:
-                return {
-                    'pdf_file': row[0],
-                    'timestamp': row[1],
-                    'image': row[2],
-                    'image_path': row[3],
-                    'success_status': row[4],
-                    'response_status_code': row[5],
-                    'response': row[6],
-                    'error_message': row[7],
-                    'embedding': row[8]
-                }
-            return None
-    
-    def process_image(self, image_path: Path, pdf_file: str) -> Dict:
-        """Process a single image using the OpenRouter Vision API."""
-        cached_result = self._check_image_processed(str(image_path), pdf_file)
-        if cached_result:
-            logger.info(f"Using cached result for {image_path}")
-            
-            if cached_result['success_status']:
-                pdf_subdir = sanitize_filename(pdf_file)
-                output_subdir = self.output_dir / pdf_subdir
-                output_subdir.mkdir(exist_ok=True)
-                output_file = output_subdir / f"{image_path.stem}_analysis.json"
-                
-                if not output_file.exists() and cached_result['response']:
-                    with open(output_file, 'w', encoding='utf-8') as f:
-                        f.write(cached_result['response'])
-            
-            return cached_result
+        row = self.store.fetchone('''
+            SELECT pdf_file, timestamp, image, image_path, success_status, 
+                   response_status_code, response, error_message, embedding
+            FROM image_processing
+            WHERE image_path = ? AND pdf_file = ?
+        ''', (str(image_path), pdf_file))
+        
+        if row:
+            return {
+                'pdf_file': row[0],
+                'timestamp': row[1],
+                'image': row[2],
+                'image_path': row[3],
+                'success_status': row[4],
+                'response_status_code': row[5],
+                'response': row[6],
+                'error_message': row[7],
+                'embedding': row[8]
+            }
+        return None
     
+    def _write_analysis(self, pdf_file: str, image_path: Path, content: str):
+        pdf_subdir = sanitize_filename(pdf_file)
+        output_subdir = self.output_dir / pdf_subdir
+        output_subdir.mkdir(exist_ok=True)
+        output_file = output_subdir / f"{image_path.stem}_analysis.json"
+        with open(output_file, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    def _use_cached(self, image_path: Path, pdf_file: str, cached_result: Dict) -> Dict:
+        logger.info(f"Using cached result for {image_path}")
+        if cached_result['success_status'] and cached_result['response']:
+            output_file = self.output_dir / sanitize_filename(pdf_file) / f"{image_path.stem}_analysis.json"
+            if not output_file.exists():
+                self._write_analysis(pdf_file, image_path, cached_result['response'])
+        return cached_result
+
+    def _prepare_image(self, image_path: Path, pdf_file: str):
+        """
+        Build the result record for a new image, compute its embedding, its
+        prompt and its response cache key. Returns (result, vision_input, prompt, cache_key).
+        """
         result = {
             'pdf_file': pdf_file,
             'timestamp': datetime.now().isoformat(),
@@ -170,56 +325,430 @@ class ImageProcessor:
             'error_message': None,
             'embedding': None
         }
-        
+
         logger.info(f"Processing image: {image_path} of PDF: {pdf_file}")
 
+        vision_input = get_vision_image(image_path)
+        if str(image_path) in self._embeddings:
+            embedding = self._embeddings.pop(str(image_path))
+        else:
+            embedding = self.get_image_embedding(vision_input)
+        if embedding is not None:
+            result['embedding'] = embedding.tobytes()
+            result['embedding_model'] = self.embedder.model_version
+
+        prompt = self.USER_PROMPT
+        if VISION_INCLUDE_CONTEXT:
+            prompt = build_prompt(prompt, self.store.get_image_context(pdf_file, image_path.name))
+        cache_key = self.cache.make_key(image_path, self.cascade.cache_model, prompt)
+        result['phash'] = self._image_phash(image_path, cache_key[0])
+        return result, vision_input, prompt, cache_key
+
+    def _serve_cached(self, result: Dict, image_path: Path, cache_key) -> Optional[Dict]:
+        """Complete an image from the response cache; returns None on a miss."""
+        content = self.cache.get(cache_key)
+        if content is not None and parse_analysis(content)[0] is None:
+            content = None
+        result['cache_hit'] = content is not None
+        if content is None:
+            return None
+        logger.info(f"Serving {image_path} from the vision response cache")
+        return self._finish_image(result, image_path, response=VisionResponse(text=content))
+
+    def _matches_in_detail(self, signature, source_path: str) -> bool:
+        """
+        Confirm a perceptual-hash match against the source image: the aspect
+        ratios must agree and the 256-bit detail hashes must be close.
+        """
         try:
-            # Generate embedding
-            embedding = self.get_image_embedding(image_path)
-            if embedding is not None:
-                result['embedding'] = embedding.tobytes()
+            source_width, source_height, source_detail = image_signature(source_path)
+        except Exception as e:
+            logger.warning(f"Could not compare with near-duplicate candidate {source_path}: {str(e)}")
+            return False
+        width, height, detail = signature
+        aspect, source_aspect = width / height, source_width / source_height
+        if abs(aspect - source_aspect) > self.near_duplicate_aspect_difference * max(aspect, source_aspect):
+            return False
+        return hamming(detail, source_detail) <= self.near_duplicate_detail_distance
 
-            response = None
+    def _serve_near_duplicate(self, result: Dict, image_path: Path) -> Optional[Dict]:
+        """
+        Complete an image with the analysis of the nearest already analysed
+        image of another PDF within the Hamming threshold, confirmed by
+        _matches_in_detail; returns None if there is none.
+        """
+        if not self.near_duplicates_enabled or result.get('phash') is None:
+            return None
+        signature = None
+        for distance, source_id in self.phash_tree.search(result['phash'], self.near_duplicate_distance):
+            row = self.store.fetchone(
+                "SELECT response, image_path, model, pdf_file FROM image_processing WHERE id = ? AND success_status",
+                (source_id,)
+            )
+            # Figures of one paper often share a layout; never reuse within a PDF
+            if row is None or row[3] == result['pdf_file'] or parse_analysis(row[0])[0] is None:
+                continue
+            if signature is None:
+                try:
+                    signature = image_signature(image_path)
+                except Exception as e:
+                    logger.warning(f"Could not compute detail hash of {image_path}: {str(e)}")
+                    return None
+            if not self._matches_in_detail(signature, row[1]):
+                continue
+            logger.info(f"Reusing the analysis of near-duplicate {row[1]} (distance {distance}) for {image_path}")
+            result['near_duplicate_of'] = source_id
+            result['near_duplicate_distance'] = distance
+            result['model'] = row[2]
+            return self._finish_image(result, image_path, response=VisionResponse(text=row[0]))
+        return None
+
+    def _cache_response(self, result: Dict, cache_key):
+        if result['success_status']:
+            self.cache.put(cache_key, result['response'], self.USER_PROMPT)
+
+    def _finish_image(self, result: Dict, image_path: Path, response=None, error: Exception = None) -> Dict:
+        """
+        Record the vision response (or failure) for an image and store the result.
+
+        The response is validated here; a repairable one is stored with its
+        parsed analysis, anything else is recorded as failed.
+        """
+        try:
+            if error is not None:
+                logger.error(f"Failed to get response: {str(error)}")
+                result["response_status_code"] = 500
+                result['error_message'] = f"Vision API call failed: {str(error)}"
+            elif response is not None:
+                result["response_status_code"] = 200
+                if response.latency is not None:
+                    result['latency_ms'] = round(response.latency * 1000, 1)
+                if response.ttfb is not None:
+                    result['ttfb_ms'] = round(response.ttfb * 1000, 1)
+                result['response'] = response.text
+                analysis, invalid, result['repaired'] = parse_analysis(response.text)
+                if analysis is None:
+                    result['error_message'] = f"Invalid analysis: {invalid}"
+                else:
+                    result['analysis'] = json.dumps(analysis, ensure_ascii=False)
+                    self._write_analysis(result['pdf_file'], image_path, result['analysis'])
+                    result['success_status'] = True
+        except Exception as e:
+            result['error_message'] = str(e)
+            logger.error(f"Error processing {image_path}: {str(e)}")
+
+        self.store_result(result)
+        return result
+
+    def process_image(self, image_path: Path, pdf_file: str) -> Dict:
+        """Process a single image using the OpenRouter Vision API."""
+        cached_result = self._check_image_processed(str(image_path), pdf_file)
+        if cached_result:
+            return self._use_cached(image_path, pdf_file, cached_result)
+
+        try:
+            result, vision_input, prompt, cache_key = self._prepare_image(image_path, pdf_file)
+        except Exception as e:
+            logger.error(f"Error processing {image_path}: {str(e)}")
+            return self._failed_result(image_path, pdf_file, e)
+
+        cached = self._serve_cached(result, image_path, cache_key) or self._serve_near_duplicate(result, image_path)
+        if cached is not None:
+            return cached
+        return self._analyze_single(result, image_path, vision_input, prompt, cache_key)
+
+    def _analyze_single(self, result: Dict, image_path: Path, vision_input: Path, prompt: str, cache_key) -> Dict:
+        """
+        Ask the cascade's models about one image, from the tier chosen for it
+        upwards, until one gives a usable answer. The last model is asked
+        again (up to validation_retries) if its answer cannot be repaired.
+        """
+        response = error = fallback = None
+        for tier in range(self._start_tier(result, image_path), len(self.vision_apis)):
+            vision_api = self.vision_apis[tier]
+            for attempt in range(1 + self._reasks(tier)):
+                try:
+                    response, error = vision_api.analyze_image(vision_input, prompt, ANALYSIS_SCHEMA), None
+                except Exception as e:
+                    response, error = None, e
+                    break
+                self.cascade.record_request(vision_api.model, response)
+                if not self._should_reask(response, image_path, attempt, self._reasks(tier)):
+                    break
+            fallback = self._fallback(fallback, tier, response)
+            if not self._escalate(image_path, tier, response, error):
+                break
+        return self._complete_single(result, image_path, cache_key, tier, response, error, fallback)
+
+    def _start_tier(self, result: Dict, image_path: Path) -> int:
+        """Cascade tier an image starts at, measured once per image."""
+        if 'cascade_tier' not in result:
+            result['cascade_tier'] = self.cascade.start_tier(image_path)
+        return result['cascade_tier']
+
+    def _reasks(self, tier: int) -> int:
+        """Models below the top of the cascade are escalated from instead of asked again."""
+        return self.validation_retries if tier == len(self.vision_apis) - 1 else 0
+
+    def _escalate(self, image_path: Path, tier: int, response: Optional[VisionResponse],
+                  error: Optional[Exception]) -> bool:
+        """True if the answer (or failure) of a tier sends the image up to the next model."""
+        if tier + 1 >= len(self.cascade):
+            return False
+        model = self.cascade.models[tier]
+        reason = f"request failed: {str(error)}" if error is not None else self.cascade.escalation_reason(response.text)
+        if reason is None:
+            return False
+        logger.info(f"Escalating {image_path} from {model} to {self.cascade.models[tier + 1]} ({reason})")
+        self.cascade.record_outcome(model, 'escalated')
+        return True
+
+    @staticmethod
+    def _fallback(fallback: Optional[Tuple[int, VisionResponse]], tier: int,
+                  response: Optional[VisionResponse]) -> Optional[Tuple[int, VisionResponse]]:
+        """Keep the first valid (if incomplete) answer, in case the stronger models do worse."""
+        if fallback is None and response is not None and parse_analysis(response.text)[0] is not None:
+            return tier, response
+        return fallback
+
+    def _complete_single(self, result: Dict, image_path: Path, cache_key, tier: int,
+                         response: Optional[VisionResponse], error: Optional[Exception],
+                         fallback: Optional[Tuple[int, VisionResponse]]) -> Dict:
+        """Store the answer of the last tier asked, or an earlier valid one if that tier failed."""
+        if fallback is not None and fallback[0] != tier and (
+                response is None or parse_analysis(response.text)[0] is None):
+            logger.info(f"Keeping the answer of {self.cascade.models[fallback[0]]} for {image_path}")
+            self.cascade.record_outcome(self.cascade.models[tier], 'failed')
+            (tier, response), error = fallback, None
+        model = self.cascade.models[tier]
+        result['model'] = model
+        if response is None:
+            self.cascade.record_outcome(model, 'failed')
+            return self._finish_image(result, image_path, error=error)
+        result = self._finish_image(result, image_path, response=response)
+        self.cascade.record_outcome(model, 'answered' if result['success_status'] else 'failed')
+        self._cache_response(result, cache_key)
+        return result
+
+    def _should_reask(self, response: VisionResponse, image_path: Path, attempt: int, retries: int) -> bool:
+        """True if a response is invalid even after local repair and another paid request is allowed."""
+        if attempt >= retries:
+            return False
+        _, invalid, _ = parse_analysis(response.text)
+        if invalid is None:
+            return False
+        logger.warning(f"Invalid analysis for {image_path} ({invalid}); asking the model again")
+        return True
+
+    def _batch_prompt(self, pdf_file: str, image_paths: List[Path]) -> str:
+        prompt = self.BATCH_PROMPT.format(count=len(image_paths))
+        if not VISION_INCLUDE_CONTEXT:
+            return prompt
+        return build_batch_prompt(prompt, [self.store.get_image_context(pdf_file, p.name) for p in image_paths])
+
+    def _apply_batch(self, pending: List[tuple], response: VisionResponse):
+        """
+        Finish the pending images answered by a batched response. Each
+        image is recorded with the timings of the shared request. Answers
+        the cascade would escalate are left for the next model.
+
+        Returns:
+            (unanswered pending entries, finished results)
+        """
+        model = self.vision_api.model
+        self.cascade.record_request(model, response)
+        try:
+            analyses = parse_batch_response(response.text, len(pending))
+        except ValueError as e:
+            logger.warning(f"Malformed batched response ({str(e)}); falling back to single-image requests")
+            return pending, []
+
+        leftover, finished = [], []
+        for index, (result, image_path, _, _, cache_key) in enumerate(pending):
+            if index not in analyses:
+                leftover.append(pending[index])
+                continue
+            content = json.dumps(analyses[index], ensure_ascii=False)
+            if len(self.cascade) > 1:
+                reason = self.cascade.escalation_reason(content)
+                if reason is not None:
+                    logger.info(f"Escalating {image_path} from {model} to {self.cascade.models[1]} ({reason})")
+                    self.cascade.record_outcome(model, 'escalated')
+                    result['cascade_tier'] = 1
+                    leftover.append(pending[index])
+                    continue
+            result['batched'] = True
+            result['model'] = model
+            result = self._finish_image(
+                result, image_path, response=VisionResponse(text=content, ttfb=response.ttfb, latency=response.latency)
+            )
+            self.cascade.record_outcome(model, 'answered' if result['success_status'] else 'failed')
+            self._cache_response(result, cache_key)
+            finished.append(result)
+        if leftover:
+            logger.warning(f"{len(leftover)} of {len(pending)} images missing from the batched response; "
+                           f"sending them one by one")
+        return leftover, finished
+
+    def process_batch(self, image_paths: List[Path], pdf_file: str) -> List[Dict]:
+        """
+        Process several images of one PDF with a single multi-image request.
+
+        Images served from the response cache or by a near-duplicate are left
+        out of the request. The model answers with a JSON array keyed by image
+        index, which is split back into one result per image; images the
+        response does not cover (or all of them, if it is malformed or the
+        request fails) are sent again one by one.
+
+        Batches go to the cheapest cascade model. Images that skip it on
+        complexity, or whose batched answer it would escalate, continue
+        through the cascade one by one.
+        """
+        results, pending = [], []
+        for image_path in image_paths:
             try:
-                response = self.vision_api.analyze_image(image_path, self.USER_PROMPT)
-                status = 200
+                result, vision_input, prompt, cache_key = self._prepare_image(image_path, pdf_file)
             except Exception as e:
-                logger.error(f"Failed to get response: {str(e)}")
-                status = 500
-                result['error_message'] = f"Vision API call failed: {str(e)}"
+                logger.error(f"Error processing {image_path}: {str(e)}")
+                results.append(self._failed_result(image_path, pdf_file, e))
+                continue
+            cached = self._serve_cached(result, image_path, cache_key) or self._serve_near_duplicate(result, image_path)
+            if cached is not None:
+                results.append(cached)
+            else:
+                pending.append((result, image_path, vision_input, prompt, cache_key))
+                self._start_tier(result, image_path)
 
-            result["response_status_code"] = status
+        pending, escalated = self._split_batchable(pending)
+        if len(pending) > 1:
+            response = None
+            try:
+                response = self.vision_api.analyze_images(
+                    [item[2] for item in pending], self._batch_prompt(pdf_file, [item[1] for item in pending]),
+                    BATCH_SCHEMA
+                )
+            except Exception as e:
+                logger.warning(f"Batched request failed ({str(e)}); falling back to single-image requests")
+            if response is not None:
+                pending, finished = self._apply_batch(pending, response)
+                results.extend(finished)
 
-            if status == 200 and response is not None:
-                content = response.text
-                pdf_subdir = sanitize_filename(pdf_file)
-                output_subdir = self.output_dir / pdf_subdir
-                output_subdir.mkdir(exist_ok=True)
+        results.extend(self._analyze_single(*item) for item in pending + escalated)
+        return results
 
-                output_file = output_subdir / f"{image_path.stem}_analysis.json"
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    f.write(content)
+    @staticmethod
+    def _split_batchable(pending: List[tuple]) -> Tuple[List[tuple], List[tuple]]:
+        """Split pending entries into those for the cheapest model and those starting higher up."""
+        batchable = [item for item in pending if item[0].get('cascade_tier', 0) == 0]
+        return batchable, [item for item in pending if item[0].get('cascade_tier', 0) > 0]
 
-                result['success_status'] = True
-                result['response'] = content
-            elif status != 200:
-                result['error_message'] = f"API request failed with status {status}"
+    async def process_image_async(self, vision_apis: List[AsyncOpenRouterVision], image_path: Path,
+                                  pdf_file: str) -> Dict:
+        """
+        Process a single image with async vision clients, one per cascade model.
 
+        The embedding is computed in a worker thread; the database lookup and
+        the result write run on the event loop thread, as in process_image.
+        """
+        try:
+            result, vision_input, prompt, cache_key = await asyncio.to_thread(self._prepare_image, image_path, pdf_file)
         except Exception as e:
-            result['error_message'] = str(e)
             logger.error(f"Error processing {image_path}: {str(e)}")
+            return self._failed_result(image_path, pdf_file, e)
+
+        cached = self._serve_cached(result, image_path, cache_key) or self._serve_near_duplicate(result, image_path)
+        if cached is not None:
+            return cached
+        return await self._analyze_single_async(vision_apis, result, image_path, vision_input, prompt, cache_key)
+
+    async def _analyze_single_async(self, vision_apis: List[AsyncOpenRouterVision], result: Dict, image_path: Path,
+                                    vision_input: Path, prompt: str, cache_key) -> Dict:
+        if 'cascade_tier' not in result:
+            result['cascade_tier'] = await asyncio.to_thread(self.cascade.start_tier, image_path)
+        response = error = fallback = None
+        for tier in range(result['cascade_tier'], len(vision_apis)):
+            vision_api = vision_apis[tier]
+            for attempt in range(1 + self._reasks(tier)):
+                try:
+                    response, error = await vision_api.analyze_image(vision_input, prompt, ANALYSIS_SCHEMA), None
+                except Exception as e:
+                    response, error = None, e
+                    break
+                self.cascade.record_request(vision_api.model, response)
+                if not self._should_reask(response, image_path, attempt, self._reasks(tier)):
+                    break
+            fallback = self._fallback(fallback, tier, response)
+            if not self._escalate(image_path, tier, response, error):
+                break
+        return self._complete_single(result, image_path, cache_key, tier, response, error, fallback)
 
+    async def process_batch_async(self, vision_apis: List[AsyncOpenRouterVision], image_paths: List[Path],
+                                  pdf_file: str) -> List[Dict]:
+        """Async variant of process_batch; results are written on the event loop thread."""
+        results, pending = [], []
+        for image_path in image_paths:
+            try:
+                result, vision_input, prompt, cache_key = await asyncio.to_thread(
+                    self._prepare_image, image_path, pdf_file
+                )
+            except Exception as e:
+                logger.error(f"Error processing {image_path}: {str(e)}")
+                results.append(self._failed_result(image_path, pdf_file, e))
+                continue
+            cached = self._serve_cached(result, image_path, cache_key) or self._serve_near_duplicate(result, image_path)
+            if cached is not None:
+                results.append(cached)
+            else:
+                pending.append((result, image_path, vision_input, prompt, cache_key))
+                await asyncio.to_thread(self._start_tier, result, image_path)
+
+        pending, escalated = self._split_batchable(pending)
+        if len(pending) > 1:
+            response = None
+            try:
+                prompt = await asyncio.to_thread(self._batch_prompt, pdf_file, [item[1] for item in pending])
+                response = await vision_apis[0].analyze_images([item[2] for item in pending], prompt, BATCH_SCHEMA)
+            except Exception as e:
+                logger.warning(f"Batched request failed ({str(e)}); falling back to single-image requests")
+            if response is not None:
+                pending, finished = self._apply_batch(pending, response)
+                results.extend(finished)
+
+        for item in pending + escalated:
+            results.append(await self._analyze_single_async(vision_apis, *item))
+        return results
+
+    def _failed_result(self, image_path: Path, pdf_file: str, error: Exception) -> Dict:
+        result = {
+            'pdf_file': pdf_file,
+            'timestamp': datetime.now().isoformat(),
+            'image': image_path.name,
+            'image_path': str(image_path),
+            'success_status': False,
+            'response_status_code': None,
+            'response': None,
+            'error_message': str(error),
+            'embedding': None
+        }
         self.store_result(result)
         return result
 
     def store_result(self, result: Dict):
-        """Store processing result in database."""
-        with sqlite3.connect(self.db_path) as conn:
-            cur = conn.cursor()
-            cur.execute('''
+        """
+        Store processing result in database.
+
+        The embedding goes to the memory-mapped embedding matrix rather than
+        the `embedding` BLOB column, which is left NULL. Successful original
+        analyses join the near-duplicate index.
+        """
+        phash = result.get('phash')
+        with self.store.batch():
+            cursor = self.store.write('''
                 INSERT INTO image_processing 
-                (pdf_file, timestamp, image, image_path, success_status, response_status_code, response, error_message, embedding)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                (pdf_file, timestamp, image, image_path, success_status, response_status_code, response, error_message, embedding,
+                 embedding_model, phash, near_duplicate_of, near_duplicate_distance, ttfb_ms, latency_ms, analysis,
+                 model)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
                 result['pdf_file'],
                 result['timestamp'],
@@ -229,58 +758,264 @@ class ImageProcessor:
                 result['response_status_code'],
                 result['response'],
                 result['error_message'],
-                result['embedding']
+                None,
+                result.get('embedding_model'),
+                to_db(phash) if phash is not None else None,
+                result.get('near_duplicate_of'),
+                result.get('near_duplicate_distance'),
+                result.get('ttfb_ms'),
+                result.get('latency_ms'),
+                result.get('analysis'),
+                result.get('model')
             ))
-            conn.commit()
-
-    def process_directory(self, pdf_names: List[str] = None) -> Dict:
-        """Process images in the images directory."""
-        stats = {
-            'total_images': 0,
-            'successful': 0,
-            'failed': 0,
-            'cached': 0
-        }
-        
-        if not self.images_dir.exists():
-            logger.warning(f"Images directory {self.images_dir} does not exist.")
-            return stats
+            if result['embedding'] is not None:
+                self.matrix.append(
+                    [cursor.lastrowid], np.frombuffer(result['embedding'], dtype=np.float32), result['embedding_model']
+                )
+        if (self._phash_tree is not None and result['success_status'] and phash is not None
+                and result.get('near_duplicate_of') is None):
+            self._phash_tree.add(phash, cursor.lastrowid)
 
+    def _collect_images(self, pdf_names: List[str] = None) -> List[tuple]:
+        """List (image_path, pdf_name) pairs for every extracted image to consider."""
+        images = []
         for pdf_dir in self.images_dir.iterdir():
             if not pdf_dir.is_dir():
                 continue
-                
+
             pdf_name = pdf_dir.name
-            
+
             # If pdf_names filter is provided, skip directory if not in the list
             if pdf_names is not None and pdf_name not in pdf_names:
                 continue
 
-            logger.info(f"Processing images from PDF: {pdf_name}")
-            
-            img_paths = [p for p in pdf_dir.iterdir() if p.suffix.lower() in ('.jpg', '.jpeg', '.png')]
-            for img_path in img_paths:
-                stats['total_images'] += 1
-                logger.info(f"Processing image {stats['total_images']}: {img_path.name}")
-                
+            images.extend(
+                (p, pdf_name) for p in pdf_dir.iterdir()
+                if p.suffix.lower() in ('.jpg', '.jpeg', '.png')
+            )
+        return images
+
+    def process_directory(self, pdf_names: List[str] = None) -> Dict:
+        """
+        Process images in the images directory.
+
+        With concurrency > 1, up to that many vision requests are kept in
+        flight at once; each image is still looked up, analyzed and stored
+        on its own. With batch_size > 1, the new images of each PDF are sent
+        in multi-image requests of up to batch_size images.
+
+        `cached` counts images already recorded under the same path;
+        `cache_hits` / `cache_misses` count new images served from the
+        content-hash response cache or sent to the model;
+        `near_duplicates` counts new images given the analysis of a
+        perceptually near-identical image instead; `batched` counts images
+        answered by a multi-image request; `repaired` counts responses
+        fixed locally (code fences, trailing commas, truncation) instead of
+        being requested again. `models` reports, per cascade model, its
+        requests, the images it answered, escalated or failed, its mean
+        latency, token usage and estimated cost.
+        """
+        stats = self._new_stats()
+        
+        if not self.images_dir.exists():
+            logger.warning(f"Images directory {self.images_dir} does not exist.")
+            return stats
+
+        self.cache.evict_expired()
+        self.cascade.reset()
+        groups = self._pending_groups(self._collect_images(pdf_names), stats)
+        self._process_groups(groups, stats)
+        self.store.flush()
+        stats['models'] = self.cascade.report()
+        return stats
+
+    def run_worker(self, pdf_names: List[str] = None, poll_interval: float = None, claim_size: int = None) -> Dict:
+        """
+        Process images as one of several workers sharing a JobQueue.
+
+        Every extracted image is queued (once), then jobs are claimed in
+        batches of `claim_size`, processed like process_directory does and
+        acknowledged once their rows are committed. Each result is committed
+        as soon as it is stored, so the worker never holds the database's
+        write lock while other workers claim, renew or acknowledge jobs. Leases are renewed while
+        a batch is in progress; the jobs of a crashed worker are picked up
+        again when their lease expires. The worker returns when no job is
+        left to claim and none is leased by another worker, polling every
+        `poll_interval` seconds while others are still busy.
+
+        Besides the process_directory stats, `jobs_done` and `jobs_retried`
+        count acknowledged jobs and jobs handed back to the queue.
+        """
+        poll_interval = poll_interval if poll_interval is not None else QUEUE_POLL_INTERVAL
+        claim_size = max(1, claim_size or QUEUE_CLAIM_SIZE)
+        stats = {**self._new_stats(), 'jobs_done': 0, 'jobs_retried': 0}
+
+        queue = JobQueue(db_path=self.db_path)
+        # Other workers write the queue through the same database, so never
+        # keep the write lock between results: commit each one as it is stored
+        with self.store.committing():
+            if self.images_dir.exists():
+                added = queue.enqueue(self._collect_images(pdf_names))
+                logger.info(f"Queued {added} new images")
+            self.cache.evict_expired()
+            self.cascade.reset()
+            logger.info(f"Worker {queue.worker_id} started")
+
+            while True:
+                jobs = queue.claim(claim_size)
+                if not jobs:
+                    counts = queue.counts()
+                    if not counts.get('leased') and not counts.get('expired'):
+                        break
+                    logger.info(f"Waiting for {counts.get('leased', 0)} jobs leased by other workers")
+                    time.sleep(poll_interval)
+                    continue
+
+                job_ids = [job.id for job in jobs]
+                try:
+                    with queue.keep_alive(job_ids):
+                        images = [(Path(job.image_path), job.pdf_file) for job in jobs]
+                        self._process_groups(self._pending_groups(images, stats), stats)
+                except BaseException:
+                    queue.release(job_ids)
+                    raise
+
+                done = {job.id for job in jobs if self._check_image_processed(job.image_path, job.pdf_file)}
+                retry = [job.id for job in jobs if job.id not in done]
+                # Jobs whose lease ran out and that another worker took are not counted twice
+                stats['jobs_done'] += queue.ack(list(done))
+                stats['jobs_retried'] += queue.fail(retry, "No result was recorded")
+
+        queue.close()
+        logger.info(f"Worker {queue.worker_id} finished")
+        stats['models'] = self.cascade.report()
+        return stats
+
+    @staticmethod
+    def _new_stats() -> Dict:
+        return {
+            'total_images': 0,
+            'successful': 0,
+            'failed': 0,
+            'cached': 0,
+            'cache_hits': 0,
+            'cache_misses': 0,
+            'near_duplicates': 0,
+            'batched': 0,
+            'repaired': 0
+        }
+
+    def _process_groups(self, groups: List[tuple], stats: Dict):
+        """Analyze pending images grouped by PDF, serially or with concurrent requests."""
+        if not groups:
+            return
+        if self.concurrency > 1:
+            asyncio.run(self._process_images_async(groups, stats))
+            return
+
+        for pdf_name, img_paths in groups:
+            logger.info(f"Processing {len(img_paths)} new images from PDF: {pdf_name}")
+            self._embed_images(img_paths)
+
+            for chunk in self._chunks(img_paths):
                 try:
-                    cached = self._check_image_processed(str(img_path), pdf_name)
-                    result = self.process_image(img_path, pdf_name)
-                    if cached is not None:
-                        stats['cached'] += 1
+                    if len(chunk) == 1:
+                        logger.info(f"Processing image: {chunk[0].name}")
+                        results = [self.process_image(chunk[0], pdf_name)]
                     else:
-                        if result['success_status']:
-                            stats['successful'] += 1
-                        else:
-                            stats['failed'] += 1
-                        # Add delay to avoid API rate limits
-                        time.sleep(1)
-                    
+                        logger.info(f"Processing {len(chunk)} images in one request")
+                        results = self.process_batch(chunk, pdf_name)
                 except Exception as e:
-                    stats['failed'] += 1
-                    logger.error(f"Failed to process {img_path}: {str(e)}")
-        
-        return stats
+                    stats['failed'] += len(chunk)
+                    logger.error(f"Failed to process {', '.join(p.name for p in chunk)}: {str(e)}")
+                    continue
+                for result in results:
+                    self._tally(stats, result)
+
+    def _pending_groups(self, images: List[tuple], stats: Dict) -> List[tuple]:
+        """
+        Serve images already recorded under their path and group the rest
+        by PDF as (pdf_name, [image_path, ...]).
+        """
+        groups: Dict[str, List[Path]] = {}
+        for img_path, pdf_name in images:
+            stats['total_images'] += 1
+            cached = self._check_image_processed(str(img_path), pdf_name)
+            if cached is not None:
+                self._use_cached(img_path, pdf_name, cached)
+                stats['cached'] += 1
+                continue
+            groups.setdefault(pdf_name, []).append(img_path)
+        return list(groups.items())
+
+    def _chunks(self, img_paths: List[Path]) -> List[List[Path]]:
+        return [img_paths[i:i + self.batch_size] for i in range(0, len(img_paths), self.batch_size)]
+
+    @staticmethod
+    def _tally(stats: Dict, result: Dict):
+        stats['successful' if result['success_status'] else 'failed'] += 1
+        if result.get('batched'):
+            stats['batched'] += 1
+        if result.get('repaired') and result['success_status']:
+            stats['repaired'] += 1
+        if result.get('near_duplicate_of') is not None:
+            stats['near_duplicates'] += 1
+        elif 'cache_hit' in result:
+            stats['cache_hits' if result['cache_hit'] else 'cache_misses'] += 1
+
+    async def _process_images_async(self, groups: List[tuple], stats: Dict):
+        rate_limiter = get_rate_limiter(self.db_path)
+        vision_apis = [
+            AsyncOpenRouterVision(
+                model=name,
+                max_concurrency=self.concurrency,
+                rate_limiter=rate_limiter,
+                upload_cache_dir=self.upload_cache_dir,
+                stream=self.vision_api.stream
+            )
+            for name in self.cascade.models
+        ]
+
+        total = sum(len(paths) for _, paths in groups)
+        logger.info(f"Processing {total} new images with up to {self.concurrency} concurrent requests")
+        workers = min(self.concurrency, sum(len(self._chunks(paths)) for _, paths in groups))
+
+        async def run(chunk: List[Path], pdf_name: str):
+            try:
+                if len(chunk) == 1:
+                    results = [await self.process_image_async(vision_apis, chunk[0], pdf_name)]
+                else:
+                    results = await self.process_batch_async(vision_apis, chunk, pdf_name)
+            except Exception as e:
+                stats['failed'] += len(chunk)
+                logger.error(f"Failed to process {', '.join(p.name for p in chunk)}: {str(e)}")
+                return
+            for result in results:
+                self._tally(stats, result)
+
+        # Each PDF is embedded in bulk in a worker thread while the images of
+        # the previous PDFs are already being sent to the vision model
+        queue = asyncio.Queue()
+
+        async def produce():
+            try:
+                for pdf_name, img_paths in groups:
+                    await asyncio.to_thread(self._embed_images, img_paths)
+                    for chunk in self._chunks(img_paths):
+                        queue.put_nowait((chunk, pdf_name))
+            finally:
+                for _ in range(workers):
+                    queue.put_nowait(None)
+
+        async def worker():
+            while (item := await queue.get()) is not None:
+                await run(*item)
+
+        try:
+            await asyncio.gather(produce(), *(worker() for _ in range(workers)))
+        finally:
+            for vision_api in vision_apis:
+                await vision_api.close()
 
 
 class ImageProcessorRetry:
@@ -290,23 +1025,28 @@ class ImageProcessorRetry:
         """Initialize the image processor for retrying failed entries."""
         self.images_dir = Path(images_dir if images_dir is not None else get_images_dir())
         self.output_dir = Path(output_dir if output_dir is not None else get_analysis_dir())
-        self.db_path = db_path or DB_PATH       
+        self.db_path = db_path or DB_PATH
+        self.store = get_store(self.db_path)
         
-        self.vision_api = OpenRouterVision(model=model)
+        self.vision_api = OpenRouterVision(
+            model=model,
+            rate_limiter=get_rate_limiter(self.db_path),
+            upload_cache_dir=get_upload_cache_dir(self.output_dir.parent),
+        )
+        self.cache = ResponseCache(db_path=self.db_path)
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        if self.store.table_exists('image_processing'):
+            self.store.add_column('image_processing', 'analysis', 'TEXT')
+            self.store.add_column('image_processing', 'model', 'TEXT')
 
     def get_failed_entries(self) -> List[Dict]:
         """Get all entries with non-200 status or failed status from database."""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cur = conn.cursor()
-            cur.execute('''
-                SELECT id, pdf_file, image_path 
-                FROM image_processing 
-                WHERE success_status = FALSE OR response_status_code != 200
-                ORDER BY id ASC                
-            ''')
-            return [dict(row) for row in cur.fetchall()]
+        return self.store.fetchall_dicts('''
+            SELECT id, pdf_file, image_path 
+            FROM image_processing 
+            WHERE success_status = FALSE OR response_status_code != 200
+            ORDER BY id ASC
+        ''')
 
     def process_image(self, image_path: str, pdf_file: str) -> Dict:
         """Process a single image using the Vision API."""
@@ -327,26 +1067,44 @@ class ImageProcessorRetry:
             if not img_path.exists():
                 raise FileNotFoundError(f"Image file not found: {img_path}")
 
+            prompt = self.USER_PROMPT
+            if VISION_INCLUDE_CONTEXT:
+                prompt = build_prompt(prompt, self.store.get_image_context(pdf_file, img_path.name))
+
+            cache_key = self.cache.make_key(img_path, self.vision_api.model, prompt)
             response = None
-            try:
-                response = self.vision_api.analyze_image(img_path, self.USER_PROMPT)
-            except Exception as e:
-                logger.error(f"Failed to get response: {str(e)}")
-                result['error_message'] = f"Vision API call failed: {str(e)}"
+            cached = self.cache.get(cache_key)
+            if cached is not None and parse_analysis(cached)[0] is None:
+                cached = None
+            result['model'] = self.vision_api.model
+            if cached is not None:
+                response = VisionResponse(text=cached)
+            else:
+                try:
+                    response = self.vision_api.analyze_image(get_vision_image(img_path), prompt, ANALYSIS_SCHEMA)
+                except Exception as e:
+                    logger.error(f"Failed to get response: {str(e)}")
+                    result['error_message'] = f"Vision API call failed: {str(e)}"
 
             if response is not None:
-                content = response.text
-                result['success_status'] = True
-                result['response'] = content
+                result['response'] = response.text
                 result['response_status_code'] = 200
-                
-                # Write to disk
-                pdf_subdir = sanitize_filename(pdf_file)
-                output_subdir = self.output_dir / pdf_subdir
-                output_subdir.mkdir(exist_ok=True)
-                output_file = output_subdir / f"{img_path.stem}_analysis.json"
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    f.write(content)
+                analysis, invalid, _ = parse_analysis(response.text)
+                if analysis is None:
+                    result['error_message'] = f"Invalid analysis: {invalid}"
+                else:
+                    result['success_status'] = True
+                    result['analysis'] = json.dumps(analysis, ensure_ascii=False)
+                    if cached is None:
+                        self.cache.put(cache_key, response.text, self.USER_PROMPT)
+                    
+                    # Write to disk
+                    pdf_subdir = sanitize_filename(pdf_file)
+                    output_subdir = self.output_dir / pdf_subdir
+                    output_subdir.mkdir(exist_ok=True)
+                    output_file = output_subdir / f"{img_path.stem}_analysis.json"
+                    with open(output_file, 'w', encoding='utf-8') as f:
+                        f.write(result['analysis'])
             else:
                 result['response_status_code'] = 500
                 if not result['error_message']:
@@ -360,25 +1118,26 @@ class ImageProcessorRetry:
 
     def update_entry(self, entry_id: int, result: Dict):
         """Update database entry with new processing result."""
-        with sqlite3.connect(self.db_path) as conn:
-            cur = conn.cursor()
-            cur.execute('''
-                UPDATE image_processing 
-                SET success_status = ?,
-                    response = ?,
-                    error_message = ?,
-                    timestamp = ?,
-                    response_status_code = ?
-                WHERE id = ?
-            ''', (
-                result['success_status'],
-                result['response'],
-                result['error_message'],
-                datetime.now().isoformat(),
-                result['response_status_code'],
-                entry_id
-            ))
-            conn.commit()
+        self.store.write('''
+            UPDATE image_processing 
+            SET success_status = ?,
+                response = ?,
+                error_message = ?,
+                timestamp = ?,
+                response_status_code = ?,
+                analysis = ?,
+                model = ?
+            WHERE id = ?
+        ''', (
+            result['success_status'],
+            result['response'],
+            result['error_message'],
+            datetime.now().isoformat(),
+            result['response_status_code'],
+            result.get('analysis'),
+            result.get('model'),
+            entry_id
+        ))
 
     def process_failed_entries(self) -> Dict:
         """Process all failed entries."""
@@ -408,12 +1167,6 @@ class ImageProcessorRetry:
                     logger.warning(f"File {entry['image_path']} does not exist, skipping.")
                     stats['failed'] += 1
                     continue
-
-                image_file_size = os.path.getsize(entry['image_path'])
-                if image_file_size > 4 * 1024 * 1024:
-                    logger.warning(f"Image {entry['image_path']} is too large ({image_file_size} bytes), skipping.")
-                    stats['failed'] += 1
-                    continue
                 
                 result = self.process_image(entry['image_path'], entry['pdf_file'])
                 self.update_entry(entry['id'], result)
@@ -425,11 +1178,9 @@ class ImageProcessorRetry:
                     stats['failed'] += 1
                     logger.error(f"Failed to process {entry['image_path']}: {result['error_message']}")
                 
-                # Add delay to avoid API rate limits
-                time.sleep(5)
-                
             except Exception as e:
                 stats['failed'] += 1
                 logger.error(f"Error processing {entry['image_path']}: {str(e)}")
         
+        self.store.flush()
         return stats
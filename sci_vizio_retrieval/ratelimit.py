@@ -0,0 +1,277 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, Mapping, Optional
+
+from sci_vizio_retrieval.config import (
+    DB_PATH,
+    VISION_REQUESTS_PER_SECOND,
+    VISION_TOKENS_PER_MINUTE,
+)
+
+logger = logging.getLogger(__name__)
+
+# Adaptive rate scale bounds: halved on every 429, recovered slowly on success
+_MIN_SCALE = 0.05
+_BACKOFF_FACTOR = 0.5
+_RECOVERY_FACTOR = 1.05
+
+
+def limiter_db_path(db_path: str = None) -> str:
+    """
+    File holding the bucket state for a database: a sibling named
+    `<stem>_ratelimit.db`.
+
+    The state store keeps a write transaction open across batched writes, so
+    bucket updates in the same file would wait for its commit.
+    """
+    path = Path(db_path or DB_PATH)
+    return str(path.with_name(f"{path.stem}_ratelimit.db"))
+
+
+def parse_retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """
+    Seconds to wait according to rate-limit response headers, if they say so.
+
+    Understands `Retry-After` (seconds or HTTP date) and `X-RateLimit-Reset`
+    (epoch seconds or milliseconds) when `X-RateLimit-Remaining` is 0.
+    """
+    if not headers:
+        return None
+    headers = {k.lower(): v for k, v in headers.items()}
+
+    retry_after = headers.get('retry-after')
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+
+    remaining = headers.get('x-ratelimit-remaining') or headers.get('x-ratelimit-remaining-requests')
+    reset = headers.get('x-ratelimit-reset') or headers.get('x-ratelimit-reset-requests')
+    if remaining is not None and reset:
+        try:
+            if float(remaining) > 0:
+                return None
+            reset = float(reset.rstrip('s'))
+        except ValueError:
+            return None
+        if reset > 1e11:
+            reset /= 1000.0
+        # Large values are absolute epoch timestamps, small ones are relative seconds
+        return max(0.0, reset - time.time()) if reset > 1e9 else max(0.0, reset)
+    return None
+
+
+class RateLimiter:
+    """
+    Token-bucket rate limiter shared by every vision client using the same
+    database, across threads and worker processes.
+
+    Two buckets are kept: one refilled at `requests_per_second` and one at
+    `tokens_per_minute` / 60 (disabled when 0). Each call reserves its cost up
+    front and is told how long to wait before sending, so callers never hold
+    a lock while sleeping. The bucket state lives in a `rate_limits` table
+    in its own database file next to the main one (see limiter_db_path),
+    because every reservation has to be visible to other processes
+    immediately, and a pending batch of the state store holds the main
+    database's write lock.
+
+    When the provider answers 429 or reports an exhausted quota, all callers
+    are held until the reset time and the refill rate is halved; it recovers
+    gradually with each successful request.
+
+    Args:
+        db_path: Database whose clients share the budget. If None, resolves from config.ini/DB_PATH.
+        requests_per_second: Request rate. If None, resolves from config.ini/VISION_REQUESTS_PER_SECOND.
+        tokens_per_minute: Token budget per minute (0 = unlimited). If None, resolves from config.ini/VISION_TOKENS_PER_MINUTE.
+        name: Bucket name; clients sharing a name share a budget.
+    """
+
+    def __init__(
+        self,
+        db_path: str = None,
+        requests_per_second: float = None,
+        tokens_per_minute: int = None,
+        name: str = "openrouter",
+    ):
+        self.db_path = limiter_db_path(db_path)
+        self.requests_per_second = requests_per_second if requests_per_second is not None else VISION_REQUESTS_PER_SECOND
+        self.tokens_per_minute = tokens_per_minute if tokens_per_minute is not None else VISION_TOKENS_PER_MINUTE
+        self.name = name
+        self._lock = threading.Lock()
+
+        self.conn = sqlite3.connect(self.db_path, timeout=30.0, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS rate_limits (
+                name TEXT PRIMARY KEY,
+                request_tokens REAL,
+                token_tokens REAL,
+                updated REAL,
+                blocked_until REAL,
+                scale REAL
+            )
+        ''')
+
+    @property
+    def enabled(self) -> bool:
+        return self.requests_per_second > 0 or self.tokens_per_minute > 0
+
+    def _update(self, fn) -> float:
+        """Apply fn to the bucket state inside one immediate transaction."""
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute('''
+                    SELECT request_tokens, token_tokens, updated, blocked_until, scale
+                    FROM rate_limits WHERE name = ?
+                ''', (self.name,)).fetchone()
+                now = time.time()
+                if row is None:
+                    state = {
+                        'request_tokens': self._request_capacity(),
+                        'token_tokens': float(self.tokens_per_minute),
+                        'updated': now,
+                        'blocked_until': 0.0,
+                        'scale': 1.0,
+                    }
+                else:
+                    state = dict(zip(('request_tokens', 'token_tokens', 'updated', 'blocked_until', 'scale'), row))
+                self._refill(state, now)
+                result = fn(state, now)
+                self.conn.execute('''
+                    INSERT OR REPLACE INTO rate_limits
+                    (name, request_tokens, token_tokens, updated, blocked_until, scale)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (self.name, state['request_tokens'], state['token_tokens'], state['updated'],
+                      state['blocked_until'], state['scale']))
+                self.conn.execute("COMMIT")
+                return result
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def _request_capacity(self) -> float:
+        # Allow a burst of up to one second's worth of requests
+        return max(1.0, self.requests_per_second)
+
+    def _refill(self, state: Dict, now: float):
+        elapsed = max(0.0, now - state['updated'])
+        scale = state['scale']
+        if self.requests_per_second > 0:
+            state['request_tokens'] = min(
+                self._request_capacity(),
+                state['request_tokens'] + elapsed * self.requests_per_second * scale
+            )
+        if self.tokens_per_minute > 0:
+            state['token_tokens'] = min(
+                float(self.tokens_per_minute),
+                state['token_tokens'] + elapsed * self.tokens_per_minute / 60.0 * scale
+            )
+        state['updated'] = now
+
+    def reserve(self, tokens: int = 0) -> float:
+        """
+        Reserve one request and an estimated number of tokens.
+
+        Returns:
+            Seconds the caller must wait before sending the request.
+        """
+        if not self.enabled:
+            return 0.0
+
+        def take(state, now):
+            wait = max(0.0, state['blocked_until'] - now)
+            scale = state['scale']
+            if self.requests_per_second > 0:
+                state['request_tokens'] -= 1
+                if state['request_tokens'] < 0:
+                    wait = max(wait, -state['request_tokens'] / (self.requests_per_second * scale))
+            if self.tokens_per_minute > 0 and tokens:
+                state['token_tokens'] -= tokens
+                if state['token_tokens'] < 0:
+                    wait = max(wait, -state['token_tokens'] / (self.tokens_per_minute / 60.0 * scale))
+            return wait
+
+        return self._update(take)
+
+    def acquire(self, tokens: int = 0):
+        """Block the calling thread until a request may be sent."""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    def record_usage(self, estimated: int, actual: int):
+        """Correct the token bucket once the real usage of a request is known."""
+        if self.tokens_per_minute <= 0 or actual is None:
+            return
+
+        def correct(state, now):
+            state['token_tokens'] -= actual - estimated
+
+        self._update(correct)
+
+    def record_success(self, headers: Optional[Mapping[str, str]] = None):
+        """Let the rate recover after a successful request; honour an exhausted quota."""
+        if not self.enabled:
+            return
+        hold = parse_retry_after(headers)
+
+        def recover(state, now):
+            state['scale'] = min(1.0, state['scale'] * _RECOVERY_FACTOR)
+            if hold:
+                state['blocked_until'] = max(state['blocked_until'], now + hold)
+
+        self._update(recover)
+
+    def record_rate_limited(self, headers: Optional[Mapping[str, str]] = None) -> float:
+        """
+        Register a 429 response: hold every caller until the advertised reset
+        and halve the refill rate.
+
+        Returns:
+            Seconds until requests may resume.
+        """
+        hold = parse_retry_after(headers)
+
+        def backoff(state, now):
+            state['scale'] = max(_MIN_SCALE, state['scale'] * _BACKOFF_FACTOR)
+            # Without a hint, wait for about one request interval at the reduced rate
+            delay = hold
+            if delay is None:
+                rate = self.requests_per_second * state['scale'] if self.requests_per_second > 0 else 1.0
+                delay = 1.0 / rate
+            state['blocked_until'] = max(state['blocked_until'], now + delay)
+            return state['blocked_until'] - now
+
+        wait = self._update(backoff)
+        logger.warning(f"Rate limited by provider; pausing requests for {wait:.1f}s")
+        return wait
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+# One limiter per (process, database), like the state store
+_limiters: Dict[tuple, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(db_path: str = None) -> RateLimiter:
+    """Get the shared RateLimiter for a database in the current process."""
+    key = (os.getpid(), os.path.abspath(str(db_path or DB_PATH)))
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = RateLimiter(db_path=key[1])
+            _limiters[key] = limiter
+        return limiter
@@ -0,0 +1,228 @@
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from sci_vizio_retrieval.config import DB_PATH, DB_COMMIT_BATCH
+
+logger = logging.getLogger(__name__)
+
+
+class StateStore:
+    """
+    Shared SQLite state store used by every pipeline stage.
+
+    Holds one long-lived connection per process in WAL mode, so readers never
+    block the writer and each write does not pay for its own connect/fsync.
+    WAL needs every process using the database to run on the same host; it
+    does not work over network filesystems.
+    Writes issued through write()/write_many()/batch() are grouped into
+    transactions of `batch_size` entries; flush() commits whatever is
+    pending. Reads on the same store see its uncommitted writes.
+
+    A pending batch holds SQLite's write lock until it is committed, so no
+    other connection to the database (another process, a RateLimiter or a
+    JobQueue) can write in the meantime; it waits up to the busy timeout and
+    then fails with "database is locked". Code that shares the database with
+    other writers must use transaction() or committing(), which commit each
+    entry as soon as it completes.
+
+    All methods are serialized with a lock, so one store can be shared by
+    worker threads. Worker processes get their own store via get_store().
+
+    Args:
+        db_path: Path to the SQLite database. If None, resolves from config.ini/DB_PATH.
+        batch_size: Number of writes per transaction. If None, resolves from config.ini/DB_COMMIT_BATCH.
+    """
+
+    def __init__(self, db_path: str = None, batch_size: int = None):
+        self.db_path = str(db_path or DB_PATH)
+        self.batch_size = max(1, batch_size if batch_size is not None else DB_COMMIT_BATCH)
+        self._lock = threading.RLock()
+        self._pending = 0
+        self._depth = 0
+        self._committing = 0
+
+        # Transactions are managed explicitly; statement cache keeps prepared statements
+        self.conn = sqlite3.connect(
+            self.db_path,
+            timeout=30.0,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=256,
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=30000")
+
+    def init_schema(self, *statements: str):
+        """Run schema statements (CREATE TABLE/INDEX ...) and commit immediately."""
+        with self.transaction() as conn:
+            for statement in statements:
+                conn.execute(statement)
+
+    def add_column(self, table: str, column: str, declaration: str):
+        """Add a column to an existing table unless it is already there (schema migration)."""
+        columns = [row[1] for row in self.fetchall(f"PRAGMA table_info({table})")]
+        if column not in columns:
+            with self.transaction() as conn:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+    def table_exists(self, name: str) -> bool:
+        return self.fetchone(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+        ) is not None
+
+    def fetchone(self, sql: str, params: Sequence = ()) -> Optional[tuple]:
+        with self._lock:
+            return self.conn.execute(sql, params).fetchone()
+
+    def fetchall(self, sql: str, params: Sequence = ()) -> List[tuple]:
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def fetchall_dicts(self, sql: str, params: Sequence = ()) -> List[Dict[str, Any]]:
+        with self._lock:
+            cur = self.conn.execute(sql, params)
+            columns = [col[0] for col in cur.description]
+            return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+    def get_image_context(self, pdf_file: str, image: str) -> Optional[Dict[str, Any]]:
+        """Look up the page, caption and surrounding text recorded for an image at extraction time."""
+        if not self.table_exists('image_context'):
+            return None
+        row = self.fetchone('''
+            SELECT page_num, bbox, caption, context
+            FROM image_context
+            WHERE pdf_file = ? AND image = ?
+        ''', (pdf_file, image))
+        if row is None:
+            return None
+        return {
+            'page_num': row[0],
+            'bbox': json.loads(row[1]) if row[1] else None,
+            'caption': row[2],
+            'context': row[3]
+        }
+
+    def _begin(self):
+        if not self.conn.in_transaction:
+            self.conn.execute("BEGIN")
+
+    def _wrote(self, count: int = 1):
+        self._pending += count
+        if self._committing or self._pending >= self.batch_size:
+            self.flush()
+
+    def write(self, sql: str, params: Sequence = ()) -> sqlite3.Cursor:
+        """Execute a write inside the current batch transaction."""
+        with self.batch() as conn:
+            return conn.execute(sql, params)
+
+    def write_many(self, sql: str, seq_of_params: Iterable[Sequence]) -> sqlite3.Cursor:
+        """Execute a write for every parameter tuple inside the current batch transaction."""
+        with self.batch() as conn:
+            return conn.executemany(sql, seq_of_params)
+
+    @contextmanager
+    def batch(self):
+        """
+        Run a group of statements atomically as one entry of the current batch.
+        
+        If the block raises, only its own statements are rolled back; other
+        pending writes are kept and committed with the batch.
+        """
+        with self._lock:
+            self._begin()
+            self.conn.execute("SAVEPOINT batch_entry")
+            self._depth += 1
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute("ROLLBACK TO batch_entry")
+                self.conn.execute("RELEASE batch_entry")
+                raise
+            else:
+                self.conn.execute("RELEASE batch_entry")
+            finally:
+                self._depth -= 1
+            # Nested entries are committed with the outermost one
+            if self._depth == 0:
+                self._wrote()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Run a group of statements atomically and commit them, together with
+        any pending batched writes, when the block exits.
+        """
+        with self._lock:
+            with self.batch() as conn:
+                yield conn
+            self.flush()
+
+    @contextmanager
+    def committing(self):
+        """
+        Commit every batch entry as soon as it completes while the block runs.
+        
+        Pending batched writes are committed on entry, so the write lock is
+        never held between entries and other connections can write.
+        """
+        with self._lock:
+            self._committing += 1
+        try:
+            self.flush()
+            yield self
+        finally:
+            with self._lock:
+                self._committing -= 1
+
+    def flush(self):
+        """Commit all pending batched writes."""
+        with self._lock:
+            if self.conn.in_transaction and self._depth == 0:
+                self.conn.commit()
+            self._pending = 0
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self.conn.close()
+
+
+# One store per (process, database) so every component shares a connection
+_stores: Dict[tuple, StateStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(db_path: str = None) -> StateStore:
+    """
+    Get the shared StateStore for a database in the current process.
+
+    Stores are keyed by process id, so a forked worker never reuses its
+    parent's connection.
+    """
+    key = (os.getpid(), os.path.abspath(str(db_path or DB_PATH)))
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = StateStore(db_path=key[1])
+            _stores[key] = store
+        return store
+
+
+@atexit.register
+def _flush_stores():
+    pid = os.getpid()
+    for (store_pid, _), store in list(_stores.items()):
+        if store_pid != pid:
+            continue
+        try:
+            store.flush()
+        except Exception as e:
+            logger.warning(f"Could not flush state store {store.db_path}: {e}")
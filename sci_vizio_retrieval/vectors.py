@@ -0,0 +1,176 @@
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+
+from sci_vizio_retrieval.config import DB_PATH
+from sci_vizio_retrieval.store import get_store
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are only serialized within the process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DIM = 2048
+ROW_BYTES = DIM * 4
+
+
+def get_matrix_path(db_path: str = None) -> Path:
+    """Raw float32 embedding matrix kept next to the database."""
+    return Path(db_path or DB_PATH).resolve().parent / "embeddings" / "image_embeddings.f32"
+
+
+class EmbeddingMatrix:
+    """
+    Append-only on-disk embedding store.
+
+    Vectors live in one contiguous raw float32 file of shape (rows, 2048),
+    so the whole corpus can be memory-mapped into NumPy without copying or
+    going through SQLite. The `embedding_matrix` table maps each
+    `image_processing` id to its row and the model that produced it.
+
+    Re-embedding an image appends a new row and repoints the map; the old
+    row stays in the file but is no longer referenced.
+
+    Args:
+        db_path: Path to SQLite database. If None, resolves from config.ini/DB_PATH.
+    """
+
+    def __init__(self, db_path: str = None):
+        self.db_path = db_path or DB_PATH
+        self.path = get_matrix_path(self.db_path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.store = get_store(self.db_path)
+        self.store.init_schema('''
+            CREATE TABLE IF NOT EXISTS embedding_matrix (
+                id INTEGER PRIMARY KEY,
+                row INTEGER,
+                model TEXT
+            )
+        ''')
+        self._lock = threading.Lock()
+
+    def append(self, ids: Sequence[int], vectors: np.ndarray, model: str):
+        """
+        Append vectors for the given image_processing ids and point the map at them.
+
+        The vectors are flushed to disk before the map is written, so a
+        crash can leave unreferenced rows but never a dangling reference.
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, DIM)
+        if len(ids) != len(vectors):
+            raise ValueError(f"Got {len(ids)} ids for {len(vectors)} vectors")
+        if not len(ids):
+            return
+
+        with self._lock, open(self.path, "ab") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                # Drop a partial row left by an interrupted write
+                size = f.seek(0, os.SEEK_END)
+                if size % ROW_BYTES:
+                    f.truncate(size - size % ROW_BYTES)
+                    size -= size % ROW_BYTES
+                first_row = size // ROW_BYTES
+                f.write(vectors.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+        self.store.write_many(
+            "INSERT OR REPLACE INTO embedding_matrix (id, row, model) VALUES (?, ?, ?)",
+            [(int(i), first_row + n, model) for n, i in enumerate(ids)]
+        )
+
+    def row_count(self) -> int:
+        return self.path.stat().st_size // ROW_BYTES if self.path.exists() else 0
+
+    def load(self, model: str = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Memory-map the whole matrix.
+
+        Returns:
+            (ids, matrix): `matrix` is a read-only (rows, 2048) float32 memmap
+            and `ids[i]` is the image_processing id of row i, or -1 for rows
+            that were superseded (or come from another model when `model` is given).
+        """
+        rows = self.row_count()
+        ids = np.full(rows, -1, dtype=np.int64)
+        if rows == 0:
+            return ids, np.empty((0, DIM), dtype=np.float32)
+
+        query = "SELECT id, row FROM embedding_matrix WHERE row < ?"
+        params = [rows]
+        if model is not None:
+            query += " AND model = ?"
+            params.append(model)
+        mapping = np.array(self.store.fetchall(query, params), dtype=np.int64).reshape(-1, 2)
+        ids[mapping[:, 1]] = mapping[:, 0]
+        return ids, np.memmap(self.path, dtype=np.float32, mode="r", shape=(rows, DIM))
+
+    def knn(self, query: np.ndarray, k: int = 10, model: str = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Cosine nearest neighbours of one or more L2-normalized query vectors.
+
+        Returns:
+            (ids, scores), each of shape (queries, k), best first.
+        """
+        ids, matrix = self.load(model)
+        query = np.atleast_2d(np.asarray(query, dtype=np.float32))
+        scores = query @ matrix.T
+        scores[:, ids < 0] = -np.inf
+        k = min(k, int((ids >= 0).sum()))
+        if k <= 0:
+            return np.empty((len(query), 0), dtype=np.int64), np.empty((len(query), 0), dtype=np.float32)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        return ids[top], np.take_along_axis(scores, top, axis=1)
+
+    def migrate_blobs(self, default_model: str, page_size: int = 1024, clear_blobs: bool = True) -> Dict:
+        """
+        Move embeddings stored as BLOBs in `image_processing` into the matrix.
+
+        Rows already in the map are skipped. With `clear_blobs`, migrated
+        BLOBs are set to NULL.
+        """
+        stats = {'migrated': 0, 'invalid': 0}
+        last_id = 0
+        while True:
+            rows = self.store.fetchall('''
+                SELECT p.id, p.embedding, p.embedding_model
+                FROM image_processing p
+                LEFT JOIN embedding_matrix m ON m.id = p.id
+                WHERE p.embedding IS NOT NULL AND m.id IS NULL AND p.id > ?
+                ORDER BY p.id
+                LIMIT ?
+            ''', (last_id, page_size))
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            migrated = []
+            by_model: Dict[str, list] = {}
+            for row_id, blob, model in rows:
+                if len(blob) != ROW_BYTES:
+                    stats['invalid'] += 1
+                    continue
+                by_model.setdefault(model or default_model, []).append((row_id, blob))
+            with self.store.transaction():
+                for model, entries in by_model.items():
+                    vectors = np.frombuffer(b"".join(blob for _, blob in entries), dtype=np.float32)
+                    self.append([row_id for row_id, _ in entries], vectors, model)
+                    migrated.extend((row_id,) for row_id, _ in entries)
+                if clear_blobs:
+                    self.store.write_many("UPDATE image_processing SET embedding = NULL WHERE id = ?", migrated)
+            stats['migrated'] += len(migrated)
+        logger.info(f"Migrated {stats['migrated']} embedding BLOBs into {self.path}")
+        return stats
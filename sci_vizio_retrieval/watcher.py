@@ -0,0 +1,297 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from sci_vizio_retrieval.config import (
+    PDF_INPUT_DIR,
+    OUTPUT_DIR,
+    DB_PATH,
+    CHROMA_PATH,
+    WATCH_POLL_INTERVAL,
+    WATCH_DEBOUNCE,
+    WATCH_BATCH_SIZE,
+    get_analysis_dir,
+)
+from sci_vizio_retrieval.extractor import PDFProcessor
+
+logger = logging.getLogger(__name__)
+
+
+class _Inotify:
+    """
+    Minimal inotify wrapper (Linux, via ctypes) used only to wake the watcher
+    early when something changes in a watched directory. Events are not
+    parsed; any event triggers a rescan.
+    """
+
+    IN_MODIFY = 0x002
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c")
+        if not sys.platform.startswith("linux") or not libc_name:
+            raise OSError("inotify is not available on this platform")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._watched = set()
+
+    def watch(self, directory: Path):
+        directory = str(directory)
+        if directory in self._watched:
+            return
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), self.MASK)
+        if wd >= 0:
+            self._watched.add(directory)
+
+    def wait(self, timeout: float) -> bool:
+        """Block until an event arrives or the timeout passes. Returns True on events."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        try:
+            while os.read(self.fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    """
+    Long-running ingest loop that keeps the search index in step with the
+    input directory.
+
+    Every scan only stats files. A PDF whose (size, mtime_ns, inode) changed
+    since the previous scan becomes pending, and once it has stayed the same
+    for `debounce` seconds it is pushed through extraction, vision processing
+    and indexing together with up to `batch_size - 1` other ready PDFs.
+    Vision processing and indexing only run for PDFs that extraction found
+    new or modified. A batch that raises is logged and its PDFs stay pending,
+    to be retried once the debounce passes again.
+
+    Recorded state lives in the shared database, so a restart resumes where
+    the previous run stopped: run() starts from the stored fingerprints, so
+    unchanged PDFs never become pending, and finishes the images and index
+    entries a previous run left behind in one pass over the database.
+
+    Args:
+        input_dir: Directory to watch for PDFs. If None, resolves from config.ini.
+        output_dir: Base output directory. If None, resolves from config.ini.
+        db_path: Path to SQLite database. If None, resolves from config.ini.
+        chroma_path: ChromaDB directory. If None, resolves from config.ini.
+        model: OpenRouter model slug. If None, resolves from config.ini.
+        workers: PDF extraction processes. If None, resolves from config.ini.
+        figures: Render captioned figures. If None, resolves from config.ini.
+        poll_interval: Seconds between scans. If None, resolves from config.ini.
+        debounce: Seconds a file must be stable. If None, resolves from config.ini.
+        batch_size: Maximum PDFs per batch. If None, resolves from config.ini.
+    """
+
+    def __init__(
+        self,
+        input_dir: str = None,
+        output_dir: str = None,
+        db_path: str = None,
+        chroma_path: str = None,
+        model: str = None,
+        workers: int = None,
+        figures: bool = None,
+        poll_interval: float = None,
+        debounce: float = None,
+        batch_size: int = None,
+    ):
+        self.input_dir = Path(input_dir or PDF_INPUT_DIR)
+        self.output_dir = Path(output_dir or OUTPUT_DIR)
+        self.db_path = db_path or DB_PATH
+        self.chroma_path = chroma_path or CHROMA_PATH
+        self.model = model
+        self.poll_interval = poll_interval if poll_interval is not None else WATCH_POLL_INTERVAL
+        self.debounce = debounce if debounce is not None else WATCH_DEBOUNCE
+        self.batch_size = max(1, batch_size or WATCH_BATCH_SIZE)
+
+        self.input_dir.mkdir(parents=True, exist_ok=True)
+        self.extractor = PDFProcessor(
+            input_dir=self.input_dir,
+            output_dir=self.output_dir,
+            db_path=self.db_path,
+            workers=workers,
+            figures=figures,
+        )
+        # Vision and indexing stages are heavy to build; created on first batch
+        self._processor = None
+        self._indexer = None
+
+        self._snapshot: Dict[Path, Tuple[int, int, int]] = {}
+        # path -> (fingerprint, time the fingerprint was first seen)
+        self._pending: Dict[Path, Tuple[Tuple[int, int, int], float]] = {}
+        # PDFs whose batch raised; their later stages run even if extraction skips them
+        self._failed: Set[Path] = set()
+
+        try:
+            self._inotify: Optional[_Inotify] = _Inotify()
+        except OSError:
+            self._inotify = None
+
+    @property
+    def processor(self):
+        if self._processor is None:
+            from sci_vizio_retrieval.processor import ImageProcessor
+            self._processor = ImageProcessor(
+                model=self.model,
+                images_dir=self.extractor.images_dir,
+                output_dir=get_analysis_dir(str(self.output_dir)),
+                db_path=self.db_path,
+            )
+        return self._processor
+
+    @property
+    def indexer(self):
+        if self._indexer is None:
+            from sci_vizio_retrieval.indexer import ImageAnalysisIndexer
+            self._indexer = ImageAnalysisIndexer(db_path=self.db_path, chroma_path=self.chroma_path)
+        return self._indexer
+
+    def scan(self) -> Dict[Path, Tuple[int, int, int]]:
+        """Stat every PDF under the input directory without reading any of them."""
+        snapshot = {}
+        for root, _, files in os.walk(self.input_dir):
+            if self._inotify is not None:
+                self._inotify.watch(Path(root))
+            for name in files:
+                if not name.lower().endswith(".pdf"):
+                    continue
+                path = Path(root) / name
+                try:
+                    snapshot[path] = PDFProcessor.file_fingerprint(path)
+                except OSError:
+                    continue
+        return snapshot
+
+    def _update_pending(self, snapshot, now: float):
+        for path, fingerprint in snapshot.items():
+            if self._snapshot.get(path) == fingerprint:
+                continue
+            pending = self._pending.get(path)
+            if pending is None or pending[0] != fingerprint:
+                self._pending[path] = (fingerprint, now)
+        for path in set(self._pending) - set(snapshot):
+            del self._pending[path]
+        self._snapshot = snapshot
+
+    def _ready(self, now: float) -> List[Path]:
+        ready = [path for path, (_, seen) in self._pending.items() if now - seen >= self.debounce]
+        return sorted(ready)[:self.batch_size]
+
+    def process_batch(self, pdf_paths: List[Path]) -> Dict:
+        """Push a batch of PDFs through extraction, vision processing and indexing."""
+        logger.info(f"Ingesting {len(pdf_paths)} PDFs: {[p.name for p in pdf_paths]}")
+        changed = []
+        stats = {'extract': self.extractor.process_paths(pdf_paths, changed=changed)}
+
+        # Unchanged PDFs were finished earlier; ones from a failed batch may not be
+        changed = set(changed)
+        pdf_names = [p.stem for p in pdf_paths if p in changed or p in self._failed]
+        if not pdf_names:
+            logger.info("No new or modified PDFs in batch")
+            return stats
+
+        stats['process'] = self.processor.process_directory(pdf_names=pdf_names)
+        stats['index'] = self.indexer.process_all_analyses(pdf_names=pdf_names)
+        logger.info(f"Batch stats: {stats}")
+        return stats
+
+    def run_once(self) -> Optional[Dict]:
+        """Scan once and process the next batch of stable PDFs, if any."""
+        now = time.monotonic()
+        self._update_pending(self.scan(), now)
+        ready = self._ready(now)
+        if not ready:
+            return None
+
+        try:
+            stats = self.process_batch(ready)
+        except Exception as e:
+            logger.error(f"Batch failed, retrying its PDFs later: {str(e)}", exc_info=True)
+            retry = time.monotonic()
+            for path in ready:
+                self._pending[path] = (self._pending[path][0], retry)
+                self._failed.add(path)
+            return None
+
+        # Per-PDF failures are recorded in the database; they are retried when the file changes
+        for path in ready:
+            self._pending.pop(path, None)
+            self._failed.discard(path)
+        return stats
+
+    def catch_up(self):
+        """
+        Start from the fingerprints recorded in the database and finish the
+        images and index entries a previous run left behind.
+
+        Both are found from the database: only PDFs with an image that has no
+        result yet are processed, and only unindexed results are indexed.
+        """
+        self._snapshot = {
+            Path(pdf_path): details['fingerprint']
+            for pdf_path, details in self.extractor.load_known_pdfs().items()
+            if details['fingerprint'] is not None
+        }
+        try:
+            pdf_names = self.processor.unfinished_pdf_names()
+            stats = {}
+            if pdf_names:
+                stats['process'] = self.processor.process_directory(pdf_names=pdf_names)
+            stats['index'] = self.indexer.process_all_analyses()
+            logger.info(f"Catch-up stats: {stats}")
+        except Exception as e:
+            logger.error(f"Catch-up failed: {str(e)}", exc_info=True)
+
+    def run(self, max_iterations: int = None):
+        """
+        Watch the input directory until interrupted.
+
+        Args:
+            max_iterations: Stop after this many scans (None runs forever).
+        """
+        logger.info(
+            f"Watching {self.input_dir} (poll every {self.poll_interval}s, "
+            f"debounce {self.debounce}s, inotify {'on' if self._inotify else 'off'})"
+        )
+        iterations = 0
+        try:
+            self.catch_up()
+            while max_iterations is None or iterations < max_iterations:
+                iterations += 1
+                processed = self.run_once()
+                if processed is not None and self._ready(time.monotonic()):
+                    continue
+
+                # Wake up early for pending files that are about to become stable
+                timeout = self.poll_interval
+                if self._pending:
+                    timeout = min(timeout, self.debounce)
+                if self._inotify is not None:
+                    self._inotify.wait(timeout)
+                else:
+                    time.sleep(timeout)
+        except KeyboardInterrupt:
+            logger.info("Watcher stopped.")
+        finally:
+            if self._inotify is not None:
+                self._inotify.close()
@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+from sci_vizio_retrieval.analysis import (
+    load_json,
+    parse_analysis,
+    parse_batch_response,
+    repair_json,
+    validate_analysis,
+)
+
+VALID = {"image_type": "chart", "title": "Sales", "description": "Bars per year"}
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('```json\n{"a": 1}\n```', {"a": 1}),
+    ('Here you go: {"a": [1, 2,], } Thanks!', {"a": [1, 2]}),
+    ('{"a": "unterminated', {"a": "unterminated"}),
+    ('{"a": "ends with escape\\', {"a": "ends with escape"}),
+    ('{"a": 1, "b": [1, {"c": 2', {"a": 1, "b": [1, {"c": 2}]}),
+    ('{"a": 1, "dangling"', {"a": 1}),
+    ('{"a": 1, "dangling":', {"a": 1}),
+    ('{"a": 1,', {"a": 1}),
+    ('[{"a": "}"}, ', [{"a": "}"}]),
+])
+def test_repair_json(text, expected):
+    assert json.loads(repair_json(text)) == expected
+
+
+def test_repair_json_keeps_brackets_in_strings():
+    text = '{"a": "x}]\\"{", "b": 2}'
+    assert json.loads(repair_json(text)) == {"a": 'x}]"{', "b": 2}
+
+
+def test_load_json_reports_repair():
+    assert load_json('{"a": 1}') == ({"a": 1}, False)
+    assert load_json('noise {"a": 1} noise') == ({"a": 1}, False)
+    assert load_json('{"a": 1,}') == ({"a": 1}, True)
+
+
+def test_load_json_raises_value_error():
+    with pytest.raises(ValueError):
+        load_json("no json here")
+
+
+def test_validate_analysis():
+    assert validate_analysis(VALID) is None
+    assert validate_analysis([VALID]) == "Response is not a JSON object"
+    assert "title" in validate_analysis({"image_type": "chart", "description": "x"})
+
+
+def test_parse_analysis():
+    assert parse_analysis(json.dumps(VALID)) == (VALID, None, False)
+    analysis, error, repaired = parse_analysis(json.dumps(VALID)[:-1])
+    assert analysis == VALID and error is None and repaired
+    assert parse_analysis(None) == (None, "Empty response", False)
+    analysis, error, _ = parse_analysis('{"title": "x"}')
+    assert analysis is None and error.startswith("Missing required fields")
+
+
+def test_parse_batch_response():
+    items = [
+        {"image_index": 2, **VALID},
+        {"image_index": 1, **VALID, "title": "First"},
+        {"image_index": 1, **VALID, "title": "Repeated"},
+        {"image_index": 3, "title": "invalid"},
+        {"image_index": 9, **VALID},
+        {**VALID},
+        "not an object",
+    ]
+    analyses = parse_batch_response(json.dumps({"analyses": items}), count=3)
+    assert sorted(analyses) == [0, 1]
+    assert analyses[0]["title"] == "First"
+    assert "image_index" not in analyses[1]
+
+    # A bare array is accepted too
+    assert list(parse_batch_response(json.dumps([items[0]]), count=3)) == [1]
+
+
+def test_parse_batch_response_rejects_non_arrays():
+    with pytest.raises(ValueError):
+        parse_batch_response(json.dumps(VALID), count=1)
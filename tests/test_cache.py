@@ -0,0 +1,105 @@
+import time
+
+import pytest
+
+from sci_vizio_retrieval import cache
+from sci_vizio_retrieval.cache import ResponseCache
+
+TEMPLATE = "Describe the figure"
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "state.db")
+
+
+@pytest.fixture
+def image(tmp_path):
+    path = tmp_path / "image.png"
+    path.write_bytes(b"image bytes")
+    return path
+
+
+def make_cache(db_path, ttl_days=30):
+    return ResponseCache(db_path=db_path, enabled=True, ttl_days=ttl_days)
+
+
+def test_hit_is_independent_of_the_path(db_path, image, tmp_path):
+    responses = make_cache(db_path)
+    responses.put(responses.make_key(image, "model-a", TEMPLATE), "answer", TEMPLATE)
+
+    copy = tmp_path / "other" / "copy.png"
+    copy.parent.mkdir()
+    copy.write_bytes(image.read_bytes())
+    assert responses.get(responses.make_key(copy, "model-a", TEMPLATE)) == "answer"
+
+
+def test_model_or_prompt_change_misses(db_path, image):
+    responses = make_cache(db_path)
+    responses.put(responses.make_key(image, "model-a", TEMPLATE), "answer", TEMPLATE)
+
+    assert responses.get(responses.make_key(image, "model-b", TEMPLATE)) is None
+    assert responses.get(responses.make_key(image, "model-a", TEMPLATE + " in detail")) is None
+    image.write_bytes(b"other image bytes")
+    assert responses.get(responses.make_key(image, "model-a", TEMPLATE)) is None
+
+
+def test_disabled_cache_neither_serves_nor_records(db_path, image):
+    responses = ResponseCache(db_path=db_path, enabled=False, ttl_days=30)
+    key = responses.make_key(image, "model-a", TEMPLATE)
+    responses.put(key, "answer", TEMPLATE)
+    assert responses.get(key) is None
+    assert make_cache(db_path).get(key) is None
+
+
+START = time.time()
+
+
+def age(monkeypatch, days):
+    """Move the clock `days` past the start of the test run."""
+    now = START + days * 86400
+    monkeypatch.setattr(cache.time, 'time', lambda: now)
+
+
+def test_unused_entries_expire(db_path, image, monkeypatch):
+    responses = make_cache(db_path, ttl_days=30)
+    stale = responses.make_key(image, "model-a", TEMPLATE)
+    used = responses.make_key(image, "model-b", TEMPLATE)
+    responses.put(stale, "old answer", TEMPLATE)
+    responses.put(used, "answer", TEMPLATE)
+
+    # Reading an entry refreshes it
+    age(monkeypatch, 20)
+    assert responses.get(used) == "answer"
+    age(monkeypatch, 40)
+    assert responses.evict_expired() == 1
+    assert responses.get(stale) is None
+    assert responses.get(used) == "answer"
+
+
+def test_zero_ttl_keeps_entries(db_path, image, monkeypatch):
+    responses = make_cache(db_path, ttl_days=0)
+    key = responses.make_key(image, "model-a", TEMPLATE)
+    responses.put(key, "answer", TEMPLATE)
+    age(monkeypatch, 10000)
+    assert responses.evict_expired() == 0
+    assert responses.get(key) == "answer"
+
+
+def test_prune_drops_retired_and_expired_entries(db_path, image, tmp_path, monkeypatch):
+    responses = make_cache(db_path, ttl_days=30)
+    other = tmp_path / "other.png"
+    other.write_bytes(b"other image bytes")
+    current = responses.make_key(image, "model-a", TEMPLATE)
+    expired = responses.make_key(other, "model-a", TEMPLATE)
+    retired_model = responses.make_key(image, "model-b", TEMPLATE)
+    retired_prompt = responses.make_key(image, "model-a", "Old template")
+    responses.put(expired, "expired", TEMPLATE)
+    age(monkeypatch, 40)
+    responses.put(current, "answer", TEMPLATE)
+    responses.put(retired_model, "answer", TEMPLATE)
+    responses.put(retired_prompt, "answer", "Old template")
+
+    assert responses.prune("model-a", TEMPLATE) == 3
+    rows = responses.store.fetchall("SELECT content_hash, model, prompt_hash FROM vision_cache")
+    assert rows == [current]
@@ -0,0 +1,108 @@
+import json
+
+import pytest
+from PIL import Image, ImageDraw
+
+from sci_vizio_retrieval import cascade
+from sci_vizio_retrieval.cascade import ModelCascade, empty_fields, image_complexity, parse_models
+from sci_vizio_retrieval.client import VisionResponse
+
+MODELS = ["cheap", "strong"]
+VALID = {"image_type": "chart", "title": "Sales", "description": "Bars per year"}
+
+
+@pytest.fixture
+def flat(tmp_path):
+    """A bar chart: a few large flat shapes."""
+    path = tmp_path / "flat.png"
+    image = Image.new("RGB", (400, 300), "white")
+    draw = ImageDraw.Draw(image)
+    for index, height in enumerate((100, 180, 240)):
+        draw.rectangle((40 + index * 120, 300 - height, 120 + index * 120, 300), fill="navy")
+    image.save(path)
+    return path
+
+
+@pytest.fixture
+def dense(tmp_path):
+    """Fine alternating lines, like a page of small text."""
+    path = tmp_path / "dense.png"
+    image = Image.new("L", (400, 300), 255)
+    draw = ImageDraw.Draw(image)
+    for y in range(0, 300, 2):
+        draw.line((0, y, 400, y), fill=0)
+    image.save(path)
+    return path
+
+
+def make_cascade(**kwargs):
+    kwargs.setdefault("max_pixels", 1_000_000)
+    kwargs.setdefault("max_edge_density", 0.15)
+    return ModelCascade(models=MODELS, **kwargs)
+
+
+def test_parse_models():
+    assert parse_models(" cheap, ,strong ") == MODELS
+    assert parse_models(["cheap", "", " strong"]) == MODELS
+    assert parse_models(None) == []
+
+
+def test_edge_density_separates_flat_and_dense_images(flat, dense):
+    assert image_complexity(flat) == (400 * 300, pytest.approx(0.0, abs=0.05))
+    assert image_complexity(dense)[1] >= 0.4
+
+
+def test_simple_images_start_at_the_first_model(flat):
+    assert make_cascade().start_tier(flat) == 0
+
+
+def test_dense_images_start_at_the_second_model(dense):
+    cascade_ = make_cascade()
+    assert cascade_.complexity_reason(dense).startswith("edge density")
+    assert cascade_.start_tier(dense) == 1
+    assert make_cascade(max_edge_density=0).start_tier(dense) == 0
+
+
+def test_large_images_start_at_the_second_model(flat):
+    cascade_ = make_cascade(max_pixels=400 * 300 - 1)
+    assert cascade_.complexity_reason(flat) == f"{400 * 300} pixels"
+    assert cascade_.start_tier(flat) == 1
+    assert make_cascade(max_pixels=0).start_tier(flat) == 0
+
+
+def test_single_model_and_unreadable_images_start_at_the_first_model(dense, tmp_path):
+    assert ModelCascade(models=["only"], max_edge_density=0.15).start_tier(dense) == 0
+    broken = tmp_path / "broken.png"
+    broken.write_bytes(b"not an image")
+    assert make_cascade().complexity_reason(broken) is None
+    assert make_cascade().start_tier(broken) == 0
+
+
+def test_escalation_reason():
+    assert ModelCascade.escalation_reason(json.dumps(VALID)) is None
+    assert ModelCascade.escalation_reason(json.dumps({**VALID, "title": " "})) == "Empty required fields: title"
+    assert ModelCascade.escalation_reason("no json") is not None
+    assert ModelCascade.escalation_reason(None) == "Empty response"
+    assert empty_fields({**VALID, "description": None}) == ["description"]
+
+
+def test_report_tallies_requests_and_outcomes(monkeypatch):
+    monkeypatch.setattr(cascade, 'model_pricing', lambda model: {'prompt': 0.001, 'completion': 0.002, 'request': 0.0})
+    cascade_ = make_cascade()
+    cascade_.record_request("cheap", VisionResponse(text="", latency=0.1, prompt_tokens=100, completion_tokens=10))
+    cascade_.record_request("cheap", VisionResponse(text="", latency=0.3, prompt_tokens=100, completion_tokens=30))
+    cascade_.record_outcome("cheap", "answered")
+    cascade_.record_outcome("cheap", "escalated")
+    cascade_.record_request("strong", VisionResponse(text=""))
+    cascade_.record_outcome("strong", "failed")
+
+    report = cascade_.report()
+    assert report["cheap"] == {
+        'requests': 2, 'answered': 1, 'escalated': 1, 'failed': 0, 'mean_latency_ms': 200.0,
+        'prompt_tokens': 200, 'completion_tokens': 40, 'cost_usd': 0.28,
+    }
+    assert report["strong"]["failed"] == 1
+    assert report["strong"]["mean_latency_ms"] is None
+
+    cascade_.reset()
+    assert cascade_.report() == {}
@@ -0,0 +1,173 @@
+import asyncio
+import json
+import logging
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from openai import APIStatusError
+from PIL import Image
+
+from sci_vizio_retrieval import client, ratelimit
+from sci_vizio_retrieval.client import (
+    AsyncOpenRouterVision,
+    JsonStreamScanner,
+    OpenRouterVision,
+    _read_stream,
+    _schema_rejected,
+)
+from sci_vizio_retrieval.ratelimit import RateLimiter
+
+
+ANALYSIS = {
+    "image_type": "chart",
+    "description": "Bars {grouped} by \"year\", see [Fig. 2]",
+    "path": "C:\\data\\",
+    "tags": [{"name": "a"}, {"name": "b]"}],
+}
+
+
+def scan(chunks):
+    scanner = JsonStreamScanner()
+    for chunk in chunks:
+        end = scanner.feed(chunk)
+        if end is not None:
+            return end
+    return None
+
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1000])
+def test_finds_end_across_chunk_sizes(size):
+    body = json.dumps(ANALYSIS)
+    text = "Here is the analysis:\n```json\n" + body + "\n```\nHope this helps {not json}"
+    end = scan(chunked(text, size))
+    assert end is not None
+    assert json.loads(text[text.index("{"):end]) == ANALYSIS
+
+
+def test_top_level_array():
+    text = '[{"a": 1}, {"b": "]"}] trailing'
+    assert text[:scan([text])] == '[{"a": 1}, {"b": "]"}]'
+
+
+def test_escaped_quote_split_across_chunks():
+    text = '{"a": "say \\"}\\" now"}'
+    # The backslash and the escaped quote arrive in different chunks
+    split = text.index('\\"') + 1
+    assert scan([text[:split], text[split:]]) == len(text)
+
+
+def test_quotes_in_leading_prose_are_ignored():
+    text = 'The model said "here": {"a": 1}'
+    assert text[:scan([text])].endswith('{"a": 1}')
+
+
+def test_incomplete_value():
+    assert scan(['{"a": {"b": 1}', ', "c": "}']) is None
+
+
+def test_read_stream_stops_at_end_of_json():
+    text = 'Sure! {"a": [1, 2]} and then the model keeps talking'
+    chunks = [
+        SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=part))])
+        for part in chunked(text, 4)
+    ]
+    consumed = []
+
+    class Stream:
+        closed = False
+
+        def __iter__(self):
+            for chunk in chunks:
+                consumed.append(chunk)
+                yield chunk
+
+        def close(self):
+            self.closed = True
+
+    stream = Stream()
+    content, ttfb = _read_stream(stream, 0.0)
+    assert content == 'Sure! {"a": [1, 2]}'
+    assert ttfb is not None
+    assert stream.closed
+    assert len(consumed) < len(chunks)
+
+
+@pytest.fixture
+def api_key(monkeypatch):
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test")
+
+
+def test_api_delay_is_mapped_to_a_rate_limit(api_key, tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(ratelimit, 'DB_PATH', str(tmp_path / "state.db"))
+    with caplog.at_level(logging.WARNING, logger=client.__name__):
+        vision = OpenRouterVision(model="test/model", api_delay=0.5)
+    try:
+        assert vision.rate_limiter.requests_per_second == 2.0
+        assert "deprecated" in caplog.text
+    finally:
+        vision.rate_limiter.close()
+
+
+def test_async_client_frees_its_slot_while_backing_off(api_key, tmp_path, monkeypatch):
+    image = tmp_path / "image.png"
+    Image.new("RGB", (8, 8)).save(image)
+    limiter = RateLimiter(db_path=str(tmp_path / "state.db"), requests_per_second=0, tokens_per_minute=0)
+    vision = AsyncOpenRouterVision(
+        model="test/model", max_retries=2, max_concurrency=1, rate_limiter=limiter,
+        upload_cache_dir=tmp_path / "uploads", stream=False,
+    )
+    monkeypatch.setattr(client, '_retry_delay', lambda limiter, error, attempt: 0.3)
+
+    finished = []
+    calls = {"first": 0}
+
+    async def create(messages, **kwargs):
+        prompt = messages[0]["content"][0]["text"]
+        if prompt == "first":
+            calls["first"] += 1
+            if calls["first"] == 1:
+                raise RuntimeError("temporary failure")
+        message = SimpleNamespace(content=prompt)
+        response = SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+        return SimpleNamespace(parse=lambda: response, headers={})
+
+    vision.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+        with_raw_response=SimpleNamespace(create=create)
+    )))
+
+    async def ask(prompt, delay):
+        await asyncio.sleep(delay)
+        finished.append((await vision.analyze_image(image, prompt)).text)
+
+    async def main():
+        await asyncio.gather(ask("first", 0), ask("second", 0.05))
+
+    try:
+        asyncio.run(main())
+    finally:
+        limiter.close()
+    # The second request ran while the first one waited to retry
+    assert finished == ["second", "first"]
+
+
+def status_error(status, message, body=None):
+    request = httpx.Request("POST", "https://openrouter.ai/api/v1/chat/completions")
+    return APIStatusError(message, response=httpx.Response(status, request=request), body=body)
+
+
+def test_schema_rejection_needs_a_schema_error():
+    assert _schema_rejected(status_error(400, "Error code: 400", {
+        "message": "Provider returned error",
+        "metadata": {"raw": "response_format json_schema is not supported by this model"},
+    }))
+    assert _schema_rejected(status_error(400, "This model does not support structured outputs"))
+
+    # Other bad requests leave the schema in place
+    assert not _schema_rejected(status_error(400, "Error code: 400", {"message": "Image exceeds 20 MB"}))
+    assert not _schema_rejected(status_error(500, "response_format failed"))
+    assert not _schema_rejected(ValueError("response_format"))
@@ -0,0 +1,132 @@
+import io
+import random
+
+import fitz
+import pytest
+from PIL import Image
+
+from sci_vizio_retrieval.extractor import PDFProcessor
+
+
+def noise_png(seed, size=(200, 160)):
+    rng = random.Random(seed)
+    image = Image.new('RGB', size)
+    image.putdata([(rng.randrange(256), rng.randrange(256), rng.randrange(256))
+                   for _ in range(size[0] * size[1])])
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def write_pdf(path, pages):
+    """Write a PDF with one page per list of image seeds."""
+    document = fitz.open()
+    for seeds in pages:
+        page = document.new_page()
+        page.insert_text((72, 60), f"Page with images {seeds}")
+        for index, seed in enumerate(seeds):
+            top = 100 + index * 200
+            page.insert_image(fitz.Rect(72, top, 272, top + 160), stream=noise_png(seed))
+    document.save(str(path))
+    document.close()
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    input_dir = tmp_path / "pdfs"
+    input_dir.mkdir()
+    return input_dir, tmp_path / "output", str(tmp_path / "state.db")
+
+
+@pytest.fixture
+def extractor(dirs):
+    input_dir, output_dir, db_path = dirs
+    return PDFProcessor(input_dir=input_dir, output_dir=output_dir, db_path=db_path, workers=1, figures=False)
+
+
+def test_modified_pdf_is_hashed_once(extractor, dirs, monkeypatch):
+    pdf = dirs[0] / "a.pdf"
+    write_pdf(pdf, [[1]])
+    extractor.process_paths([pdf])
+
+    write_pdf(pdf, [[2]])
+    calls = []
+    calculate_hash = extractor.calculate_hash
+    monkeypatch.setattr(extractor, 'calculate_hash', lambda path: calls.append(path) or calculate_hash(path))
+
+    stats = extractor.process_paths([pdf])
+    assert stats['modified_pdfs'] == 1
+    assert stats['processed_pdfs'] == 1
+    assert calls == [pdf]
+
+
+def test_unchanged_pdf_is_not_read(extractor, dirs, monkeypatch):
+    pdf = dirs[0] / "a.pdf"
+    write_pdf(pdf, [[1]])
+    extractor.process_paths([pdf])
+
+    monkeypatch.setattr(extractor, 'calculate_hash', lambda path: pytest.fail("unchanged PDF was hashed"))
+    assert extractor.process_paths([pdf])['skipped_pdfs'] == 1
+
+
+def image_files(output_dir, stem):
+    return sorted(p.name for p in (output_dir / "extracted_images" / stem).glob("*.png"))
+
+
+def test_modified_pdf_is_forgotten_with_its_derived_state(extractor, dirs):
+    input_dir, output_dir, _ = dirs
+    pdf = input_dir / "a.pdf"
+    write_pdf(pdf, [[1], [2, 3]])
+    extractor.process_paths([pdf])
+    assert image_files(output_dir, "a") == ["page1_img1.png", "page2_img1.png", "page2_img2.png"]
+
+    # Rows the vision, index and queue stages keep per PDF name
+    store = extractor.store
+    with store.transaction() as conn:
+        for table in ('image_processing', 'json_indexing', 'vision_jobs'):
+            conn.execute(f"CREATE TABLE {table} (id INTEGER PRIMARY KEY, pdf_file TEXT, image_path TEXT)")
+            conn.executemany(f"INSERT INTO {table} (pdf_file, image_path) VALUES (?, ?)",
+                             [("a", "page2_img2.png"), ("b", "page1_img1.png")])
+        conn.execute("CREATE TABLE embedding_matrix (id INTEGER PRIMARY KEY, row INTEGER, model TEXT)")
+        conn.executemany("INSERT INTO embedding_matrix (id, row, model) VALUES (?, ?, 'm')", [(1, 0), (2, 1)])
+
+    # The second image of page 2 is dropped, the first one changes
+    write_pdf(pdf, [[1], [4]])
+    stats = extractor.process_paths([pdf])
+    assert stats['modified_pdfs'] == 1
+
+    assert image_files(output_dir, "a") == ["page1_img1.png", "page2_img1.png"]
+    stored = dict(store.fetchall("SELECT image_path, content_hash FROM image_store"))
+    assert len(stored) == 2
+    current = dict(store.fetchall("SELECT image_path, content_hash FROM pdf_image_refs"))
+    assert current == stored
+
+    for table in ('image_processing', 'json_indexing', 'vision_jobs'):
+        assert store.fetchall(f"SELECT pdf_file FROM {table}") == [("b",)]
+    assert store.fetchall("SELECT id FROM embedding_matrix") == [(2,)]
+    assert [row[0] for row in store.fetchall("SELECT pdf_file FROM index_removals")] == ["a"]
+
+
+def test_forget_keeps_images_other_pdfs_refer_to(extractor, dirs):
+    input_dir, output_dir, _ = dirs
+    first, second = input_dir / "a.pdf", input_dir / "b.pdf"
+    write_pdf(first, [[1, 2]])
+    write_pdf(second, [[2]])
+    extractor.process_paths([first, second])
+    shared = extractor.lookup_stored_image(
+        extractor.store.fetchone("SELECT content_hash FROM pdf_image_refs WHERE pdf_path = ?", (str(second),))[0]
+    )
+    assert shared == "extracted_images/a/page1_img2.png"
+
+    # a.pdf now has a different image where the shared one was
+    write_pdf(first, [[3, 4]])
+    extractor.process_paths([first])
+
+    assert (output_dir / shared).exists()
+    assert extractor.lookup_stored_image(
+        extractor.store.fetchone("SELECT content_hash FROM pdf_image_refs WHERE pdf_path = ?", (str(second),))[0]
+    ) == shared
+    # The new image that would reuse the shared file's name is written beside it
+    names = image_files(output_dir, "a")
+    assert "page1_img1.png" in names and "page1_img2.png" in names
+    assert any(name.startswith("page1_img2_") for name in names)
@@ -0,0 +1,219 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from sci_vizio_retrieval import jobqueue
+from sci_vizio_retrieval.jobqueue import JobQueue
+from sci_vizio_retrieval.store import StateStore
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "state.db")
+
+
+@pytest.fixture
+def queues(db_path):
+    opened = []
+
+    def make(**kwargs):
+        kwargs.setdefault('lease_seconds', 60.0)
+        kwargs.setdefault('max_attempts', 3)
+        queue = JobQueue(db_path=db_path, **kwargs)
+        opened.append(queue)
+        return queue
+
+    yield make
+    for queue in opened:
+        queue.close()
+
+
+def items(count):
+    return [(f"/images/paper/img{i}.png", "paper") for i in range(count)]
+
+
+def expire_leases(db_path):
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute("UPDATE vision_jobs SET lease_expires = 0 WHERE status = 'leased'")
+    conn.close()
+
+
+def test_enqueue_is_idempotent(queues):
+    queue = queues()
+    assert queue.enqueue(items(3)) == 3
+    assert queue.enqueue(items(4)) == 1
+    assert queue.counts() == {'pending': 4}
+
+
+def test_workers_never_claim_the_same_job(queues):
+    first, second = queues(worker_id="first"), queues(worker_id="second")
+    first.enqueue(items(5))
+    a = first.claim(3)
+    b = second.claim(3)
+    assert [job.id for job in a] == [1, 2, 3]
+    assert [job.id for job in b] == [4, 5]
+    assert all(job.attempts == 1 for job in a + b)
+    assert second.claim(3) == []
+
+
+def test_concurrent_claims_hand_out_each_job_once(queues):
+    workers = [queues(worker_id=f"w{i}") for i in range(4)]
+    workers[0].enqueue(items(40))
+    claimed = [[] for _ in workers]
+
+    def work(index):
+        while True:
+            jobs = workers[index].claim(3)
+            if not jobs:
+                return
+            claimed[index].extend(job.id for job in jobs)
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(len(workers))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    ids = [job_id for ids in claimed for job_id in ids]
+    assert sorted(ids) == list(range(1, 41))
+
+
+def test_expired_lease_is_reclaimed(queues, db_path):
+    crashed, survivor = queues(worker_id="crashed"), queues(worker_id="survivor")
+    crashed.enqueue(items(1))
+    crashed.claim(1)
+    assert survivor.claim(1) == []
+
+    expire_leases(db_path)
+    assert survivor.counts() == {'expired': 1}
+    jobs = survivor.claim(1)
+    assert [(job.id, job.attempts) for job in jobs] == [(1, 2)]
+
+    # The crashed worker no longer owns the job
+    crashed.ack([1])
+    assert survivor.counts() == {'leased': 1}
+    survivor.ack([1])
+    assert survivor.counts() == {'done': 1}
+
+
+def test_heartbeat_keeps_the_lease(queues):
+    queue = queues(lease_seconds=0.2)
+    other = queues(worker_id="other")
+    queue.enqueue(items(1))
+    queue.claim(1)
+    time.sleep(0.1)
+    assert queue.heartbeat([1]) == 1
+    time.sleep(0.15)
+    assert other.claim(1) == []
+    assert other.heartbeat([1]) == 0
+
+
+def test_job_fails_after_max_attempts(queues, db_path):
+    queue = queues(max_attempts=2)
+    queue.enqueue(items(2))
+
+    queue.claim(1)
+    queue.fail([1], "boom")
+    assert queue.claim(1)[0].attempts == 2
+    queue.fail([1], "boom again")
+
+    # Job 2 runs out of attempts by expiring leases
+    queue.claim(1)
+    expire_leases(db_path)
+    queue.claim(1)
+    expire_leases(db_path)
+    assert queue.claim(1) == []
+    assert queue.counts() == {'failed': 2}
+
+
+def test_release_does_not_count_the_attempt(queues):
+    queue = queues()
+    queue.enqueue(items(1))
+    queue.claim(1)
+    queue.release([1])
+    assert queue.counts() == {'pending': 1}
+    assert queue.claim(1)[0].attempts == 1
+
+
+def test_claim_retries_while_the_database_is_locked(db_path, monkeypatch, queues):
+    monkeypatch.setattr(jobqueue, '_BUSY_TIMEOUT', 0.05)
+    monkeypatch.setattr(jobqueue, '_LOCK_BACKOFF', 0.05)
+    queue = queues()
+    queue.enqueue(items(1))
+
+    blocker = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+    blocker.execute("BEGIN IMMEDIATE")
+    release = threading.Timer(0.3, lambda: blocker.execute("COMMIT"))
+    release.start()
+    try:
+        assert [job.id for job in queue.claim(1)] == [1]
+    finally:
+        release.join()
+        blocker.close()
+
+
+def test_claim_gives_up_eventually(db_path, monkeypatch, queues):
+    monkeypatch.setattr(jobqueue, '_BUSY_TIMEOUT', 0.01)
+    monkeypatch.setattr(jobqueue, '_LOCK_RETRIES', 2)
+    monkeypatch.setattr(jobqueue, '_LOCK_BACKOFF', 0.01)
+    queue = queues()
+
+    blocker = sqlite3.connect(db_path, isolation_level=None)
+    blocker.execute("BEGIN IMMEDIATE")
+    try:
+        with pytest.raises(sqlite3.OperationalError):
+            queue.claim(1)
+        assert not queue.conn.in_transaction
+    finally:
+        blocker.execute("ROLLBACK")
+        blocker.close()
+
+
+def test_queue_and_committing_store_share_a_database(db_path, monkeypatch, queues):
+    monkeypatch.setattr(jobqueue, '_BUSY_TIMEOUT', 0.05)
+    monkeypatch.setattr(jobqueue, '_LOCK_RETRIES', 0)
+    store = StateStore(db_path=db_path, batch_size=32)
+    store.init_schema("CREATE TABLE results (job INTEGER)")
+    queue = queues()
+    try:
+        queue.enqueue(items(2))
+        with store.committing():
+            for job in queue.claim(2):
+                store.write("INSERT INTO results (job) VALUES (?)", (job.id,))
+                queue.heartbeat([job.id])
+                queue.ack([job.id])
+        assert queue.counts() == {'done': 2}
+
+        # A pending batch blocks the queue, which is why workers commit per result
+        queue.enqueue(items(3))
+        store.write("INSERT INTO results (job) VALUES (?)", (3,))
+        with pytest.raises(sqlite3.OperationalError):
+            queue.claim(1)
+    finally:
+        store.close()
+
+
+def test_lease_expiring_while_committing_is_not_acked_twice(db_path, queues):
+    slow, other = queues(worker_id="slow"), queues(worker_id="other")
+    store = StateStore(db_path=db_path, batch_size=32)
+    store.init_schema("CREATE TABLE results (job INTEGER)")
+    try:
+        slow.enqueue(items(1))
+        with store.committing():
+            jobs = slow.claim(1)
+            store.write("INSERT INTO results (job) VALUES (?)", (jobs[0].id,))
+
+            # The lease runs out before the slow worker acknowledges, and the job is taken over
+            expire_leases(db_path)
+            assert [job.id for job in other.claim(1)] == [1]
+            store.write("INSERT INTO results (job) VALUES (?)", (1,))
+            assert other.ack([1]) == 1
+
+            assert slow.ack([1]) == 0
+            assert slow.fail([1], "late") == 0
+        assert other.counts() == {'done': 1}
+        assert other.ack([1]) == 0
+    finally:
+        store.close()
@@ -0,0 +1,74 @@
+import random
+
+import pytest
+from PIL import Image, ImageDraw
+
+from sci_vizio_retrieval.phash import (
+    DETAIL_HASH_SIZE,
+    BKTree,
+    dhash,
+    from_db,
+    hamming,
+    image_signature,
+    to_db,
+)
+
+
+def gradient(width, height):
+    image = Image.new('L', (width, height))
+    image.putdata([(x * 255 // width + y * 64 // height) % 256 for y in range(height) for x in range(width)])
+    return image
+
+
+def test_hamming():
+    assert hamming(0, 0) == 0
+    assert hamming(0b1011, 0b0001) == 2
+    assert hamming(0, (1 << 64) - 1) == 64
+
+
+@pytest.mark.parametrize("value", [0, 1, (1 << 63) - 1, 1 << 63, (1 << 64) - 1])
+def test_db_round_trip(value):
+    stored = to_db(value)
+    assert -(1 << 63) <= stored < (1 << 63)
+    assert from_db(stored) == value
+
+
+def test_bktree_matches_brute_force():
+    rng = random.Random(7)
+    base = [rng.getrandbits(64) for _ in range(20)]
+    # Clusters of nearby hashes around each base value, plus exact repeats
+    values = [b ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64)) for b in base for _ in range(10)]
+    values += base[:5]
+    tree = BKTree.from_pairs((value, index) for index, value in enumerate(values))
+    assert len(tree) == len(values)
+
+    for query in base + [rng.getrandbits(64) for _ in range(10)]:
+        for radius in (0, 2, 4, 10):
+            expected = sorted(
+                (hamming(query, value), index) for index, value in enumerate(values)
+                if hamming(query, value) <= radius
+            )
+            found = tree.search(query, radius)
+            assert sorted(found) == expected
+            assert [d for d, _ in found] == sorted(d for d, _ in found)
+
+
+def test_empty_bktree():
+    assert BKTree().search(123, 64) == []
+
+
+def test_dhash_survives_rescaling():
+    image = gradient(400, 300)
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((50, 50, 150, 250), fill=255)
+    rescaled = image.resize((200, 150))
+    assert hamming(dhash(image), dhash(rescaled)) <= 4
+    assert dhash(image, DETAIL_HASH_SIZE).bit_length() <= DETAIL_HASH_SIZE ** 2
+
+
+def test_image_signature_keeps_original_size(tmp_path):
+    path = tmp_path / "figure.jpg"
+    gradient(640, 480).convert('RGB').save(path)
+    width, height, detail = image_signature(path)
+    assert (width, height) == (640, 480)
+    assert detail == image_signature(path)[2]
@@ -0,0 +1,88 @@
+import json
+
+import pytest
+from PIL import Image
+
+from sci_vizio_retrieval import cascade
+from sci_vizio_retrieval.client import VisionResponse
+from sci_vizio_retrieval.config import VISION_UPLOAD_CACHE_SUBDIR
+from sci_vizio_retrieval.processor import ImageProcessor, ImageProcessorRetry
+
+VALID = {"image_type": "chart", "title": "Sales", "description": "Bars per year"}
+
+
+@pytest.fixture
+def dirs(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test")
+    output_dir = tmp_path / "output"
+    return dict(images_dir=output_dir / "images", output_dir=output_dir / "analysis",
+                db_path=str(tmp_path / "state.db"))
+
+
+def test_uploads_are_cached_under_the_processor_output(dirs):
+    processor = ImageProcessor(model="test/cheap", cascade=["test/cheap", "test/strong"], **dirs)
+    assert processor.upload_cache_dir == dirs['output_dir'].parent / VISION_UPLOAD_CACHE_SUBDIR
+    assert [api.upload_cache_dir for api in processor.vision_apis] == [processor.upload_cache_dir] * 2
+    assert ImageProcessorRetry(**dirs).vision_api.upload_cache_dir == processor.upload_cache_dir
+
+
+@pytest.fixture
+def cascaded(dirs, monkeypatch):
+    """A two-model processor whose models answer from `answers`, a list per model."""
+    monkeypatch.setattr(cascade, 'model_pricing', lambda model: None)
+    processor = ImageProcessor(cascade=["cheap", "strong"], concurrency=1, embeddings=False, batch_size=1,
+                               stream=False, **dirs)
+    processor.validation_retries = 0
+    processor.near_duplicates_enabled = False
+    processor.cascade.max_pixels = processor.cascade.max_edge_density = 0
+    processor.cache.enabled = False
+    answers = {"cheap": [], "strong": []}
+
+    for api in processor.vision_apis:
+        def analyze_image(image_path, prompt, schema, model=api.model):
+            answer = answers[model].pop(0)
+            if isinstance(answer, Exception):
+                raise answer
+            return VisionResponse(text=answer)
+        monkeypatch.setattr(api, 'analyze_image', analyze_image)
+
+    image = dirs['images_dir'] / "paper" / "page1_img1.png"
+    image.parent.mkdir(parents=True)
+    Image.new("RGB", (64, 48), "white").save(image)
+    return processor, answers, image
+
+
+def outcomes(report):
+    return {model: (entry['requests'], entry['answered'], entry['escalated'], entry['failed'])
+            for model, entry in report.items()}
+
+
+def test_incomplete_answer_is_escalated(cascaded):
+    processor, answers, image = cascaded
+    answers["cheap"].append(json.dumps({**VALID, "title": ""}))
+    answers["strong"].append(json.dumps(VALID))
+
+    result = processor.process_image(image, "paper")
+    assert result['success_status'] and result['model'] == "strong"
+    assert outcomes(processor.cascade.report()) == {"cheap": (1, 0, 1, 0), "strong": (1, 1, 0, 0)}
+
+
+def test_failed_top_model_falls_back_to_a_valid_answer(cascaded):
+    processor, answers, image = cascaded
+    answers["cheap"].append(json.dumps({**VALID, "title": ""}))
+    answers["strong"].append(RuntimeError("provider down"))
+
+    result = processor.process_image(image, "paper")
+    assert result['success_status'] and result['model'] == "cheap"
+    # The strong model is charged with the failure, the cheap one with the kept answer
+    assert outcomes(processor.cascade.report()) == {"cheap": (1, 1, 1, 0), "strong": (0, 0, 0, 1)}
+
+
+def test_image_fails_when_no_model_answers(cascaded):
+    processor, answers, image = cascaded
+    answers["cheap"].append("no json at all")
+    answers["strong"].append("still no json")
+
+    result = processor.process_image(image, "paper")
+    assert not result['success_status'] and result['model'] == "strong"
+    assert outcomes(processor.cascade.report()) == {"cheap": (1, 0, 1, 0), "strong": (1, 0, 0, 1)}
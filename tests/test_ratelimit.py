@@ -0,0 +1,119 @@
+import time
+from pathlib import Path
+
+import pytest
+
+from sci_vizio_retrieval.ratelimit import RateLimiter, limiter_db_path, parse_retry_after
+from sci_vizio_retrieval.store import StateStore
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "state.db")
+
+
+def make_limiter(db_path, requests_per_second=2.0, tokens_per_minute=0):
+    return RateLimiter(db_path=db_path, requests_per_second=requests_per_second,
+                       tokens_per_minute=tokens_per_minute)
+
+
+def test_state_lives_next_to_the_database(db_path):
+    limiter = make_limiter(db_path)
+    try:
+        assert limiter.db_path == limiter_db_path(db_path)
+        assert Path(limiter.db_path).name == "state_ratelimit.db"
+        assert Path(limiter.db_path).parent == Path(db_path).parent
+    finally:
+        limiter.close()
+
+
+def test_burst_then_paced(db_path):
+    limiter = make_limiter(db_path, requests_per_second=2.0)
+    try:
+        assert limiter.reserve() == 0.0
+        assert limiter.reserve() == 0.0
+        # The bucket is empty: the third request waits for half a second of refill
+        assert limiter.reserve() == pytest.approx(0.5, abs=0.05)
+    finally:
+        limiter.close()
+
+
+def test_token_budget(db_path):
+    limiter = make_limiter(db_path, requests_per_second=0, tokens_per_minute=600)
+    try:
+        assert limiter.reserve(600) == 0.0
+        # 10 tokens per second refill
+        assert limiter.reserve(50) == pytest.approx(5.0, abs=0.05)
+        # Actual usage below the estimate gives the difference back
+        limiter.record_usage(estimated=50, actual=0)
+        assert limiter.reserve(50) == pytest.approx(5.0, abs=0.05)
+    finally:
+        limiter.close()
+
+
+def test_limiters_share_a_budget(db_path):
+    first, second = make_limiter(db_path), make_limiter(db_path)
+    try:
+        first.reserve()
+        first.reserve()
+        assert second.reserve() > 0.4
+    finally:
+        first.close()
+        second.close()
+
+
+def test_rate_limited_halves_the_rate(db_path):
+    limiter = make_limiter(db_path, requests_per_second=2.0)
+    try:
+        assert limiter.record_rate_limited() == pytest.approx(1.0, abs=0.05)
+        wait = limiter.reserve()
+        assert wait == pytest.approx(1.0, abs=0.05)
+        # A hint from the provider overrides the default pause
+        assert limiter.record_rate_limited({'Retry-After': '7'}) == pytest.approx(7.0, abs=0.05)
+    finally:
+        limiter.close()
+
+
+def test_disabled_limiter_never_waits(db_path):
+    limiter = make_limiter(db_path, requests_per_second=0, tokens_per_minute=0)
+    try:
+        assert all(limiter.reserve(10 ** 6) == 0.0 for _ in range(10))
+    finally:
+        limiter.close()
+
+
+@pytest.mark.parametrize("headers, expected", [
+    (None, None),
+    ({'Retry-After': '3'}, 3.0),
+    ({'retry-after': '-1'}, 0.0),
+    ({'X-RateLimit-Remaining': '5', 'X-RateLimit-Reset': '10'}, None),
+    ({'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '4s'}, 4.0),
+])
+def test_parse_retry_after(headers, expected):
+    result = parse_retry_after(headers)
+    if expected is None:
+        assert result is None
+    else:
+        assert result == pytest.approx(expected, abs=0.01)
+
+
+def test_parse_retry_after_epoch_reset():
+    reset = (time.time() + 30) * 1000
+    headers = {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': str(int(reset))}
+    assert parse_retry_after(headers) == pytest.approx(30.0, abs=1.0)
+
+
+def test_limiter_does_not_wait_for_pending_store_batch(db_path):
+    store = StateStore(db_path=db_path, batch_size=32)
+    store.init_schema("CREATE TABLE items (id INTEGER PRIMARY KEY)")
+    limiter = make_limiter(db_path, requests_per_second=100.0)
+    try:
+        # The batch keeps the database's write lock until it is committed
+        store.write("INSERT INTO items DEFAULT VALUES")
+        start = time.monotonic()
+        limiter.reserve()
+        limiter.record_success()
+        assert time.monotonic() - start < 1.0
+    finally:
+        limiter.close()
+        store.close()
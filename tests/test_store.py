@@ -0,0 +1,96 @@
+import sqlite3
+
+import pytest
+
+from sci_vizio_retrieval.store import StateStore
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "state.db")
+
+
+@pytest.fixture
+def store(db_path):
+    store = StateStore(db_path=db_path, batch_size=3)
+    store.init_schema("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)")
+    yield store
+    store.close()
+
+
+def committed_count(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_writes_are_committed_in_batches(store, db_path):
+    store.write("INSERT INTO items (name) VALUES (?)", ("a",))
+    store.write("INSERT INTO items (name) VALUES (?)", ("b",))
+    # Visible to the store itself, not yet to other connections
+    assert store.fetchone("SELECT COUNT(*) FROM items")[0] == 2
+    assert committed_count(db_path) == 0
+
+    store.write("INSERT INTO items (name) VALUES (?)", ("c",))
+    assert committed_count(db_path) == 3
+
+
+def test_flush_commits_pending_writes(store, db_path):
+    store.write("INSERT INTO items (name) VALUES (?)", ("a",))
+    store.flush()
+    assert committed_count(db_path) == 1
+
+
+def test_failed_entry_rolls_back_only_itself(store, db_path):
+    store.write("INSERT INTO items (name) VALUES (?)", ("kept",))
+    with pytest.raises(RuntimeError):
+        with store.batch() as conn:
+            conn.execute("INSERT INTO items (name) VALUES (?)", ("dropped",))
+            raise RuntimeError("boom")
+    store.flush()
+    assert store.fetchall("SELECT name FROM items") == [("kept",)]
+    assert committed_count(db_path) == 1
+
+
+def test_nested_entries_count_once(store, db_path):
+    with store.batch() as conn:
+        conn.execute("INSERT INTO items (name) VALUES (?)", ("a",))
+        store.write("INSERT INTO items (name) VALUES (?)", ("b",))
+        store.write("INSERT INTO items (name) VALUES (?)", ("c",))
+    assert committed_count(db_path) == 0
+
+
+def test_transaction_commits_on_exit(store, db_path):
+    store.write("INSERT INTO items (name) VALUES (?)", ("pending",))
+    with store.transaction() as conn:
+        conn.execute("INSERT INTO items (name) VALUES (?)", ("now",))
+    assert committed_count(db_path) == 2
+
+
+def test_committing_commits_each_entry(store, db_path):
+    store.write("INSERT INTO items (name) VALUES (?)", ("pending",))
+    with store.committing():
+        # Pending writes are committed on entry
+        assert committed_count(db_path) == 1
+        store.write("INSERT INTO items (name) VALUES (?)", ("a",))
+        assert committed_count(db_path) == 2
+    store.write("INSERT INTO items (name) VALUES (?)", ("b",))
+    assert committed_count(db_path) == 2
+
+
+def test_pending_batch_blocks_other_writers(store, db_path):
+    other = sqlite3.connect(db_path, timeout=0.1, isolation_level=None)
+    try:
+        store.write("INSERT INTO items (name) VALUES (?)", ("a",))
+        with pytest.raises(sqlite3.OperationalError):
+            other.execute("INSERT INTO items (name) VALUES ('other')")
+
+        with store.committing():
+            store.write("INSERT INTO items (name) VALUES (?)", ("b",))
+            other.execute("INSERT INTO items (name) VALUES ('other')")
+            store.write("INSERT INTO items (name) VALUES (?)", ("c",))
+    finally:
+        other.close()
+    assert committed_count(db_path) == 4
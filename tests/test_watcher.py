@@ -0,0 +1,114 @@
+import hashlib
+import json
+
+import pytest
+
+from sci_vizio_retrieval.client import VisionResponse
+from sci_vizio_retrieval.indexer import ImageAnalysisIndexer
+from sci_vizio_retrieval.processor import ImageProcessor
+from sci_vizio_retrieval.store import get_store
+from sci_vizio_retrieval.watcher import FolderWatcher
+
+from test_extractor import write_pdf
+
+
+class FakeCollection:
+    """Keeps entries by id; like ChromaDB, adding an existing id changes nothing."""
+
+    def __init__(self):
+        self.entries = {}
+
+    def add(self, ids, metadatas, documents=None, images=None):
+        for index, entry_id in enumerate(ids):
+            if entry_id not in self.entries:
+                document = documents[index] if documents else None
+                self.entries[entry_id] = (metadatas[index], document)
+
+    def delete(self, where):
+        for entry_id in [i for i, entry in self.entries.items() if entry[0]["pdf_file"] == where["pdf_file"]]:
+            del self.entries[entry_id]
+
+
+def describe(image_path):
+    return hashlib.sha256(image_path.read_bytes()).hexdigest()
+
+
+@pytest.fixture
+def watcher(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test")
+    output_dir = tmp_path / "output"
+    db_path = str(tmp_path / "state.db")
+    watcher = FolderWatcher(
+        input_dir=tmp_path / "pdfs", output_dir=output_dir, db_path=db_path,
+        workers=1, figures=False, debounce=0,
+    )
+
+    processor = ImageProcessor(
+        model="test/model", images_dir=watcher.extractor.images_dir, output_dir=output_dir / "analysis",
+        db_path=db_path, concurrency=1, embeddings=False, batch_size=1, stream=False, cascade=[],
+    )
+    processor.near_duplicates_enabled = False
+
+    def analyze_image(image_path, prompt, schema):
+        analysis = {"image_type": "chart", "title": "Figure", "description": describe(image_path)}
+        return VisionResponse(text=json.dumps(analysis))
+
+    monkeypatch.setattr(processor.vision_apis[0], 'analyze_image', analyze_image)
+
+    # The indexer without its ChromaDB client and embedding model
+    indexer = ImageAnalysisIndexer.__new__(ImageAnalysisIndexer)
+    indexer.store = get_store(db_path)
+    indexer.doc_collection, indexer.image_collection = FakeCollection(), FakeCollection()
+    indexer._init_database()
+
+    watcher._processor, watcher._indexer = processor, indexer
+    yield watcher
+    if watcher._inotify is not None:
+        watcher._inotify.close()
+
+
+def test_modified_pdf_is_reanalyzed_and_reindexed(watcher):
+    pdf = watcher.input_dir / "a.pdf"
+    write_pdf(pdf, [[1], [2, 3]])
+    watcher.run_once()
+    store, documents = watcher.extractor.store, watcher.indexer.doc_collection.entries
+    assert sorted(documents) == ["a_page1_img1", "a_page2_img1", "a_page2_img2"]
+
+    # The second image of page 2 is dropped, the first one changes
+    write_pdf(pdf, [[1], [4]])
+    stats = watcher.run_once()
+    assert stats['extract']['modified_pdfs'] == 1
+    assert stats['index']['removed_pdfs'] == 1
+
+    images = {path.stem: path for path in (watcher.extractor.images_dir / "a").glob("*.png")}
+    assert sorted(images) == ["page1_img1", "page2_img1"]
+    rows = store.fetchall("SELECT image, analysis FROM image_processing WHERE pdf_file = 'a'")
+    assert {image: json.loads(analysis)["description"] for image, analysis in rows} == {
+        f"{stem}.png": describe(path) for stem, path in images.items()
+    }
+    assert sorted(documents) == ["a_page1_img1", "a_page2_img1"]
+    for stem, path in images.items():
+        assert json.loads(documents[f"a_{stem}"][1])["description"] == describe(path)
+    assert sorted(watcher.indexer.image_collection.entries) == ["a_page1_img1", "a_page2_img1"]
+
+
+def test_catch_up_only_processes_unfinished_pdfs(watcher, monkeypatch):
+    write_pdf(watcher.input_dir / "a.pdf", [[1]])
+    write_pdf(watcher.input_dir / "b.pdf", [[2]])
+    watcher.extractor.process_paths(sorted(watcher.input_dir.glob("*.pdf")))
+    watcher.processor.process_directory(pdf_names=["a"])
+    assert watcher.processor.unfinished_pdf_names() == ["b"]
+
+    calls = []
+    process_directory = watcher.processor.process_directory
+    monkeypatch.setattr(
+        watcher.processor, 'process_directory',
+        lambda pdf_names=None: calls.append(pdf_names) or process_directory(pdf_names=pdf_names)
+    )
+    watcher.catch_up()
+    assert calls == [["b"]]
+    assert sorted(watcher.indexer.doc_collection.entries) == ["a_page1_img1", "b_page1_img1"]
+
+    # Nothing is left to process on the next start
+    watcher.catch_up()
+    assert calls == [["b"]]